@@ -0,0 +1,41 @@
+"""add pg_trgm indexes for name search
+
+Revision ID: 02_add_trgm_indexes
+Revises: 01_add_postgis
+Create Date: 2026-10-18 10:00:00.000000
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic
+revision = '02_add_trgm_indexes'
+down_revision = '01_add_postgis'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Индексы объявлены и в моделях, поэтому могли появиться раньше из
+    # create_all
+    op.create_index(
+        'ix_organizations_name_trgm',
+        'organizations',
+        ['name'],
+        postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'},
+        if_not_exists=True,
+    )
+    op.create_index(
+        'ix_activities_name_trgm',
+        'activities',
+        ['name'],
+        postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'},
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_activities_name_trgm', table_name='activities')
+    op.drop_index('ix_organizations_name_trgm', table_name='organizations')
@@ -0,0 +1,36 @@
+"""add lookup indexes for bulk import upserts
+
+Revision ID: 03_add_import_lookup_indexes
+Revises: 02_add_trgm_indexes
+Create Date: 2026-10-18 11:00:00.000000
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic
+revision = '03_add_import_lookup_indexes'
+down_revision = '02_add_trgm_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Импорт сопоставляет здания по адресу (и координатам),
+    # организации - по зданию и названию. ix_organizations_building_id_name
+    # объявлен и в модели, поэтому мог появиться раньше из create_all
+    op.create_index(
+        'ix_buildings_address', 'buildings', ['address'], if_not_exists=True
+    )
+    op.create_index(
+        'ix_organizations_building_id_name',
+        'organizations',
+        ['building_id', 'name'],
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'ix_organizations_building_id_name', table_name='organizations'
+    )
+    op.drop_index('ix_buildings_address', table_name='buildings')
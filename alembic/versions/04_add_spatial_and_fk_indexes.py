@@ -0,0 +1,62 @@
+"""add spatial and foreign key indexes
+
+Revision ID: 04_add_spatial_and_fk_indexes
+Revises: 03_add_import_lookup_indexes
+Create Date: 2026-10-18 12:00:00.000000
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic
+revision = '04_add_spatial_and_fk_indexes'
+down_revision = '03_add_import_lookup_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Индексы могли появиться раньше из create_all при запуске приложения.
+    # location добавлена миграцией 01 без GiST-индекса; имя - как у
+    # индекса, который создаёт GeoAlchemy2
+    op.create_index(
+        'idx_buildings_location',
+        'buildings',
+        ['location'],
+        postgresql_using='gist',
+        if_not_exists=True,
+    )
+    # Радиус и ближайшие здания считаются по geography(location)
+    op.create_index(
+        'ix_buildings_location_geography',
+        'buildings',
+        [sa.text('geography(location)')],
+        postgresql_using='gist',
+        if_not_exists=True,
+    )
+    # organizations.building_id покрыт ix_organizations_building_id_name,
+    # organization_activity.organization_id - первичным ключом
+    op.create_index(
+        'ix_activities_parent_id',
+        'activities',
+        ['parent_id'],
+        if_not_exists=True,
+    )
+    op.create_index(
+        'ix_organization_activity_activity_id',
+        'organization_activity',
+        ['activity_id'],
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'ix_organization_activity_activity_id',
+        table_name='organization_activity',
+    )
+    op.drop_index('ix_activities_parent_id', table_name='activities')
+    op.drop_index('ix_buildings_location_geography', table_name='buildings')
+    # idx_buildings_location остаётся: в базе из create_all он был и до
+    # этой миграции
@@ -0,0 +1,93 @@
+"""add unique natural keys for bulk import upserts
+
+Revision ID: 05_add_import_natural_keys
+Revises: 04_add_spatial_and_fk_indexes
+Create Date: 2026-10-18 13:00:00.000000
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic
+revision = '05_add_import_natural_keys'
+down_revision = '04_add_spatial_and_fk_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Дубли, которые успели создать импорты без уникальности, сливаются в
+    # запись с наименьшим id: организации и связи переносятся на неё
+    op.execute(
+        "CREATE TEMP TABLE building_duplicates ON COMMIT DROP AS "
+        "SELECT id, min(id) OVER (PARTITION BY address, location) AS keep "
+        "FROM buildings"
+    )
+    op.execute(
+        "UPDATE organizations o SET building_id = d.keep "
+        "FROM building_duplicates d "
+        "WHERE o.building_id = d.id AND d.id <> d.keep"
+    )
+    op.execute(
+        "DELETE FROM buildings b USING building_duplicates d "
+        "WHERE b.id = d.id AND d.id <> d.keep"
+    )
+    op.execute(
+        "CREATE TEMP TABLE organization_duplicates ON COMMIT DROP AS "
+        "SELECT id, min(id) OVER (PARTITION BY building_id, name) AS keep "
+        "FROM organizations WHERE building_id IS NOT NULL"
+    )
+    op.execute(
+        "INSERT INTO organization_activity (organization_id, activity_id) "
+        "SELECT d.keep, l.activity_id "
+        "FROM organization_activity l JOIN organization_duplicates d"
+        " ON l.organization_id = d.id AND d.id <> d.keep "
+        "ON CONFLICT DO NOTHING"
+    )
+    op.execute(
+        "DELETE FROM organization_activity l USING organization_duplicates d "
+        "WHERE l.organization_id = d.id AND d.id <> d.keep"
+    )
+    op.execute(
+        "DELETE FROM organizations o USING organization_duplicates d "
+        "WHERE o.id = d.id AND d.id <> d.keep"
+    )
+
+    # Ключи INSERT ... ON CONFLICT импорта. Уникальный индекс по
+    # (address, location) заменяет ix_buildings_address, по
+    # (building_id, name) - ix_organizations_building_id_name
+    op.create_index(
+        'uq_buildings_address_location',
+        'buildings',
+        ['address', 'location'],
+        unique=True,
+        if_not_exists=True,
+    )
+    op.drop_index(
+        'ix_buildings_address', table_name='buildings', if_exists=True
+    )
+    op.create_index(
+        'uq_organizations_building_id_name',
+        'organizations',
+        ['building_id', 'name'],
+        unique=True,
+        if_not_exists=True,
+    )
+    op.drop_index(
+        'ix_organizations_building_id_name',
+        table_name='organizations',
+        if_exists=True,
+    )
+
+
+def downgrade():
+    # Слитые дубли не восстанавливаются
+    op.create_index(
+        'ix_organizations_building_id_name',
+        'organizations',
+        ['building_id', 'name'],
+    )
+    op.drop_index(
+        'uq_organizations_building_id_name', table_name='organizations'
+    )
+    op.create_index('ix_buildings_address', 'buildings', ['address'])
+    op.drop_index('uq_buildings_address_location', table_name='buildings')
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+
+
+class ActivityTree:
+    """
+    Дерево видов деятельности в памяти процесса.
+
+    Загружается одним запросом и сбрасывается при создании вида
+    деятельности в этом процессе; изменения из других процессов
+    подхватываются по истечении ttl секунд.
+    """
+
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Названия (casefold) по возрастанию id: первое совпадение - с
+        # наименьшим id
+        self._names: List[Tuple[int, str]] = []
+        self._by_name: Dict[str, int] = {}
+        self._children: Dict[int, List[int]] = {}
+        self._descendants: Dict[tuple, frozenset] = {}
+        # Номер сборки: потомки, посчитанные по старому дереву, не
+        # попадают в кэш после build()
+        self._generation = 0
+        self._loaded_at: Optional[float] = None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+
+    def load(self, db: Session) -> None:
+        self.build(
+            db.query(
+                models.Activity.id,
+                models.Activity.name,
+                models.Activity.parent_id,
+            ).all()
+        )
+
+    def build(self, rows: Iterable[Tuple[int, str, Optional[int]]]) -> None:
+        """Дерево из строк (id, name, parent_id)"""
+        names = []
+        children = defaultdict(list)
+        for activity_id, name, parent_id in rows:
+            names.append((activity_id, name.casefold()))
+            if parent_id is not None:
+                children[parent_id].append(activity_id)
+        names.sort()
+        by_name = {}
+        for activity_id, name in names:
+            by_name.setdefault(name, activity_id)
+        with self._lock:
+            self._names = names
+            self._by_name = by_name
+            self._children = dict(children)
+            self._descendants = {}
+            self._generation += 1
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self, db: Session) -> None:
+        loaded_at = self._loaded_at
+        if loaded_at is None or (
+            self.ttl and time.monotonic() - loaded_at > self.ttl
+        ):
+            self.load(db)
+
+    def find(self, db: Session, name: str) -> Optional[int]:
+        """
+        Вид деятельности с названием name, без учёта регистра; если такого
+        нет - первый по id, в названии которого встречается name
+        """
+        self._ensure_loaded(db)
+        needle = name.casefold()
+        activity_id = self._by_name.get(needle)
+        if activity_id is not None:
+            return activity_id
+        return next((i for i, n in self._names if needle in n), None)
+
+    def descendants(
+        self, db: Session, activity_id: int, depth: Optional[int] = 3
+    ) -> Set[int]:
+        """
+        Сам вид деятельности и его потомки не глубже depth уровней;
+        depth=None - всё поддерево
+        """
+        self._ensure_loaded(db)
+        key = (activity_id, depth)
+        with self._lock:
+            cached = self._descendants.get(key)
+            if cached is not None:
+                return cached
+            children = self._children
+            generation = self._generation
+
+        result = {activity_id}
+        level = [activity_id]
+        current_depth = 0
+        while level and (depth is None or current_depth < depth):
+            level = [
+                child
+                for parent in level
+                for child in children.get(parent, ())
+                if child not in result
+            ]
+            result.update(level)
+            current_depth += 1
+
+        result = frozenset(result)
+        with self._lock:
+            if generation == self._generation:
+                self._descendants[key] = result
+        return result
+
+    def subtree_for_name(
+        self, db: Session, name: str, depth: Optional[int] = 3
+    ) -> Set[int]:
+        activity_id = self.find(db, name)
+        if activity_id is None:
+            return set()
+        return self.descendants(db, activity_id, depth)
+
+
+activity_tree = ActivityTree(ttl=settings.ACTIVITY_TREE_TTL)
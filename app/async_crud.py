@@ -0,0 +1,261 @@
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models, schemas
+from app.activity_tree import activity_tree
+from app.crud import (
+    ACTIVITY_RELATIONS,
+    BUILDING_RELATIONS,
+    ORGANIZATION_RELATIONS,
+    bounds_predicate,
+    building_distance,
+    building_geography,
+    get_building_clusters as get_building_clusters_sync,
+    index_building_batches,
+    organization_search_statement,
+    paginate,
+    point_geography,
+    radius_predicate,
+)
+from app.spatial_index import building_index
+
+
+async def _use_building_index(db: AsyncSession) -> bool:
+    if not building_index.ready:
+        return False
+    await db.run_sync(building_index.maybe_sync)
+    return True
+
+
+async def get_activities(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+):
+    query = select(models.Activity)
+    result = await db.scalars(
+        paginate(query, models.Activity, skip, limit, after_id)
+    )
+    return result.all()
+
+
+async def get_activities_by_ids(
+    db: AsyncSession, activity_ids: List[int]
+) -> List[models.Activity]:
+    return await get_by_ids(db, models.Activity, activity_ids)
+
+
+async def get_activity(db: AsyncSession, activity_id: int):
+    result = await db.scalars(
+        select(models.Activity)
+        .options(*ACTIVITY_RELATIONS)
+        .filter(models.Activity.id == activity_id)
+    )
+    return result.first()
+
+
+async def get_buildings(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+):
+    query = select(models.Building).options(*BUILDING_RELATIONS)
+    result = await db.scalars(
+        paginate(query, models.Building, skip, limit, after_id)
+    )
+    return result.all()
+
+
+async def get_building(db: AsyncSession, building_id: int):
+    result = await db.scalars(
+        select(models.Building)
+        .options(*BUILDING_RELATIONS)
+        .filter(models.Building.id == building_id)
+    )
+    return result.first()
+
+
+async def get_by_ids(db: AsyncSession, model, ids: List[int], options=()):
+    if not ids:
+        return []
+    result = await db.scalars(
+        select(model).options(*options).filter(model.id.in_(ids))
+    )
+    by_id = {row.id: row for row in result.all()}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+async def get_buildings_by_ids(
+    db: AsyncSession, building_ids: List[int]
+) -> List[models.Building]:
+    return await get_by_ids(
+        db, models.Building, building_ids, BUILDING_RELATIONS
+    )
+
+
+async def get_buildings_in_radius(
+    db: AsyncSession,
+    latitude: float,
+    longitude: float,
+    radius: float,
+    limit: int = 10,
+) -> List[models.Building]:
+    if await _use_building_index(db):
+        hits = building_index.in_radius(latitude, longitude, radius, limit)
+        return await get_buildings_by_ids(db, [i for i, _ in hits])
+
+    result = await db.scalars(
+        select(models.Building)
+        .options(*BUILDING_RELATIONS)
+        .filter(radius_predicate(latitude, longitude, radius))
+        .order_by(building_distance(latitude, longitude))
+        .limit(limit)
+    )
+    return result.all()
+
+
+async def get_nearest_buildings(
+    db: AsyncSession, latitude: float, longitude: float, limit: int = 5
+) -> List[tuple[models.Building, float]]:
+    if await _use_building_index(db):
+        return building_index.nearest(latitude, longitude, limit)
+
+    point = point_geography(latitude, longitude)
+    distance = building_distance(latitude, longitude).label('distance')
+    result = await db.execute(
+        select(models.Building, distance)
+        .order_by(building_geography().op("<->")(point))
+        .limit(limit)
+    )
+    return [
+        (building, float(distance) / 1000)
+        for building, distance in result.all()
+    ]
+
+
+async def get_buildings_in_bounds(
+    db: AsyncSession,
+    min_lat: float,
+    max_lat: float,
+    min_lon: float,
+    max_lon: float,
+    limit: Optional[int] = None,
+) -> List[models.Building]:
+    if min_lat > max_lat:
+        return []
+
+    if await _use_building_index(db):
+        ids = sorted(
+            building_index.in_bounds(min_lat, max_lat, min_lon, max_lon)
+        )
+        return await get_buildings_by_ids(db, ids[:limit])
+
+    result = await db.scalars(
+        select(models.Building)
+        .options(*BUILDING_RELATIONS)
+        .filter(bounds_predicate(min_lat, max_lat, min_lon, max_lon))
+        .order_by(models.Building.id)
+        .limit(limit)
+    )
+    return result.all()
+
+
+async def get_building_clusters(
+    db: AsyncSession,
+    min_lat: float,
+    max_lat: float,
+    min_lon: float,
+    max_lon: float,
+    zoom: int,
+    top_activities: int = 3,
+) -> dict:
+    return await db.run_sync(
+        get_building_clusters_sync,
+        min_lat,
+        max_lat,
+        min_lon,
+        max_lon,
+        zoom,
+        top_activities,
+    )
+
+
+async def get_organizations(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+):
+    query = select(models.Organization).options(*ORGANIZATION_RELATIONS)
+    result = await db.scalars(
+        paginate(query, models.Organization, skip, limit, after_id)
+    )
+    return result.all()
+
+
+async def get_organizations_by_ids(
+    db: AsyncSession, organization_ids: List[int]
+) -> List[models.Organization]:
+    return await get_by_ids(
+        db, models.Organization, organization_ids, ORGANIZATION_RELATIONS
+    )
+
+
+async def get_organization(db: AsyncSession, organization_id: int):
+    result = await db.scalars(
+        select(models.Organization)
+        .options(*ORGANIZATION_RELATIONS)
+        .filter(models.Organization.id == organization_id)
+    )
+    return result.first()
+
+
+async def get_organizations_by_building(db: AsyncSession, building_id: int):
+    result = await db.scalars(
+        select(models.Organization)
+        .options(*ORGANIZATION_RELATIONS)
+        .filter(models.Organization.building_id == building_id)
+    )
+    return result.all()
+
+
+async def search_organizations(
+    db: AsyncSession,
+    search: schemas.OrganizationSearch,
+    after: Optional[Tuple[float, int]] = None,
+) -> List[Tuple[models.Organization, float]]:
+    activity_ids = None
+    if search.activity_name:
+        activity_ids = await db.run_sync(
+            activity_tree.subtree_for_name,
+            search.activity_name,
+            search.activity_depth,
+        )
+        if not activity_ids:
+            return []
+    if not (search.has_point and await _use_building_index(db)):
+        result = await db.execute(
+            organization_search_statement(search, activity_ids, None, after)
+        )
+        return [
+            (organization, float(rank)) for organization, rank in result.all()
+        ]
+
+    rows = []
+    for buildings in index_building_batches(search, after):
+        statement = organization_search_statement(
+            search, activity_ids, buildings, after
+        )
+        if search.limit is not None:
+            statement = statement.limit(search.limit - len(rows))
+        result = await db.execute(statement)
+        rows.extend(
+            (organization, float(rank)) for organization, rank in result.all()
+        )
+        if search.limit is not None and len(rows) >= search.limit:
+            break
+    return rows
@@ -1,20 +1,113 @@
-from fastapi import HTTPException, Security
+import hmac
+import weakref
+from typing import Iterable, Iterator
+
+from fastapi import Depends, HTTPException, Request, Security
 from fastapi.security import APIKeyHeader
 from starlette.status import HTTP_403_FORBIDDEN
 
 from app.config import settings
+from app.limits import limiter
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
 
-async def verify_api_key(api_key: str = Security(api_key_header)) -> str:
+def client_identity(request: Request) -> str:
+    """Ключ клиента, проверенный verify_api_key; "" - маршрут без ключа"""
+    return getattr(request.state, "api_key", "")
+
+
+async def verify_api_key(
+    request: Request, api_key: str = Security(api_key_header)
+):
     if not api_key:
         raise HTTPException(
             status_code=HTTP_403_FORBIDDEN,
             detail="X-API-Key header is missing",
         )
-    if api_key != settings.API_KEY:
+    if not limiter.is_known(api_key):
         raise HTTPException(
             status_code=HTTP_403_FORBIDDEN, detail="Invalid X-API-Key"
         )
-    return api_key
+    request.state.api_key = api_key
+    if not settings.RATE_LIMIT_ENABLED:
+        yield api_key
+        return
+    # Проверка в цикле событий: лишний запрос получает 429 раньше, чем
+    # займёт поток и соединение с базой
+    client = limiter.enter(api_key)
+    request.state.concurrency_slot = client
+    try:
+        yield api_key
+    finally:
+        # Ответ-поток забирает слот себе, см. hold_concurrency_slot
+        if request.state.concurrency_slot is client:
+            client.leave()
+
+
+class SlotStream:
+    """
+    Куски ответа-потока, пока клиент занимает слот одновременных запросов.
+    Слот освобождается после последнего куска или ошибки, а если поток так
+    и не дочитали (клиент отключился) - когда итератор собирает сборщик
+    мусора
+    """
+
+    def __init__(self, chunks: Iterable[bytes], client):
+        self._chunks = iter(chunks)
+        self.release = weakref.finalize(self, client.leave)
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self
+
+    def __next__(self) -> bytes:
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.release()
+            raise
+
+
+def hold_concurrency_slot(
+    request: Request, chunks: Iterable[bytes]
+) -> Iterable[bytes]:
+    """
+    Тело StreamingResponse держит слот клиента до конца отправки. Выход
+    из verify_api_key в зависимости от версии FastAPI бывает до начала
+    отправки тела, и выгрузка продолжалась бы уже без учёта в пределе
+    """
+    client = getattr(request.state, "concurrency_slot", None)
+    if client is None:
+        return chunks
+    request.state.concurrency_slot = None
+    return SlotStream(chunks, client)
+
+
+async def verify_admin_key(api_key: str = Depends(verify_api_key)) -> None:
+    """Служебные маршруты с данными чужих запросов - только ADMIN_API_KEY"""
+    admin_key = settings.ADMIN_API_KEY
+    if not admin_key or not hmac.compare_digest(
+        api_key.encode(), admin_key.encode()
+    ):
+        raise HTTPException(
+            status_code=HTTP_403_FORBIDDEN, detail="Admin API key required"
+        )
+
+
+async def geo_rate_limit(api_key: str = Depends(verify_api_key)) -> None:
+    """Дополнительный предел на ключ для дорогих гео-запросов"""
+    if settings.RATE_LIMIT_ENABLED:
+        limiter.check_route(
+            api_key,
+            "geo",
+            settings.GEO_RATE_LIMIT_PER_SECOND,
+            settings.GEO_RATE_LIMIT_BURST,
+        )
+
+
+async def point_search_rate_limit(
+    request: Request, api_key: str = Depends(verify_api_key)
+) -> None:
+    """Гео-предел для поиска, только если он ищет по радиусу от точки"""
+    if "radius" in request.query_params:
+        await geo_rate_limit(api_key)
@@ -0,0 +1,269 @@
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from fastapi import Response
+from app.config import settings
+from app.database import PINNED_TO_PRIMARY
+from app.serialization import serializer
+from app.tracing import span
+
+# Параметры, которые округляются до RESPONSE_CACHE_COORD_PRECISION знаков:
+# близкие точки попадают в один ключ
+COORDINATE_PARAMS = {
+    "latitude",
+    "longitude",
+    "min_lat",
+    "max_lat",
+    "min_lon",
+    "max_lon",
+}
+# Теги для ответов, которые включают связанные сущности всех типов
+ALL_TAGS = ("activities", "buildings", "organizations")
+# Заголовки, которые эндпоинт выставляет сам и которые надо отдавать из кэша
+CACHED_HEADERS_SKIP = {"content-length", "content-type"}
+
+
+class CacheEntry(NamedTuple):
+    expires_at: float
+    tags: Tuple[str, ...]
+    body: bytes
+    headers: Dict[str, str]
+
+
+class ResponseCache:
+    """
+    LRU-кэш сериализованных ответов с TTL и ограничением по памяти.
+
+    Записи помечены таблицами, от которых зависит ответ; запись в таблицу
+    сбрасывает все ответы с её тегом в этом процессе.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, CacheEntry]" = OrderedDict()
+        self._tags: Dict[str, Set[tuple]] = {}
+        self._bytes = 0
+        # Растёт при каждой инвалидации: ответ, посчитанный до записи в базу,
+        # не должен попасть в кэш после неё
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: tuple) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(
+        self,
+        key: tuple,
+        body: bytes,
+        tags: Iterable[str],
+        headers: Optional[Dict[str, str]] = None,
+        generation: Optional[int] = None,
+    ) -> None:
+        if len(body) > self.max_bytes:
+            return
+        entry = CacheEntry(
+            time.monotonic() + self.ttl, tuple(tags), body, headers or {}
+        )
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: tuple) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+
+    def invalidate(self, *tags: str) -> None:
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in list(self._tags.pop(tag, ())):
+                    if key in self._entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": settings.RESPONSE_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+    ttl=settings.RESPONSE_CACHE_TTL,
+)
+
+
+def _normalize(kwargs: dict) -> dict:
+    precision = settings.RESPONSE_CACHE_COORD_PRECISION
+    return {
+        name: (
+            round(value, precision)
+            if name in COORDINATE_PARAMS and value is not None
+            else value
+        )
+        for name, value in kwargs.items()
+    }
+
+
+def _bypass(kwargs: dict) -> bool:
+    """
+    Ответ мимо кэша: кэш выключен или сессия запроса закреплена за
+    основной базой после записи клиента
+    """
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return True
+    db = kwargs.get("db")
+    if db is None:
+        db = getattr(kwargs.get("source"), "db", None)
+    return db is not None and db.info.get(PINNED_TO_PRIMARY, False)
+
+
+def cached(model, tags: Iterable[str]):
+    """
+    Кэширует ответ GET-эндпоинта.
+
+    Ключ строится из параметров запроса (кроме db, source и response),
+    координаты округляются, и эндпоинт вызывается уже с округлёнными
+    значениями, чтобы ответ из кэша совпадал с тем, что вернул бы сам
+    эндпоинт. model - схема ответа, по которой результат сериализуется в
+    JSON. С FAST_SERIALIZATION_ENABLED ответ сериализуется здесь же и без
+    кэша. Клиент, закреплённый за основной базой после своей записи, кэш
+    не читает и не пополняет: иначе он получил бы ответ реплики без своей
+    записи.
+    """
+    serialize = serializer(model)
+    tags = tuple(tags)
+
+    def decorator(func):
+        def prepare(kwargs):
+            kwargs = _normalize(kwargs)
+            key = (func.__module__, func.__qualname__) + tuple(
+                sorted(
+                    (name, value)
+                    for name, value in kwargs.items()
+                    if name not in ("db", "response", "source")
+                )
+            )
+            return kwargs, key
+
+        def from_entry(entry: CacheEntry) -> Response:
+            return Response(
+                entry.body,
+                media_type="application/json",
+                headers=entry.headers,
+            )
+
+        def render(result, kwargs) -> Tuple[bytes, Dict[str, str]]:
+            with span("serialize"):
+                body = serialize(result)
+            headers = {}
+            response = kwargs.get("response")
+            if response is not None:
+                headers = {
+                    name: value
+                    for name, value in response.headers.items()
+                    if name not in CACHED_HEADERS_SKIP
+                }
+            return body, headers
+
+        def uncached(result, kwargs):
+            if not settings.FAST_SERIALIZATION_ENABLED:
+                return result
+            body, headers = render(result, kwargs)
+            return Response(
+                body, media_type="application/json", headers=headers
+            )
+
+        def store(key, generation, result, kwargs) -> Response:
+            body, headers = render(result, kwargs)
+            response_cache.set(key, body, tags, headers, generation)
+            return Response(
+                body, media_type="application/json", headers=headers
+            )
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(**kwargs):
+                if _bypass(kwargs):
+                    return uncached(await func(**kwargs), kwargs)
+                kwargs, key = prepare(kwargs)
+                entry = response_cache.get(key)
+                if entry is not None:
+                    return from_entry(entry)
+                generation = response_cache.generation
+                return store(key, generation, await func(**kwargs), kwargs)
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(**kwargs):
+                if _bypass(kwargs):
+                    return uncached(func(**kwargs), kwargs)
+                kwargs, key = prepare(kwargs)
+                entry = response_cache.get(key)
+                if entry is not None:
+                    return from_entry(entry)
+                generation = response_cache.generation
+                return store(key, generation, func(**kwargs), kwargs)
+
+        # Тот же кэш для асинхронного двойника эндпоинта
+        wrapper.cache = decorator
+        return wrapper
+
+    return decorator
@@ -2,6 +2,155 @@ import os
 
 class Settings:
     DATABASE_URL: str = os.getenv("DATABASE_URL")
+    # Реплика для GET-запросов; без неё всё идёт в DATABASE_URL. Клиент,
+    # писавший в базу меньше READ_YOUR_WRITES_WINDOW секунд назад, читает
+    # из основной базы
+    DATABASE_READ_URL: str = os.getenv("DATABASE_READ_URL")
+    READ_YOUR_WRITES_WINDOW: float = float(
+        os.getenv("READ_YOUR_WRITES_WINDOW", "5")
+    )
+    # Реплика, отстающая больше REPLICA_MAX_LAG секунд или не отвечающая,
+    # не обслуживает GET-запросы, пока не догонит основную базу;
+    # отставание замеряется в фоне раз в REPLICA_LAG_CHECK_INTERVAL секунд.
+    # 0 - не проверять
+    REPLICA_MAX_LAG: float = float(os.getenv("REPLICA_MAX_LAG", "30"))
+    REPLICA_LAG_CHECK_INTERVAL: float = float(
+        os.getenv("REPLICA_LAG_CHECK_INTERVAL", "5")
+    )
     API_KEY: str = os.getenv("API_KEY")
+    # Дополнительные ключи через запятую, у каждого можно задать свои
+    # пределы: key:rate:burst:concurrency
+    API_KEYS: str = os.getenv("API_KEYS", "")
+    # Ключ служебных маршрутов с данными чужих запросов
+    # (/internal/slow-queries); без него такие маршруты закрыты
+    ADMIN_API_KEY: str = os.getenv("ADMIN_API_KEY")
+
+    # Ограничение нагрузки на ключ: запросов в секунду, запас на всплеск,
+    # одновременных запросов; для гео-маршрутов - отдельная корзина
+    RATE_LIMIT_ENABLED: bool = (
+        os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+    )
+    RATE_LIMIT_PER_SECOND: float = float(
+        os.getenv("RATE_LIMIT_PER_SECOND", "20")
+    )
+    RATE_LIMIT_BURST: int = int(os.getenv("RATE_LIMIT_BURST", "40"))
+    RATE_LIMIT_CONCURRENCY: int = int(
+        os.getenv("RATE_LIMIT_CONCURRENCY", "8")
+    )
+    GEO_RATE_LIMIT_PER_SECOND: float = float(
+        os.getenv("GEO_RATE_LIMIT_PER_SECOND", "5")
+    )
+    GEO_RATE_LIMIT_BURST: int = int(os.getenv("GEO_RATE_LIMIT_BURST", "10"))
+
+    # Запуск: сколько секунд ждать базу и создавать ли таблицы через
+    # create_all (false, когда схемой управляет Alembic)
+    DB_WAIT_TIMEOUT: float = float(os.getenv("DB_WAIT_TIMEOUT", "60"))
+    DB_CREATE_ALL: bool = os.getenv("DB_CREATE_ALL", "true").lower() == "true"
+
+    # Пул соединений с базой; по умолчанию SQLAlchemy держит 5 + 10 без
+    # проверки и пересоздания соединений
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = (
+        os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    )
+    # Потоков для синхронных маршрутов; 0 - по размеру пула
+    # (DB_POOL_SIZE + DB_MAX_OVERFLOW), чтобы запросы ждали свободный поток,
+    # а не соединение внутри потока
+    THREADPOOL_SIZE: int = int(os.getenv("THREADPOOL_SIZE", "0"))
+
+    # Индекс зданий в памяти процесса для гео-запросов
+    SPATIAL_INDEX_ENABLED: bool = (
+        os.getenv("SPATIAL_INDEX_ENABLED", "false").lower() == "true"
+    )
+    SPATIAL_INDEX_CELL_SIZE: float = float(
+        os.getenv("SPATIAL_INDEX_CELL_SIZE", "0.01")
+    )
+    SPATIAL_INDEX_REFRESH_INTERVAL: float = float(
+        os.getenv("SPATIAL_INDEX_REFRESH_INTERVAL", "30")
+    )
+    # Полная перезагрузка индекса в фоне: догрузка видит только новые id
+    SPATIAL_INDEX_RELOAD_INTERVAL: float = float(
+        os.getenv("SPATIAL_INDEX_RELOAD_INTERVAL", "600")
+    )
+
+    # Кластеры зданий для карты: ячеек сетки на сторону тайла и порог, ниже
+    # которого вместо кластеров отдаются сами здания
+    CLUSTER_CELLS_PER_TILE: int = int(os.getenv("CLUSTER_CELLS_PER_TILE", "8"))
+    CLUSTER_MAX_POINTS: int = int(os.getenv("CLUSTER_MAX_POINTS", "500"))
+
+    # Асинхронный режим: GET-маршруты работают через AsyncSession (asyncpg)
+    ASYNC_DB_ENABLED: bool = (
+        os.getenv("ASYNC_DB_ENABLED", "false").lower() == "true"
+    )
+    ASYNC_DATABASE_URL: str = os.getenv("ASYNC_DATABASE_URL")
+
+    # Через сколько секунд дерево видов деятельности перечитывается из базы
+    ACTIVITY_TREE_TTL: float = float(os.getenv("ACTIVITY_TREE_TTL", "60"))
+
+    # Кэш ответов GET-эндпоинтов
+    RESPONSE_CACHE_ENABLED: bool = (
+        os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+    )
+    RESPONSE_CACHE_TTL: float = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(
+        os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000")
+    )
+    RESPONSE_CACHE_MAX_BYTES: int = int(
+        os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+    )
+    RESPONSE_CACHE_COORD_PRECISION: int = int(
+        os.getenv("RESPONSE_CACHE_COORD_PRECISION", "4")
+    )
+
+    # Кэш векторных тайлов /tiles в памяти процесса
+    TILE_CACHE_ENABLED: bool = (
+        os.getenv("TILE_CACHE_ENABLED", "true").lower() == "true"
+    )
+    TILE_CACHE_TTL: float = float(os.getenv("TILE_CACHE_TTL", "300"))
+    TILE_CACHE_MAX_ENTRIES: int = int(
+        os.getenv("TILE_CACHE_MAX_ENTRIES", "20000")
+    )
+    TILE_CACHE_MAX_BYTES: int = int(
+        os.getenv("TILE_CACHE_MAX_BYTES", str(128 * 1024 * 1024))
+    )
+
+    # Сериализация ответов сборкой словарей и orjson, без валидации Pydantic
+    FAST_SERIALIZATION_ENABLED: bool = (
+        os.getenv("FAST_SERIALIZATION_ENABLED", "false").lower() == "true"
+    )
+
+    # Логи и трассировка: доля запросов со спанами и порог, после которого
+    # запрос попадает в лог независимо от выборки
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+    TRACE_SLOW_MS: float = float(os.getenv("TRACE_SLOW_MS", "500"))
+    # Журнал медленных SQL-запросов: порог, как часто снимать EXPLAIN
+    # ANALYZE для одного отпечатка запроса (0 - не снимать) и сколько
+    # отпечатков хранить
+    SLOW_QUERY_LOG_ENABLED: bool = (
+        os.getenv("SLOW_QUERY_LOG_ENABLED", "false").lower() == "true"
+    )
+    SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", "200"))
+    SLOW_QUERY_EXPLAIN_INTERVAL: float = float(
+        os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "60")
+    )
+    SLOW_QUERY_MAX_STATEMENTS: int = int(
+        os.getenv("SLOW_QUERY_MAX_STATEMENTS", "200")
+    )
+    # Метрики Prometheus на /metrics
+    METRICS_ENABLED: bool = (
+        os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    )
+
+    # Режим только для чтения: каталог снимка справочника (python -m
+    # app.snapshot); GET-маршруты отвечают из него, к базе приложение не
+    # подключается
+    SNAPSHOT_PATH: str = os.getenv("SNAPSHOT_PATH")
+
+    # Сколько строк выгрузки читается с серверного курсора за раз
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
 
 settings = Settings()
\ No newline at end of file
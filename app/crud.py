@@ -1,5 +1,6 @@
 import math
-from typing import List, Optional
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 from geoalchemy2.functions import (
     ST_Distance,
@@ -8,20 +9,86 @@ from geoalchemy2.functions import (
     ST_SetSRID,
     ST_Transform,
 )
-from sqlalchemy import func, or_
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    Float,
+    Integer,
+    and_,
+    bindparam,
+    column,
+    func,
+    insert,
+    or_,
+    select,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import (
+    Session,
+    contains_eager,
+    joinedload,
+    selectinload,
+)
 from sqlalchemy.sql.expression import func
 
 from app import models, schemas
+from app.activity_tree import activity_tree
+from app.cache import response_cache
+from app.config import settings
+from app.geo import radius_bbox
+from app.spatial_index import building_index
+from app.tiles import BUFFER, EXTENT, tile_cache, tile_margin
+
+# Стратегии загрузки связей под схемы ответа: всё, что обходит схема,
+# подгружается фиксированным числом запросов независимо от размера страницы
+# BuildingWithRelations -> organizations -> activities
+BUILDING_RELATIONS = (
+    selectinload(models.Building.organizations).selectinload(
+        models.Organization.activities
+    ),
+)
+# OrganizationWithRelations -> activities, building
+ORGANIZATION_RELATIONS = (
+    selectinload(models.Organization.activities),
+    joinedload(models.Organization.building),
+)
+# ActivityWithRelations -> organizations -> building
+ACTIVITY_RELATIONS = (
+    selectinload(models.Activity.organizations).joinedload(
+        models.Organization.building
+    ),
+)
 
 
-def get_activities(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Activity).offset(skip).limit(limit).all()
+def paginate(query, model, skip: int = 0, limit: int = 100, after_id=None):
+    """
+    Страница списка в порядке id: keyset WHERE id > after_id, если передан
+    курсор, иначе OFFSET/LIMIT для совместимости со skip
+    """
+    query = query.order_by(model.id)
+    if after_id is not None:
+        return query.filter(model.id > after_id).limit(limit)
+    return query.offset(skip).limit(limit)
+
+
+def get_activities(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+):
+    query = db.query(models.Activity)
+    return paginate(query, models.Activity, skip, limit, after_id).all()
+
+
+def get_activities_by_ids(
+    db: Session, activity_ids: List[int]
+) -> List[models.Activity]:
+    return get_by_ids(db, models.Activity, activity_ids)
 
 
 def get_activity(db: Session, activity_id: int):
     return (
         db.query(models.Activity)
+        .options(*ACTIVITY_RELATIONS)
         .filter(models.Activity.id == activity_id)
         .first()
     )
@@ -32,21 +99,112 @@ def create_activity(db: Session, activity: schemas.ActivityCreate):
     db.add(db_activity)
     db.commit()
     db.refresh(db_activity)
+    activity_tree.invalidate()
+    response_cache.invalidate("activities")
     return db_activity
 
 
-def get_buildings(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Building).offset(skip).limit(limit).all()
+def create_activities(
+    db: Session, activities: List[schemas.ActivityCreate]
+) -> List[models.Activity]:
+    if not activities:
+        return []
+    activity_ids = db.scalars(
+        insert(models.Activity).returning(
+            models.Activity.id, sort_by_parameter_order=True
+        ),
+        [activity.model_dump() for activity in activities],
+    ).all()
+    db.commit()
+    activity_tree.invalidate()
+    response_cache.invalidate("activities")
+    return get_activities_by_ids(db, activity_ids)
+
+
+def get_buildings(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+):
+    query = db.query(models.Building).options(*BUILDING_RELATIONS)
+    return paginate(query, models.Building, skip, limit, after_id).all()
 
 
 def get_building(db: Session, building_id: int):
     return (
         db.query(models.Building)
+        .options(*BUILDING_RELATIONS)
         .filter(models.Building.id == building_id)
         .first()
     )
 
 
+def get_by_ids(db: Session, model, ids: List[int], options=()):
+    """Строки по списку id одним IN-запросом в порядке ids"""
+    if not ids:
+        return []
+    rows = db.query(model).options(*options).filter(model.id.in_(ids)).all()
+    by_id = {row.id: row for row in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def get_buildings_by_ids(
+    db: Session, building_ids: List[int]
+) -> List[models.Building]:
+    return get_by_ids(db, models.Building, building_ids, BUILDING_RELATIONS)
+
+
+def _use_building_index(db: Session) -> bool:
+    if not building_index.ready:
+        return False
+    building_index.maybe_sync(db)
+    return True
+
+
+def point_geography(latitude: float, longitude: float):
+    return func.Geography(
+        func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326)
+    )
+
+
+def building_geography():
+    """geography(location) - выражение GiST-индекса по geography"""
+    return func.Geography(models.Building.location)
+
+
+def building_distance(latitude: float, longitude: float):
+    """
+    Расстояние от здания до точки в метрах по сфере (use_spheroid=false):
+    та же метрика, что у app.spatial_index, поэтому ответы из базы и из
+    индекса в памяти совпадают и у границы радиуса
+    """
+    return func.ST_Distance(
+        building_geography(), point_geography(latitude, longitude), False
+    )
+
+
+def radius_predicate(latitude: float, longitude: float, radius: float):
+    """
+    Здание в радиусе radius км по сфере, как building_distance.
+    ST_DWithin по geography обслуживает индекс по выражению
+    geography(location); && с рамкой круга даёт планировщику и обычный
+    GiST-индекс location.
+    """
+    min_lon, min_lat, max_lon, max_lat = radius_bbox(
+        latitude, longitude, radius
+    )
+    return and_(
+        bounds_predicate(min_lat, max_lat, min_lon, max_lon),
+        func.ST_DWithin(
+            building_geography(),
+            point_geography(latitude, longitude),
+            radius * 1000,
+            False,
+        ),
+    )
+
+
 def get_buildings_in_radius(
     db: Session,
     latitude: float,
@@ -54,93 +212,345 @@ def get_buildings_in_radius(
     radius: float,
     limit: int = 10,
 ) -> List[models.Building]:
-    try:
-        point = func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326)
-        radius_meters = radius * 1000
-
-        return (
-            db.query(models.Building)
-            .filter(
-                func.ST_DWithin(
-                    func.Geography(models.Building.location),
-                    func.Geography(point),
-                    radius_meters,
-                )
-            )
-            .order_by(
-                func.ST_Distance(
-                    func.Geography(models.Building.location),
-                    func.Geography(point),
-                )
-            )
-            .limit(limit)
-            .all()
-        )
-    except Exception as e:
-        print(f"Error in get_buildings_in_radius: {e}")
-        return []
+    if _use_building_index(db):
+        hits = building_index.in_radius(latitude, longitude, radius, limit)
+        return get_buildings_by_ids(db, [i for i, _ in hits])
+    return (
+        db.query(models.Building)
+        .options(*BUILDING_RELATIONS)
+        .filter(radius_predicate(latitude, longitude, radius))
+        .order_by(building_distance(latitude, longitude))
+        .limit(limit)
+        .all()
+    )
 
 
 def get_nearest_buildings(
     db: Session, latitude: float, longitude: float, limit: int = 5
 ) -> List[tuple[models.Building, float]]:
-    try:
-        point = func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326)
-
-        query = (
-            db.query(
-                models.Building,
-                func.ST_Distance(
-                    func.Geography(models.Building.location),
-                    func.Geography(point),
-                ).label('distance'),
-            )
-            .order_by('distance')
-            .limit(limit)
+    if _use_building_index(db):
+        return building_index.nearest(latitude, longitude, limit)
+    point = point_geography(latitude, longitude)
+
+    # <-> по geography - обход индекса geography(location) от ближайших
+    # (KNN) вместо расчёта расстояния до каждого здания
+    query = (
+        db.query(
+            models.Building,
+            building_distance(latitude, longitude).label('distance'),
         )
+        .order_by(building_geography().op("<->")(point))
+        .limit(limit)
+    )
 
-        results = query.all()
-        return [
-            (building, float(distance) / 1000)
-            for building, distance in results
-        ]
-    except Exception as e:
-        print(f"Error in get_nearest_buildings: {e}")
-        return []
+    results = query.all()
+    return [
+        (building, float(distance) / 1000) for building, distance in results
+    ]
+
+
+def bounds_predicate(
+    min_lat: float, max_lat: float, min_lon: float, max_lon: float
+):
+    """
+    Здание в прямоугольнике: && с ST_MakeEnvelope обслуживает GiST-индекс
+    location. min_lon > max_lon - прямоугольник через 180-й меридиан.
+    """
+    if min_lon > max_lon:
+        return or_(
+            bounds_predicate(min_lat, max_lat, min_lon, 180),
+            bounds_predicate(min_lat, max_lat, -180, max_lon),
+        )
+    return models.Building.location.op("&&")(
+        func.ST_MakeEnvelope(min_lon, min_lat, max_lon, max_lat, 4326)
+    )
 
 
 def get_buildings_in_bounds(
-    db: Session, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    db: Session,
+    min_lat: float,
+    max_lat: float,
+    min_lon: float,
+    max_lon: float,
+    limit: Optional[int] = None,
 ) -> List[models.Building]:
-    try:
-        if min_lat > max_lat or min_lon > max_lon:
-            print("Invalid bounds: min values greater than max values")
-            return []
+    """Здания в прямоугольнике по возрастанию id, не больше limit"""
+    if min_lat > max_lat:
+        return []
+
+    if _use_building_index(db):
+        ids = sorted(
+            building_index.in_bounds(min_lat, max_lat, min_lon, max_lon)
+        )
+        return get_buildings_by_ids(db, ids[:limit])
+
+    return (
+        db.query(models.Building)
+        .options(*BUILDING_RELATIONS)
+        .filter(bounds_predicate(min_lat, max_lat, min_lon, max_lon))
+        .order_by(models.Building.id)
+        .limit(limit)
+        .all()
+    )
 
-        bounds_wkt = f'SRID=4326;POLYGON(({min_lon} {min_lat}, {max_lon} {min_lat}, {max_lon} {max_lat}, {min_lon} {max_lat}, {min_lon} {min_lat}))'
-        search_area = func.ST_GeomFromEWKT(bounds_wkt)
 
-        print(
-            f"Searching in bounds: lat [{min_lat}, {max_lat}], lon [{min_lon}, {max_lon}]"
+def cluster_cell_size(zoom: int) -> float:
+    """Сторона ячейки кластеров в градусах для масштаба карты zoom"""
+    return 360 / (2**zoom * settings.CLUSTER_CELLS_PER_TILE)
+
+
+def _cells_subquery(predicate, cell_size: float):
+    """
+    Здания области с номерами ячеек сетки. Номера считаются один раз в
+    подзапросе, чтобы внешние GROUP BY и PARTITION BY ссылались на столбцы,
+    а не повторяли выражения с параметрами.
+    """
+    return (
+        select(
+            models.Building.id.label("building_id"),
+            models.Building.latitude.label("latitude"),
+            models.Building.longitude.label("longitude"),
+            func.floor((models.Building.longitude + 180) / cell_size).label(
+                "cell_col"
+            ),
+            func.floor((models.Building.latitude + 90) / cell_size).label(
+                "cell_row"
+            ),
         )
+        .where(predicate)
+        .subquery()
+    )
 
-        buildings = (
-            db.query(models.Building)
-            .filter(func.ST_Within(models.Building.location, search_area))
-            .all()
+
+def _sql_clusters(db: Session, predicate, cell_size: float, max_points: int):
+    located = _cells_subquery(predicate, cell_size)
+    cells = [
+        (int(col), int(row), count, lat, lon)
+        for col, row, count, lat, lon in db.execute(
+            select(
+                located.c.cell_col,
+                located.c.cell_row,
+                func.count(),
+                func.avg(located.c.latitude),
+                func.avg(located.c.longitude),
+            )
+            .group_by(located.c.cell_col, located.c.cell_row)
+            .order_by(located.c.cell_row, located.c.cell_col)
+        )
+    ]
+    if sum(cell[2] for cell in cells) > max_points:
+        return cells, []
+    buildings = (
+        db.query(models.Building)
+        .filter(predicate)
+        .order_by(models.Building.id)
+        .all()
+    )
+    return [], buildings
+
+
+def _top_cluster_activities(
+    db: Session, predicate, cell_size: float, top: int
+) -> Dict[Tuple[int, int], List[dict]]:
+    """До top самых частых видов деятельности в каждой ячейке одним запросом"""
+    located = _cells_subquery(predicate, cell_size)
+    cell = (located.c.cell_col, located.c.cell_row)
+    count = func.count()
+    counted = (
+        select(
+            *cell,
+            models.Activity.id,
+            models.Activity.name,
+            count.label("count"),
+            func.row_number()
+            .over(
+                partition_by=cell, order_by=(count.desc(), models.Activity.id)
+            )
+            .label("place"),
+        )
+        .select_from(located)
+        .join(
+            models.Organization,
+            models.Organization.building_id == located.c.building_id,
+        )
+        .join(models.Organization.activities)
+        .group_by(*cell, models.Activity.id, models.Activity.name)
+        .subquery()
+    )
+    result = defaultdict(list)
+    for col, row, activity_id, name, n, _ in db.execute(
+        select(counted)
+        .where(counted.c.place <= top)
+        .order_by(counted.c.cell_row, counted.c.cell_col, counted.c.place)
+    ):
+        result[int(col), int(row)].append(
+            {"id": activity_id, "name": name, "count": n}
         )
+    return result
 
-        print(f"Found {len(buildings)} buildings")
-        for building in buildings:
-            print(
-                f"Building at: {building.address} ({building.latitude}, {building.longitude})"
+
+def get_building_clusters(
+    db: Session,
+    min_lat: float,
+    max_lat: float,
+    min_lon: float,
+    max_lon: float,
+    zoom: int,
+    top_activities: int = 3,
+) -> dict:
+    """
+    Здания области, собранные в ячейки сетки масштаба zoom: число зданий,
+    центроид и самые частые виды деятельности. Если зданий в области не
+    больше CLUSTER_MAX_POINTS, возвращаются сами здания.
+    """
+    cell_size = cluster_cell_size(zoom)
+    max_points = settings.CLUSTER_MAX_POINTS
+    predicate = bounds_predicate(min_lat, max_lat, min_lon, max_lon)
+    if _use_building_index(db):
+        cells, buildings = building_index.clusters(
+            min_lat, max_lat, min_lon, max_lon, cell_size, max_points
+        )
+    else:
+        cells, buildings = _sql_clusters(db, predicate, cell_size, max_points)
+
+    activities = {}
+    if cells and top_activities:
+        activities = _top_cluster_activities(
+            db, predicate, cell_size, top_activities
+        )
+    return clusters_response(zoom, cell_size, cells, buildings, activities)
+
+
+def clusters_response(
+    zoom: int,
+    cell_size: float,
+    cells: List[tuple],
+    buildings: list,
+    activities: Dict[Tuple[int, int], List[dict]],
+) -> dict:
+    """
+    Ответ /buildings/clusters: cells - (столбец, строка, число зданий,
+    широта и долгота центроида), activities - виды деятельности ячеек
+    """
+    clusters = []
+    for col, row, count, lat, lon in cells:
+        cell_min_lon = col * cell_size - 180
+        cell_min_lat = row * cell_size - 90
+        clusters.append(
+            {
+                "latitude": lat,
+                "longitude": lon,
+                "count": count,
+                "bounds": [
+                    cell_min_lon,
+                    cell_min_lat,
+                    cell_min_lon + cell_size,
+                    cell_min_lat + cell_size,
+                ],
+                "top_activities": activities.get((col, row), []),
+            }
+        )
+    return {
+        "zoom": zoom,
+        "cell_size": cell_size,
+        "total": len(buildings) + sum(cell["count"] for cell in clusters),
+        "clusters": clusters,
+        "buildings": buildings,
+    }
+
+
+def get_building_tile(db: Session, z: int, x: int, y: int) -> bytes:
+    """
+    Векторный тайл слоя buildings: точка здания, адрес, число организаций
+    и самый частый вид деятельности его организаций. Тайл кодирует PostGIS
+    одним запросом.
+    """
+    envelope = func.ST_TileEnvelope(z, x, y)
+    area = func.ST_Transform(func.ST_Expand(envelope, tile_margin(z)), 4326)
+    in_tile = (
+        select(
+            models.Building.id,
+            models.Building.address,
+            models.Building.location,
+        )
+        .where(models.Building.location.op("&&")(area))
+        .cte("in_tile")
+    )
+    organization_counts = (
+        select(
+            models.Organization.building_id,
+            func.count().label("organizations"),
+        )
+        .join(in_tile, in_tile.c.id == models.Organization.building_id)
+        .group_by(models.Organization.building_id)
+        .subquery()
+    )
+    activity_places = (
+        select(
+            models.Organization.building_id,
+            models.Activity.name,
+            func.row_number()
+            .over(
+                partition_by=models.Organization.building_id,
+                order_by=(func.count().desc(), models.Activity.id),
             )
+            .label("place"),
+        )
+        .join(in_tile, in_tile.c.id == models.Organization.building_id)
+        .join(models.Organization.activities)
+        .group_by(
+            models.Organization.building_id,
+            models.Activity.id,
+            models.Activity.name,
+        )
+        .subquery()
+    )
+    features = (
+        select(
+            in_tile.c.id,
+            in_tile.c.address,
+            func.coalesce(organization_counts.c.organizations, 0).label(
+                "organizations"
+            ),
+            activity_places.c.name.label("activity"),
+            func.ST_AsMVTGeom(
+                func.ST_Transform(in_tile.c.location, 3857),
+                envelope,
+                EXTENT,
+                BUFFER,
+                True,
+            ).label("geom"),
+        )
+        .outerjoin(
+            organization_counts,
+            organization_counts.c.building_id == in_tile.c.id,
+        )
+        .outerjoin(
+            activity_places,
+            and_(
+                activity_places.c.building_id == in_tile.c.id,
+                activity_places.c.place == 1,
+            ),
+        )
+        .subquery()
+    )
+    tile = db.execute(
+        select(
+            func.ST_AsMVT(
+                features.table_valued(), "buildings", EXTENT, "geom", "id"
+            )
+        )
+    ).scalar()
+    return bytes(tile or b"")
 
-        return buildings
 
-    except Exception as e:
-        print(f"Error in get_buildings_in_bounds: {e}")
-        return []
+def _invalidate_building_tiles(db: Session, building_ids: Set[int]) -> None:
+    """Сбрасывает тайлы зданий, у которых поменялись организации"""
+    tile_cache.invalidate_points(
+        db.query(models.Building.latitude, models.Building.longitude)
+        .filter(models.Building.id.in_(building_ids))
+        .all()
+    )
 
 
 def create_building(db: Session, building: schemas.BuildingCreate):
@@ -151,16 +561,75 @@ def create_building(db: Session, building: schemas.BuildingCreate):
     db.add(db_building)
     db.commit()
     db.refresh(db_building)
+    if building_index.ready:
+        building_index.add(
+            db_building.id,
+            db_building.address,
+            building.latitude,
+            building.longitude,
+        )
+    response_cache.invalidate("buildings")
+    tile_cache.invalidate_points([(building.latitude, building.longitude)])
     return db_building
 
 
-def get_organizations(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Organization).offset(skip).limit(limit).all()
+def create_buildings(
+    db: Session, buildings: List[schemas.BuildingCreate]
+) -> List[models.Building]:
+    if not buildings:
+        return []
+    building_ids = db.scalars(
+        insert(models.Building).returning(
+            models.Building.id, sort_by_parameter_order=True
+        ),
+        [
+            {
+                "address": building.address,
+                "location": (
+                    f"SRID=4326;POINT({building.longitude} {building.latitude})"
+                ),
+            }
+            for building in buildings
+        ],
+    ).all()
+    db.commit()
+    if building_index.ready:
+        for building_id, building in zip(building_ids, buildings):
+            building_index.add(
+                building_id,
+                building.address,
+                building.latitude,
+                building.longitude,
+            )
+    response_cache.invalidate("buildings")
+    tile_cache.invalidate_points(
+        (building.latitude, building.longitude) for building in buildings
+    )
+    return get_buildings_by_ids(db, building_ids)
+
+
+def get_organizations(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+):
+    query = db.query(models.Organization).options(*ORGANIZATION_RELATIONS)
+    return paginate(query, models.Organization, skip, limit, after_id).all()
+
+
+def get_organizations_by_ids(
+    db: Session, organization_ids: List[int]
+) -> List[models.Organization]:
+    return get_by_ids(
+        db, models.Organization, organization_ids, ORGANIZATION_RELATIONS
+    )
 
 
 def get_organization(db: Session, organization_id: int):
     return (
         db.query(models.Organization)
+        .options(*ORGANIZATION_RELATIONS)
         .filter(models.Organization.id == organization_id)
         .first()
     )
@@ -171,12 +640,34 @@ def create_organization(db: Session, organization: schemas.OrganizationCreate):
     db.add(db_organization)
     db.commit()
     db.refresh(db_organization)
+    response_cache.invalidate("organizations")
+    _invalidate_building_tiles(db, {organization.building_id})
     return db_organization
 
 
+def create_organizations(
+    db: Session, organizations: List[schemas.OrganizationCreate]
+) -> List[models.Organization]:
+    if not organizations:
+        return []
+    organization_ids = db.scalars(
+        insert(models.Organization).returning(
+            models.Organization.id, sort_by_parameter_order=True
+        ),
+        [organization.model_dump() for organization in organizations],
+    ).all()
+    db.commit()
+    response_cache.invalidate("organizations")
+    _invalidate_building_tiles(
+        db, {organization.building_id for organization in organizations}
+    )
+    return get_organizations_by_ids(db, organization_ids)
+
+
 def get_organizations_by_building(db: Session, building_id: int):
     return (
         db.query(models.Organization)
+        .options(*ORGANIZATION_RELATIONS)
         .filter(models.Organization.building_id == building_id)
         .all()
     )
@@ -185,77 +676,297 @@ def get_organizations_by_building(db: Session, building_id: int):
 def get_organizations_by_coordinates(
     db: Session, latitude: float, longitude: float, radius: float
 ) -> List[models.Organization]:
-    try:
-        point = func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326)
-        radius_meters = radius * 1000
-
-        return (
+    if _use_building_index(db):
+        hits = building_index.in_radius(latitude, longitude, radius)
+        if not hits:
+            return []
+        rank = {building_id: i for i, (building_id, _) in enumerate(hits)}
+        organizations = (
             db.query(models.Organization)
-            .join(models.Building)
-            .filter(
-                func.ST_DWithin(
-                    func.Geography(models.Building.location),
-                    func.Geography(point),
-                    radius_meters,
-                )
-            )
-            .order_by(
-                func.ST_Distance(
-                    func.Geography(models.Building.location),
-                    func.Geography(point),
-                )
-            )
+            .options(*ORGANIZATION_RELATIONS)
+            .filter(models.Organization.building_id.in_(list(rank)))
             .all()
         )
-    except Exception as e:
-        print(f"Error in get_organizations_by_coordinates: {e}")
-        return []
-
-
-def get_organizations_by_name(
-    db: Session, name: str
-) -> List[models.Organization]:
-    if not name:
-        return []
+        return sorted(organizations, key=lambda o: rank[o.building_id])
     return (
         db.query(models.Organization)
-        .filter(models.Organization.name.ilike(f"%{name}%"))
+        .options(*ORGANIZATION_RELATIONS)
+        .join(models.Building)
+        .filter(radius_predicate(latitude, longitude, radius))
+        .order_by(building_distance(latitude, longitude))
         .all()
     )
 
 
-def get_organizations_by_activity(db: Session, activity_name: str):
-    activity = (
-        db.query(models.Activity)
-        .filter(models.Activity.name.ilike(f"%{activity_name}%"))
-        .first()
+def name_search_expressions(name: str):
+    """
+    Совпадение по подстроке или по триграммной похожести; оба условия
+    обслуживаются GIN-индексом ix_organizations_name_trgm
+    """
+    score = func.similarity(models.Organization.name, name).label("score")
+    predicate = or_(
+        models.Organization.name.ilike(f"%{name}%"),
+        models.Organization.name.op("%")(name),
     )
+    return score, predicate
 
-    if not activity:
+
+def get_organizations_by_name(
+    db: Session,
+    name: str,
+    limit: Optional[int] = 100,
+    after: Optional[Tuple[float, int]] = None,
+) -> List[Tuple[models.Organization, float]]:
+    """
+    Организации, отсортированные по похожести названия на name (score, id).
+    after - (score, id) последней строки предыдущей страницы.
+    """
+    if not name:
         return []
+    score, predicate = name_search_expressions(name)
+    query = (
+        db.query(models.Organization, score)
+        .options(*ORGANIZATION_RELATIONS)
+        .filter(predicate)
+    )
+    if after is not None:
+        after_score, after_id = after
+        query = query.filter(
+            or_(
+                score < after_score,
+                and_(score == after_score, models.Organization.id > after_id),
+            )
+        )
+    query = query.order_by(score.desc(), models.Organization.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return [(organization, float(rank)) for organization, rank in query.all()]
+
+
+# Сколько зданий из пространственного индекса уходит в один запрос поиска
+INDEX_BUILDINGS_PER_QUERY = 500
+
+
+def index_building_batches(
+    search: schemas.OrganizationSearch,
+    after: Optional[Tuple[float, int]] = None,
+) -> Iterator[List[Tuple[int, float]]]:
+    """
+    Здания в радиусе поиска из пространственного индекса порциями для
+    organization_search_statement: пары (id здания, расстояние в метрах)
+    по возрастанию расстояния. Здания ближе rank из after уже пройдены
+    прошлыми страницами и пропускаются. Граница порции не разделяет
+    здания на одном расстоянии, иначе порядок (rank, id) между порциями
+    нарушится.
+    """
+    batch: List[Tuple[int, float]] = []
+    for building_id, distance in building_index.in_radius(
+        search.latitude, search.longitude, search.radius
+    ):
+        # Метры, как у ST_Distance по geography в запросе без индекса
+        distance *= 1000
+        if after is not None and distance < after[0]:
+            continue
+        if (
+            len(batch) >= INDEX_BUILDINGS_PER_QUERY
+            and distance != batch[-1][1]
+        ):
+            yield batch
+            batch = []
+        batch.append((building_id, distance))
+    if batch:
+        yield batch
+
+
+def organization_search_statement(
+    search: schemas.OrganizationSearch,
+    activity_ids: Optional[Set[int]] = None,
+    buildings: Optional[List[Tuple[int, float]]] = None,
+    after: Optional[Tuple[float, int]] = None,
+):
+    """
+    Один SELECT по всем фильтрам поиска; строки - (организация, rank).
+
+    activity_ids и buildings - заранее найденные в памяти поддерево
+    видов деятельности и здания из пространственного индекса с
+    расстояниями (порция index_building_batches). Условия добавляются от
+    самых избирательных к наименее: здание, вид деятельности, радиус,
+    название. Порядок - по расстоянию в метрах, если задана точка, иначе
+    по похожести названия, иначе по id; after - (rank, id) последней
+    строки предыдущей страницы.
+    """
+    query = select(models.Organization)
+    options = ORGANIZATION_RELATIONS
+    rank, descending = None, False
+
+    if search.building_id is not None:
+        query = query.filter(
+            models.Organization.building_id == search.building_id
+        )
+    if activity_ids is not None:
+        query = query.filter(
+            models.Organization.id.in_(
+                select(models.organization_activity.c.organization_id).where(
+                    models.organization_activity.c.activity_id.in_(
+                        activity_ids
+                    )
+                )
+            )
+        )
+    if buildings is not None:
+        # Расстояния уже посчитаны индексом - приходят вместе с id зданий
+        ids, distances = zip(*buildings)
+        nearby = (
+            func.unnest(
+                bindparam("building_ids", list(ids), type_=ARRAY(Integer)),
+                bindparam(
+                    "building_distances", list(distances), type_=ARRAY(Float)
+                ),
+            )
+            .table_valued(
+                column("building_id", Integer), column("distance", Float)
+            )
+            .render_derived(name="nearby")
+        )
+        query = query.join(
+            nearby, models.Organization.building_id == nearby.c.building_id
+        )
+        rank = nearby.c.distance
+    elif search.has_point:
+        query = query.join(models.Organization.building).filter(
+            radius_predicate(search.latitude, search.longitude, search.radius)
+        )
+        # Здание уже присоединено для фильтра - берём его из того же JOIN
+        options = (
+            selectinload(models.Organization.activities),
+            contains_eager(models.Organization.building),
+        )
+        rank = building_distance(search.latitude, search.longitude)
+    if search.name:
+        score, predicate = name_search_expressions(search.name)
+        query = query.filter(predicate)
+        if rank is None:
+            rank, descending = score, True
+    if rank is None:
+        rank = models.Organization.id
+
+    if after is not None:
+        after_rank, after_id = after
+        beyond = rank < after_rank if descending else rank > after_rank
+        query = query.filter(
+            or_(
+                beyond,
+                and_(rank == after_rank, models.Organization.id > after_id),
+            )
+        )
+    query = (
+        query.options(*options)
+        .add_columns(rank.label("rank"))
+        .order_by(rank.desc() if descending else rank, models.Organization.id)
+    )
+    if search.limit is not None:
+        query = query.limit(search.limit)
+    return query
+
+
+def activity_export_statement(
+    db: Session, activity_name: Optional[str] = None, depth: int = 3
+):
+    """
+    SELECT для выгрузки видов деятельности в порядке id: все или поддерево
+    activity_name; None - выгружать нечего
+    """
+    query = select(models.Activity)
+    if activity_name:
+        activity_ids = activity_tree.subtree_for_name(db, activity_name, depth)
+        if not activity_ids:
+            return None
+        query = query.filter(models.Activity.id.in_(activity_ids))
+    return query.order_by(models.Activity.id)
+
+
+def building_export_statement(
+    bounds: Optional[Tuple[float, float, float, float]] = None,
+):
+    """
+    SELECT для выгрузки зданий в порядке id; bounds - (min_lat, max_lat,
+    min_lon, max_lon)
+    """
+    query = select(models.Building).options(*BUILDING_RELATIONS)
+    if bounds is not None:
+        query = query.filter(bounds_predicate(*bounds))
+    return query.order_by(models.Building.id)
+
+
+def organization_export_statement(
+    db: Session, search: schemas.OrganizationSearch
+):
+    """
+    SELECT для выгрузки организаций с фильтрами поиска, без лимита
+    (search.limit=None); None - выгружать нечего
+    """
+    activity_ids = None
+    if search.activity_name:
+        activity_ids = activity_tree.subtree_for_name(
+            db, search.activity_name, search.activity_depth
+        )
+        if not activity_ids:
+            return None
+    return organization_search_statement(search, activity_ids)
 
-    child_activities = set()
 
-    def add_children(parent_id, level=0):
-        if level >= 3:
-            return
-        children = (
-            db.query(models.Activity)
-            .filter(models.Activity.parent_id == parent_id)
-            .all()
+def search_organizations(
+    db: Session,
+    search: schemas.OrganizationSearch,
+    after: Optional[Tuple[float, int]] = None,
+) -> List[Tuple[models.Organization, float]]:
+    activity_ids = None
+    if search.activity_name:
+        activity_ids = activity_tree.subtree_for_name(
+            db, search.activity_name, search.activity_depth
+        )
+        if not activity_ids:
+            return []
+    if not (search.has_point and _use_building_index(db)):
+        statement = organization_search_statement(
+            search, activity_ids, None, after
+        )
+        return [
+            (organization, float(rank))
+            for organization, rank in db.execute(statement).all()
+        ]
+
+    # Здания из индекса уходят порциями от ближних к дальним, пока не
+    # наберётся страница
+    rows = []
+    for buildings in index_building_batches(search, after):
+        statement = organization_search_statement(
+            search, activity_ids, buildings, after
+        )
+        if search.limit is not None:
+            statement = statement.limit(search.limit - len(rows))
+        rows.extend(
+            (organization, float(rank))
+            for organization, rank in db.execute(statement).all()
         )
-        for child in children:
-            child_activities.add(child.id)
-            add_children(child.id, level + 1)
+        if search.limit is not None and len(rows) >= search.limit:
+            break
+    return rows
 
-    child_activities.add(activity.id)
-    add_children(activity.id)
+
+def get_organizations_by_activity(
+    db: Session, activity_name: str, depth: Optional[int] = 3
+):
+    activity_ids = activity_tree.subtree_for_name(db, activity_name, depth)
+    if not activity_ids:
+        return []
 
     return (
         db.query(models.Organization)
+        .options(*ORGANIZATION_RELATIONS)
         .filter(
             models.Organization.activities.any(
-                models.Activity.id.in_(child_activities)
+                models.Activity.id.in_(activity_ids)
             )
         )
         .all()
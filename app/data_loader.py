@@ -44,6 +44,12 @@ def create_activities(db: Session):
 
 
 def create_buildings_and_organizations(db: Session, test_data, activity_map):
+    activities = {
+        activity.id: activity
+        for activity in db.query(Activity).filter(
+            Activity.id.in_(activity_map.values())
+        )
+    }
     for location in test_data:
         # В PostGIS для ST_MakePoint первым идет longitude (X), затем latitude (Y)
         building = Building(
@@ -57,16 +63,14 @@ def create_buildings_and_organizations(db: Session, test_data, activity_map):
             ),
         )
         db.add(building)
-        db.flush()
 
         for org_name, activity_type, phone in location["organizations"]:
             org = Organization(
-                name=org_name, phone_numbers=phone, building_id=building.id
+                name=org_name, phone_numbers=phone, building=building
             )
-            if activity_type in activity_map:
-                activity = db.query(Activity).get(activity_map[activity_type])
-                if activity:
-                    org.activities.append(activity)
+            activity = activities.get(activity_map.get(activity_type))
+            if activity:
+                org.activities.append(activity)
             db.add(org)
     db.commit()
 
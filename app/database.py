@@ -1,17 +1,560 @@
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+import functools
 import os
+import threading
+import time
+from typing import Optional
+
+from app import metrics
+from app.auth import client_identity
+from app.config import settings
+from app.slow_queries import slow_query_log
+from app.tracing import instrument_engine
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")  # Берём URL из переменной окружения
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class CheckoutStats:
+    """Сколько запросы ждали свободное соединение из пула"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_total_seconds": self.wait_total,
+                "wait_avg_seconds": (
+                    self.wait_total / self.checkouts if self.checkouts else 0.0
+                ),
+                "wait_max_seconds": self.wait_max,
+            }
+
+
+class TimedCheckout:
+    """Примесь к пулу: замеряет ожидание соединения в _do_get"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = CheckoutStats()
+
+    def recreate(self):
+        # dispose() подменяет пул новым - статистика переходит к нему
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+
+class TimedQueuePool(TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+POOL_OPTIONS = {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+    "pool_pre_ping": settings.DB_POOL_PRE_PING,
+}
+
+
+def pool_status(bind) -> dict:
+    pool = bind.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # До заполнения пула счётчик SQLAlchemy отрицательный
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "timeout": pool.timeout(),
+        **pool.stats.snapshot(),
+    }
+
+
+def threadpool_size() -> int:
+    return settings.THREADPOOL_SIZE or (
+        settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    )
+
+
+DB_ERRORS = metrics.Counter(
+    "db_errors_total", "Database errors by connection pool", ("pool",)
+)
+POOL_SIZE = metrics.Gauge(
+    "db_pool_size", "Connections kept open by the pool", ("pool",)
+)
+POOL_CHECKED_OUT = metrics.Gauge(
+    "db_pool_checked_out", "Connections currently in use", ("pool",)
+)
+POOL_OVERFLOW = metrics.Gauge(
+    "db_pool_overflow", "Connections opened above pool_size", ("pool",)
+)
+POOL_CHECKOUTS = metrics.Counter(
+    "db_pool_checkouts_total", "Connections handed out by the pool", ("pool",)
+)
+POOL_TIMEOUTS = metrics.Counter(
+    "db_pool_checkout_timeouts_total",
+    "Checkouts that gave up after pool_timeout",
+    ("pool",),
+)
+POOL_WAIT = metrics.Counter(
+    "db_pool_checkout_wait_seconds_total",
+    "Time spent waiting for a free connection",
+    ("pool",),
+)
+POOL_METRICS = (
+    POOL_SIZE,
+    POOL_CHECKED_OUT,
+    POOL_OVERFLOW,
+    POOL_CHECKOUTS,
+    POOL_TIMEOUTS,
+    POOL_WAIT,
+)
+
+
+def instrument(bind, name: str, explain_bind=None) -> None:
+    """
+    Трассировка, счётчик ошибок и журнал медленных запросов движка; name -
+    метка пула в метриках, explain_bind() - синхронный движок той же базы
+    для EXPLAIN медленных запросов
+    """
+    instrument_engine(bind)
+    event.listen(bind, "handle_error", lambda context: DB_ERRORS.inc((name,)))
+    if settings.SLOW_QUERY_LOG_ENABLED:
+        slow_query_log.instrument(bind, name, explain_bind)
+
+
+# Движки создаются при первом обращении, а не при импорте: импорт
+# приложения, CLI и бенчмарков не требует DATABASE_URL и базы
+_engines = {}
+_lock = threading.Lock()
+
+
+def get_engine():
+    """Движок основной базы: запись и чтение сразу после записи"""
+    with _lock:
+        if "sync" not in _engines:
+            _engines["sync"] = create_engine(
+                SQLALCHEMY_DATABASE_URL,
+                poolclass=TimedQueuePool,
+                **POOL_OPTIONS,
+            )
+            instrument(_engines["sync"], "sync")
+        return _engines["sync"]
+
+
+def get_read_engine():
+    """Движок реплики; без DATABASE_READ_URL - тот же, что get_engine()"""
+    if not settings.DATABASE_READ_URL:
+        return get_engine()
+    with _lock:
+        if "sync_read" not in _engines:
+            _engines["sync_read"] = create_engine(
+                settings.DATABASE_READ_URL,
+                poolclass=TimedQueuePool,
+                **POOL_OPTIONS,
+            )
+            instrument(_engines["sync_read"], "sync_read")
+        return _engines["sync_read"]
+
+
+def get_async_engine(read: bool = False):
+    """
+    AsyncEngine основной базы (read - реплики) или None, если асинхронный
+    режим выключен
+    """
+    if not settings.ASYNC_DB_ENABLED:
+        return None
+    if read and not settings.DATABASE_READ_URL:
+        read = False
+    name = "async_read" if read else "async"
+    with _lock:
+        if name not in _engines:
+            _engines[name] = create_async_engine(
+                get_async_database_url(read),
+                poolclass=TimedAsyncQueuePool,
+                **POOL_OPTIONS,
+            )
+            # EXPLAIN в фоновом потоке со своим циклом событий: через
+            # драйвер asyncpg, который понимает параметры запроса
+            instrument(
+                _engines[name].sync_engine,
+                name,
+                functools.partial(async_explain_engine, read),
+            )
+        return _engines[name]
+
+
+async def dispose_engines() -> None:
+    """Закрывает соединения пулов; следующее обращение создаст движки"""
+    with _lock:
+        engines = list(_engines.values())
+        _engines.clear()
+    SessionLocal.configure(bind=None)
+    ReadSessionLocal.configure(bind=None)
+    async_session_factory.cache_clear()
+    for bind in engines:
+        if isinstance(bind, AsyncEngine):
+            await bind.dispose()
+        else:
+            bind.dispose()
+
+
+@metrics.on_collect
+def collect_pools() -> None:
+    """Состояние пулов уже созданных движков; новые движки не создаются"""
+    with _lock:
+        engines = dict(_engines)
+    for metric in POOL_METRICS:
+        metric.clear()
+    for name, bind in engines.items():
+        if isinstance(bind, AsyncEngine):
+            bind = bind.sync_engine
+        status = pool_status(bind)
+        labels = (name,)
+        POOL_SIZE.set(status["size"], labels)
+        POOL_CHECKED_OUT.set(status["checked_out"], labels)
+        POOL_OVERFLOW.set(status["overflow"], labels)
+        POOL_CHECKOUTS.set(status["checkouts"], labels)
+        POOL_TIMEOUTS.set(status["timeouts"], labels)
+        POOL_WAIT.set(status["wait_total_seconds"], labels)
+
+
+class LazySessionmaker(sessionmaker):
+    """sessionmaker, который привязывается к движку при первой сессии"""
+
+    def __init__(self, get_bind=get_engine, **kw):
+        super().__init__(**kw)
+        self.get_bind = get_bind
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=self.get_bind())
+        return super().__call__(**local_kw)
+
+
+def __getattr__(name):
+    # Совместимость: engine и async_engine остаются атрибутами модуля
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    if name == "read_engine":
+        return get_read_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+SessionLocal = LazySessionmaker(autocommit=False, autoflush=False)
+# Сессии GET-запросов; без DATABASE_READ_URL идут в ту же базу
+ReadSessionLocal = LazySessionmaker(
+    get_read_engine, autocommit=False, autoflush=False
+)
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
+# Расширения, без которых create_all не создаст схему: тип geometry и
+# индексы gin_trgm_ops. Под Alembic их создают миграции 01 и 02
+EXTENSIONS = ("postgis", "pg_trgm")
+
+
+def create_extensions() -> None:
+    with get_engine().begin() as conn:
+        for name in EXTENSIONS:
+            conn.execute(text(f"CREATE EXTENSION IF NOT EXISTS {name}"))
+
+
+@functools.lru_cache(maxsize=None)
+def postgis_version() -> str:
+    """Версия PostGIS; проверяется один раз за процесс"""
+    with get_engine().connect() as conn:
+        return conn.execute(text("SELECT PostGIS_Full_Version()")).scalar()
+
+
+class RecentWrites:
+    """
+    Когда клиент (ключ API, проверенный app.auth) последний раз писал в
+    базу. Пока не прошло READ_YOUR_WRITES_WINDOW секунд, его GET-запросы
+    читают из основной базы: реплика может ещё не получить только что
+    записанное
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._until = {}
+
+    def touch(self, key: str) -> None:
+        until = time.monotonic() + settings.READ_YOUR_WRITES_WINDOW
+        with self._lock:
+            self._until[key] = until
+
+    def active(self, key: str) -> bool:
+        with self._lock:
+            until = self._until.get(key)
+            if until is None:
+                return False
+            if until > time.monotonic():
+                return True
+            del self._until[key]
+            return False
+
+
+recent_writes = RecentWrites()
+
+READ_METHODS = ("GET", "HEAD")
+# Ключ Session.info: сессия клиента, закреплённого за основной базой после
+# записи (pinned_to_primary); app.cache не кэширует такие ответы
+PINNED_TO_PRIMARY = "pinned_to_primary"
+
+
+def reads_from_replica(request: Request) -> bool:
+    """
+    GET-запрос клиента, который давно не писал, обслуживает реплика;
+    запись, чтение сразу после неё и чтение при отставшей реплике -
+    основная база
+    """
+    if not settings.DATABASE_READ_URL:
+        return False
+    if request.method not in READ_METHODS:
+        return False
+    if replica_lag.lagging():
+        return False
+    return not recent_writes.active(client_identity(request))
+
+
+def pinned_to_primary(request: Request) -> bool:
+    """
+    GET клиента, который только что писал, при настроенной реплике: он
+    читает основную базу, и общий кэш ответов ему не годится - там может
+    лежать ответ реплики, ещё не получившей его запись
+    """
+    return (
+        bool(settings.DATABASE_READ_URL)
+        and request.method in READ_METHODS
+        and recent_writes.active(client_identity(request))
+    )
+
+
+def session_factory(request: Request) -> sessionmaker:
+    """Фабрика сессий для запроса, см. reads_from_replica"""
+    if reads_from_replica(request):
+        return ReadSessionLocal
+    return SessionLocal
+
+
+def get_db(request: Request):
+    if request.method not in READ_METHODS:
+        # Окно отсчитывается и от начала записи: GET, пришедший, пока
+        # запись ещё идёт, тоже читает из основной базы
+        recent_writes.touch(client_identity(request))
+    db = session_factory(request)()
+    db.info[PINNED_TO_PRIMARY] = pinned_to_primary(request)
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+        if request.method not in READ_METHODS:
+            recent_writes.touch(client_identity(request))
+
+
+def lsn_bytes(lsn: str) -> int:
+    """Позиция в WAL из записи вида 16/B374D848"""
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def replica_status() -> Optional[dict]:
+    """
+    Отставание реплики от основной базы: по времени последней применённой
+    транзакции и в байтах WAL; None - реплика не настроена. Когда реплика
+    применила всё полученное, отставание по времени 0, а не время с
+    последней записи на основной базе
+    """
+    if not settings.DATABASE_READ_URL:
+        return None
+    with get_read_engine().connect() as conn:
+        in_recovery, replayed, lag = conn.execute(
+            text(
+                "SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn(),"
+                " CASE WHEN pg_last_wal_receive_lsn()"
+                " = pg_last_wal_replay_lsn() THEN 0"
+                " ELSE extract(epoch FROM"
+                " now() - pg_last_xact_replay_timestamp()) END"
+            )
+        ).one()
+    if not in_recovery:
+        # Отдельный экземпляр, а не потоковая реплика (например, вторая
+        # локальная база): отставание не определено
+        return {"in_recovery": False, "lag_seconds": None, "lag_bytes": None}
+    with get_engine().connect() as conn:
+        current = conn.execute(text("SELECT pg_current_wal_lsn()")).scalar()
+    lag_bytes = None
+    if replayed is not None:
+        lag_bytes = max(lsn_bytes(str(current)) - lsn_bytes(str(replayed)), 0)
+    return {
+        "in_recovery": True,
+        "lag_seconds": float(lag) if lag is not None else None,
+        "lag_bytes": lag_bytes,
+    }
+
+
+class ReplicaLag:
+    """
+    Последнее замеренное отставание реплики. lagging() не ждёт замера:
+    устаревший замер обновляется в фоновом потоке, а до его результата
+    действует прежний. Реплика, которая не ответила на замер, считается
+    отставшей
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lag_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self._checking = False
+
+    def update(
+        self, lag_seconds: Optional[float], error: Optional[str] = None
+    ) -> None:
+        with self._lock:
+            self.lag_seconds = lag_seconds
+            self.error = error
+            self.checked_at = time.monotonic()
+            self._checking = False
+
+    def check(self) -> None:
+        try:
+            status = replica_status()
+        except Exception as e:
+            self.update(None, str(e))
+            return
+        self.update(status["lag_seconds"] if status else None)
+
+    def lagging(self) -> bool:
+        if settings.REPLICA_MAX_LAG <= 0:
+            return False
+        with self._lock:
+            stale = (
+                self.checked_at is None
+                or time.monotonic() - self.checked_at
+                >= settings.REPLICA_LAG_CHECK_INTERVAL
+            )
+            if stale and not self._checking:
+                self._checking = True
+                threading.Thread(
+                    target=self.check, name="replica-lag", daemon=True
+                ).start()
+            if self.error is not None:
+                return True
+            # Отдельный экземпляр вместо потоковой реплики: отставание не
+            # определено, см. replica_status
+            return (
+                self.lag_seconds is not None
+                and self.lag_seconds > settings.REPLICA_MAX_LAG
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_lag_seconds": settings.REPLICA_MAX_LAG,
+                "measured_lag_seconds": self.lag_seconds,
+                "error": self.error,
+            }
+
+
+replica_lag = ReplicaLag()
+
+
+class QueryCounter:
+    """Считает SQL-запросы, выполненные движком внутри блока with"""
+
+    def __init__(self, bind=None):
+        self.bind = bind if bind is not None else get_engine()
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _on_execute(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.bind, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.bind, "before_cursor_execute", self._on_execute)
+
+
+def get_async_database_url(read: bool = False) -> str:
+    if settings.ASYNC_DATABASE_URL and not read:
+        return settings.ASYNC_DATABASE_URL
+    # Тот же сервер, но через драйвер asyncpg
+    url = make_url(
+        settings.DATABASE_READ_URL if read else SQLALCHEMY_DATABASE_URL
+    )
+    return url.set(drivername="postgresql+asyncpg").render_as_string(
+        hide_password=False
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def async_explain_engine(read: bool = False) -> AsyncEngine:
+    """
+    AsyncEngine без пула для EXPLAIN медленных асинхронных запросов:
+    соединения пула привязаны к циклу событий приложения, а EXPLAIN идёт
+    в фоновом потоке со своим циклом
+    """
+    return create_async_engine(
+        get_async_database_url(read), poolclass=NullPool
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def async_session_factory(read: bool = False) -> async_sessionmaker:
+    return async_sessionmaker(
+        get_async_engine(read), autoflush=False, expire_on_commit=False
+    )
+
+
+async def get_async_db(request: Request):
+    async with async_session_factory(reads_from_replica(request))() as db:
+        db.info[PINNED_TO_PRIMARY] = pinned_to_primary(request)
+        yield db
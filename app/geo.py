@@ -0,0 +1,77 @@
+import math
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+BBox = Tuple[float, float, float, float]
+
+# Длина градуса на эллипсоиде WGS 84: меньше всего у широты - на экваторе,
+# у долготы - на экваторе, дальше умножается на cos(широты). Рамка вокруг
+# круга строится по ним с запасом, чтобы не потерять точки у её краёв
+METERS_PER_DEGREE_LAT = 110_574
+METERS_PER_DEGREE_LON = 111_320
+BOX_MARGIN = 1.01
+
+
+def parse_bbox(bbox: str) -> BBox:
+    """
+    Область из параметра вида bbox=min_lon,min_lat,max_lon,max_lat.
+    min_lon > max_lon - область через 180-й меридиан.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (
+            float(v) for v in bbox.split(",")
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="bbox - min_lon,min_lat,max_lon,max_lat"
+        )
+    if not (
+        -180 <= min_lon <= 180
+        and -180 <= max_lon <= 180
+        and -90 <= min_lat <= max_lat <= 90
+    ):
+        raise HTTPException(
+            status_code=400, detail="bbox вне допустимых границ"
+        )
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def check_coordinates(
+    latitude: Optional[float],
+    longitude: Optional[float],
+    radius: Optional[float],
+) -> None:
+    """Точка поиска задаётся целиком или не задаётся вовсе"""
+    coordinates = [latitude, longitude, radius]
+    if any(v is not None for v in coordinates) and None in coordinates:
+        raise HTTPException(
+            status_code=400,
+            detail="latitude, longitude и radius задаются вместе",
+        )
+
+
+def radius_bbox(latitude: float, longitude: float, radius_km: float) -> BBox:
+    """
+    Рамка (min_lon, min_lat, max_lon, max_lat), гарантированно содержащая
+    круг радиуса radius_km. Через 180-й меридиан - min_lon > max_lon, у
+    полюса - все долготы.
+    """
+    meters = radius_km * 1000 * BOX_MARGIN
+    d_lat = meters / METERS_PER_DEGREE_LAT
+    min_lat = max(-90.0, latitude - d_lat)
+    max_lat = min(90.0, latitude + d_lat)
+    # Долгота сжимается сильнее всего на самой далёкой от экватора широте
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat < 1e-9:
+        return -180.0, min_lat, 180.0, max_lat
+    d_lon = meters / (METERS_PER_DEGREE_LON * cos_lat)
+    if d_lon >= 180:
+        return -180.0, min_lat, 180.0, max_lat
+    min_lon = longitude - d_lon
+    max_lon = longitude + d_lon
+    if min_lon < -180:
+        min_lon += 360
+    if max_lon > 180:
+        max_lon -= 360
+    return min_lon, min_lat, max_lon, max_lat
@@ -0,0 +1,253 @@
+"""
+Потоковый импорт справочника из CSV или JSONL.
+
+Одна запись - здание и (необязательно) организация в нём:
+
+    address,latitude,longitude,name,phone_numbers,activities
+    "ул. Ленина, 50",56.8386,60.5950,ДоброЗайм,+7 (343) 311-21-21,Займы;Кредиты
+
+В JSONL поле activities может быть списком. Записи читаются пачками,
+каждая пачка попадает в базу через COPY во временные таблицы и несколько
+INSERT ... SELECT, точки передаются готовым EWKB. Записи сопоставляются по
+естественным ключам с уникальными индексами: здания - по адресу и
+координатам, организации - по зданию и названию. Повторный или
+параллельный импорт не создаёт дублей (INSERT ... ON CONFLICT), а
+изменённый телефон организации обновляется; виды деятельности только
+добавляются.
+
+    python -m app.importer data.csv --batch-size 20000
+"""
+
+import argparse
+import csv
+import io
+import json
+import struct
+import sys
+import time
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+
+from app.database import get_engine
+
+# EWKB точки: little-endian, тип Point с флагом SRID, SRID, X, Y
+EWKB_POINT_HEADER = struct.pack("<BII", 1, 0x20000001, 4326)
+
+
+def point_ewkb(latitude: float, longitude: float) -> str:
+    return (EWKB_POINT_HEADER + struct.pack("<dd", longitude, latitude)).hex()
+
+
+def read_records(path: str, fmt: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def parse_activities(value) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(";")
+    return [name.strip() for name in value if name.strip()]
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows(cursor, table: str, columns: List[str], rows: Iterable):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(v) for v in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer
+    )
+
+
+class Importer:
+    def __init__(self, connection):
+        self.connection = connection
+        self.activity_ids: Dict[str, int] = {}
+
+    def prepare(self) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE import_buildings ("
+                " ord integer, address text, location geometry(Point, 4326)"
+                ") ON COMMIT DELETE ROWS"
+            )
+            cursor.execute(
+                "CREATE TEMP TABLE import_organizations ("
+                " ord integer, name text, phone_numbers text,"
+                " building_id integer"
+                ") ON COMMIT DELETE ROWS"
+            )
+            cursor.execute("SELECT id, name FROM activities")
+            self.activity_ids = {name: i for i, name in cursor.fetchall()}
+        self.connection.commit()
+
+    def _activity_ids(self, cursor, names: Iterable[str]) -> Dict[str, int]:
+        missing = sorted(set(names) - self.activity_ids.keys())
+        if missing:
+            # Неизвестные виды деятельности заводятся корневыми
+            cursor.execute(
+                "INSERT INTO activities (name) SELECT unnest(%s::text[]) "
+                "RETURNING id, name",
+                (missing,),
+            )
+            self.activity_ids.update(
+                {name: i for i, name in cursor.fetchall()}
+            )
+        return self.activity_ids
+
+    def import_batch(self, records: List[dict]) -> None:
+        with self.connection.cursor() as cursor:
+            copy_rows(
+                cursor,
+                "import_buildings",
+                ["ord", "address", "location"],
+                (
+                    (
+                        ord_,
+                        r["address"],
+                        point_ewkb(
+                            float(r["latitude"]), float(r["longitude"])
+                        ),
+                    )
+                    for ord_, r in enumerate(records)
+                ),
+            )
+            # Других полей у здания нет: ключ (address, location) и есть
+            # вся запись, обновлять нечего
+            cursor.execute(
+                "INSERT INTO buildings (address, location) "
+                "SELECT DISTINCT s.address, s.location "
+                "FROM import_buildings s "
+                "ON CONFLICT (address, location) DO NOTHING"
+            )
+            cursor.execute(
+                "SELECT DISTINCT ON (s.ord) s.ord, b.id "
+                "FROM import_buildings s JOIN buildings b"
+                " ON b.address = s.address AND b.location = s.location "
+                "ORDER BY s.ord, b.id"
+            )
+            building_ids = dict(cursor.fetchall())
+
+            organizations = [
+                (ord_, r["name"], r.get("phone_numbers"), building_ids[ord_])
+                for ord_, r in enumerate(records)
+                if r.get("name")
+            ]
+            if organizations:
+                self._import_organizations(cursor, records, organizations)
+        self.connection.commit()
+
+    def _import_organizations(self, cursor, records, organizations) -> None:
+        copy_rows(
+            cursor,
+            "import_organizations",
+            ["ord", "name", "phone_numbers", "building_id"],
+            organizations,
+        )
+        # ON CONFLICT DO UPDATE не может дважды обновить одну строку, поэтому
+        # из повторов в пачке берётся последняя запись; строка без изменений
+        # не переписывается
+        cursor.execute(
+            "INSERT INTO organizations (name, phone_numbers, building_id) "
+            "SELECT DISTINCT ON (s.building_id, s.name)"
+            " s.name, s.phone_numbers, s.building_id "
+            "FROM import_organizations s "
+            "ORDER BY s.building_id, s.name, s.ord DESC "
+            "ON CONFLICT (building_id, name) DO UPDATE"
+            " SET phone_numbers = excluded.phone_numbers"
+            " WHERE organizations.phone_numbers"
+            " IS DISTINCT FROM excluded.phone_numbers"
+        )
+        cursor.execute(
+            "SELECT DISTINCT ON (s.ord) s.ord, o.id "
+            "FROM import_organizations s JOIN organizations o"
+            " ON o.name = s.name AND o.building_id = s.building_id "
+            "ORDER BY s.ord, o.id"
+        )
+        organization_ids = dict(cursor.fetchall())
+
+        activities = {
+            ord_: parse_activities(records[ord_].get("activities"))
+            for ord_, *_ in organizations
+        }
+        activity_ids = self._activity_ids(
+            cursor, (n for names in activities.values() for n in names)
+        )
+        links = sorted(
+            {
+                (organization_ids[ord_], activity_ids[name])
+                for ord_, names in activities.items()
+                for name in names
+            }
+        )
+        if links:
+            cursor.execute(
+                "INSERT INTO organization_activity"
+                " (organization_id, activity_id) "
+                "SELECT * FROM unnest(%s::integer[], %s::integer[]) "
+                "ON CONFLICT DO NOTHING",
+                ([o for o, _ in links], [a for _, a in links]),
+            )
+
+
+def batches(records: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("path")
+    parser.add_argument(
+        "--format",
+        choices=["csv", "jsonl"],
+        help="по умолчанию определяется по расширению файла",
+    )
+    parser.add_argument("--batch-size", type=int, default=20000)
+    args = parser.parse_args()
+    fmt = args.format or ("jsonl" if args.path.endswith(".jsonl") else "csv")
+
+    connection = get_engine().raw_connection()
+    try:
+        importer = Importer(connection)
+        importer.prepare()
+        started = time.perf_counter()
+        total = 0
+        for batch in batches(read_records(args.path, fmt), args.batch_size):
+            importer.import_batch(batch)
+            total += len(batch)
+            elapsed = time.perf_counter() - started
+            print(
+                f"{total} записей, {total / elapsed:,.0f} записей/с",
+                file=sys.stderr,
+            )
+    finally:
+        connection.close()
+    print(f"Импорт завершён: {total} записей", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
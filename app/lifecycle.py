@@ -0,0 +1,185 @@
+"""
+Запуск и остановка приложения.
+
+Импорт app.main не трогает базу: ожидание базы, create_all и прогрев
+кэшей выполняются в фоне из lifespan, пока процесс уже принимает
+соединения. /healthz отвечает сразу, /readyz - только когда запуск
+завершён и база доступна. С SNAPSHOT_PATH база не нужна: запуск только
+загружает снимок справочника.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app import snapshot
+from app.activity_tree import activity_tree
+from app.config import settings
+from app.database import (
+    Base,
+    SessionLocal,
+    create_extensions,
+    get_engine,
+    get_read_engine,
+    postgis_version,
+)
+from app.spatial_index import building_index
+
+logger = logging.getLogger("app.lifecycle")
+
+WarmUp = Callable[[], None]
+# Прогрев выполняется по порядку после подключения к базе; ошибка одного
+# шага логируется и не мешает остальным
+_warmups: List[Tuple[str, WarmUp]] = []
+
+
+def warmup(name: str):
+    """Регистрирует функцию прогрева, выполняемую при запуске"""
+
+    def decorator(func: WarmUp) -> WarmUp:
+        _warmups.append((name, func))
+        return func
+
+    return decorator
+
+
+class Readiness:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = "starting"
+        self.error: Optional[str] = None
+        self.steps: Dict[str, dict] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def step(self, name: str, started: float, error=None) -> None:
+        with self._lock:
+            self.steps[name] = {
+                "duration_ms": round((time.perf_counter() - started) * 1000),
+                "ok": error is None,
+            }
+            if error is not None:
+                self.steps[name]["error"] = str(error)
+
+    def finish(self, error=None) -> None:
+        with self._lock:
+            self.state = "ready" if error is None else "failed"
+            self.error = str(error) if error is not None else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "error": self.error,
+                "steps": dict(self.steps),
+            }
+
+
+readiness = Readiness()
+
+
+class StartupStopped(Exception):
+    """Приложение останавливается, не дождавшись конца запуска"""
+
+
+def wait_for_db(timeout: float, stop: threading.Event) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            ping_db()
+            return
+        except Exception:
+            if time.monotonic() >= deadline:
+                raise
+        if stop.wait(1):
+            raise StartupStopped()
+
+
+def ping_db() -> None:
+    """Основная база и реплика (если задан DATABASE_READ_URL) отвечают"""
+    with get_engine().connect() as conn:
+        conn.execute(text("SELECT 1"))
+    if settings.DATABASE_READ_URL:
+        with get_read_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+
+@warmup("postgis")
+def check_postgis() -> None:
+    logger.info("PostGIS %s", postgis_version())
+
+
+@warmup("activity_tree")
+def load_activity_tree() -> None:
+    with SessionLocal() as db:
+        activity_tree.load(db)
+
+
+@warmup("spatial_index")
+def load_spatial_index() -> None:
+    if settings.SPATIAL_INDEX_ENABLED:
+        with SessionLocal() as db:
+            building_index.load(db)
+
+
+def load_snapshot() -> None:
+    """Режим снимка: база не нужна, запуск - отображение снимка в память"""
+    started = time.perf_counter()
+    try:
+        snapshot.load(settings.SNAPSHOT_PATH)
+    except Exception as e:
+        logger.exception("snapshot load failed")
+        readiness.step("snapshot", started, e)
+        readiness.finish(e)
+        return
+    readiness.step("snapshot", started)
+    readiness.finish()
+    logger.info("ready", extra={"fields": readiness.snapshot()})
+
+
+def startup(stop: threading.Event) -> None:
+    """
+    Подключение к базе, схема и прогрев; выполняется в фоновом потоке.
+    stop - остановка приложения: отмена задачи в lifespan поток не
+    прерывает, поэтому он сам проверяет stop в ожидании базы и между
+    шагами прогрева
+    """
+    if settings.SNAPSHOT_PATH:
+        load_snapshot()
+        return
+    try:
+        started = time.perf_counter()
+        wait_for_db(settings.DB_WAIT_TIMEOUT, stop)
+        readiness.step("database", started)
+        if settings.DB_CREATE_ALL:
+            started = time.perf_counter()
+            create_extensions()
+            Base.metadata.create_all(bind=get_engine())
+            readiness.step("create_all", started)
+    except StartupStopped:
+        logger.info("startup stopped")
+        return
+    except Exception as e:
+        logger.exception("startup failed")
+        readiness.finish(e)
+        return
+
+    for name, func in _warmups:
+        if stop.is_set():
+            logger.info("startup stopped")
+            return
+        started = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            logger.exception("warm-up %s failed", name)
+            readiness.step(name, started, e)
+        else:
+            readiness.step(name, started)
+    readiness.finish()
+    logger.info("ready", extra={"fields": readiness.snapshot()})
@@ -0,0 +1,182 @@
+"""
+Ограничение нагрузки от клиентов.
+
+Каждый API-ключ получает корзину токенов (запросов в секунду с запасом
+на всплеск) и предел одновременных запросов; дорогие гео-маршруты
+дополнительно ограничены своей корзиной на ключ. Превышение отсекается
+сразу ответом 429 с Retry-After, до выполнения маршрута и до очереди за
+соединением с базой.
+"""
+
+import math
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+from fastapi import HTTPException
+from starlette.status import HTTP_429_TOO_MANY_REQUESTS
+
+from app.config import settings
+
+
+class KeyLimits(NamedTuple):
+    rate: float
+    burst: int
+    concurrency: int
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> Optional[float]:
+        """None - запрос пропущен, иначе через сколько секунд повторить"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return None
+            return (1 - self._tokens) / self.rate
+
+
+class ClientLimiter:
+    def __init__(self, limits: KeyLimits):
+        self.limits = limits
+        self.bucket = TokenBucket(limits.rate, limits.burst)
+        self.route_buckets: Dict[str, TokenBucket] = {}
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def route_bucket(self, name: str, rate: float, burst: int) -> TokenBucket:
+        with self._lock:
+            bucket = self.route_buckets.get(name)
+            if bucket is None:
+                bucket = self.route_buckets[name] = TokenBucket(rate, burst)
+            return bucket
+
+    def try_enter(self) -> bool:
+        with self._lock:
+            if self.active >= self.limits.concurrency:
+                return False
+            self.active += 1
+            return True
+
+    def leave(self) -> None:
+        with self._lock:
+            self.active -= 1
+
+
+def check_limits(source: str, limits: KeyLimits) -> KeyLimits:
+    """Нулевая скорость корзины - деление на ноль в TokenBucket.take"""
+    positive = (
+        math.isfinite(limits.rate)
+        and limits.rate > 0
+        and limits.burst >= 1
+        and limits.concurrency >= 1
+    )
+    if not positive:
+        raise ValueError(
+            f"{source}: пределы должны быть положительными числами, получено "
+            f"rate={limits.rate}, burst={limits.burst}, "
+            f"concurrency={limits.concurrency}"
+        )
+    return limits
+
+
+def parse_api_keys() -> Dict[str, KeyLimits]:
+    """
+    Ключи из API_KEY, ADMIN_API_KEY и API_KEYS. В API_KEYS ключи через
+    запятую, у ключа можно задать свои пределы: key:rate:burst:concurrency,
+    пустое поле - предел по умолчанию. Ошибка в записи - ValueError при импорте, с
+    номером записи, но без самого ключа
+    """
+    default = check_limits(
+        "RATE_LIMIT_*",
+        KeyLimits(
+            settings.RATE_LIMIT_PER_SECOND,
+            settings.RATE_LIMIT_BURST,
+            settings.RATE_LIMIT_CONCURRENCY,
+        ),
+    )
+    check_limits(
+        "GEO_RATE_LIMIT_*",
+        KeyLimits(
+            settings.GEO_RATE_LIMIT_PER_SECOND,
+            settings.GEO_RATE_LIMIT_BURST,
+            default.concurrency,
+        ),
+    )
+    keys = {}
+    for key in (settings.API_KEY, settings.ADMIN_API_KEY):
+        if key:
+            keys[key] = default
+    for number, item in enumerate((settings.API_KEYS or "").split(","), 1):
+        source = f"API_KEYS, запись {number}"
+        key, *overrides = item.strip().split(":")
+        if not key:
+            if overrides:
+                raise ValueError(f"{source}: пустой ключ")
+            continue
+        if len(overrides) > len(default):
+            raise ValueError(f"{source}: ожидается key:rate:burst:concurrency")
+        values = list(default)
+        for i, value in enumerate(overrides):
+            if not value:
+                continue
+            try:
+                values[i] = type(values[i])(value)
+            except ValueError:
+                raise ValueError(
+                    f"{source}: {KeyLimits._fields[i]} - не число: {value!r}"
+                ) from None
+        keys[key] = check_limits(source, KeyLimits(*values))
+    return keys
+
+
+def too_many_requests(retry_after: float, detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class Limiter:
+    def __init__(self, keys: Dict[str, KeyLimits]):
+        self.clients = {
+            key: ClientLimiter(limits) for key, limits in keys.items()
+        }
+
+    def is_known(self, api_key: str) -> bool:
+        return api_key in self.clients
+
+    def enter(self, api_key: str) -> ClientLimiter:
+        """Учитывает запрос клиента; без ошибки - вызвать leave()"""
+        client = self.clients[api_key]
+        retry_after = client.bucket.take()
+        if retry_after is not None:
+            raise too_many_requests(retry_after, "Rate limit exceeded")
+        if not client.try_enter():
+            raise too_many_requests(1, "Too many concurrent requests")
+        return client
+
+    def check_route(
+        self, api_key: str, name: str, rate: float, burst: int
+    ) -> None:
+        bucket = self.clients[api_key].route_bucket(name, rate, burst)
+        retry_after = bucket.take()
+        if retry_after is not None:
+            raise too_many_requests(
+                retry_after, f"Rate limit exceeded for {name} requests"
+            )
+
+
+limiter = Limiter(parse_api_keys())
@@ -1,46 +1,196 @@
-import time
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
 
-from fastapi import Depends, FastAPI, HTTPException
-from sqlalchemy import text
-from sqlalchemy.orm import Session
+from anyio import to_thread
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from psycopg2 import errorcodes
+from sqlalchemy.exc import IntegrityError
 
+from app import lifecycle, metrics
 from app.auth import verify_api_key
-from app.database import Base, engine, get_db
-from app.routes import activities, buildings, organizations
+from app.config import settings
+from app.database import dispose_engines, threadpool_size
+from app.routes import (
+    activities,
+    async_activities,
+    async_buildings,
+    async_organizations,
+    buildings,
+    export,
+    internal,
+    organizations,
+    tiles,
+)
+from app.tracing import TracingMiddleware, configure_logging
 
+configure_logging()
+logger = logging.getLogger("app")
 
-def wait_for_db():
-    max_attempts = 60
-    for attempt in range(max_attempts):
-        try:
-            with engine.connect() as conn:
-                conn.execute(text("SELECT 1"))
-                break
-        except Exception as e:
-            if attempt == max_attempts - 1:
-                raise e
-            time.sleep(1)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Синхронные маршруты выполняются в пуле потоков anyio (40 по
+    # умолчанию); больше потоков, чем соединений, - это запросы, которые
+    # молча ждут соединение с уже занятым потоком
+    to_thread.current_default_thread_limiter().total_tokens = threadpool_size()
+    # Ожидание базы и прогрев идут в фоне: процесс сразу принимает
+    # соединения, а балансировщик ждёт /readyz
+    stop = threading.Event()
+    startup = asyncio.create_task(to_thread.run_sync(lifecycle.startup, stop))
+    yield
+    if not startup.done():
+        # Отмена задачи не прерывает поток: он видит stop в ожидании базы
+        # (не дольше секунды) и между шагами прогрева. Текущий шаг
+        # прогрева дожидаться до конца не обязательно
+        stop.set()
+        await asyncio.wait({startup}, timeout=5)
+        startup.cancel()
+    await dispose_engines()
 
-wait_for_db()
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="API App Directory",
     description="REST API для справочника Организаций, Зданий и Деятельности",
     version="1.0.0",
-    dependencies=[Depends(verify_api_key)],
+    lifespan=lifespan,
 )
+if settings.METRICS_ENABLED:
+    # Внутри TracingMiddleware: метрикам нужен его подсчёт SQL-запросов
+    app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+
+
+@app.exception_handler(IntegrityError)
+async def integrity_error(request: Request, exc: IntegrityError):
+    """
+    Здание с теми же адресом и координатами или организация с тем же
+    названием в том же здании уже есть: у них уникальные естественные
+    ключи импорта
+    """
+    if getattr(exc.orig, "pgcode", None) != errorcodes.UNIQUE_VIOLATION:
+        raise exc
+    return JSONResponse({"detail": "Record already exists"}, status_code=409)
+
+
+# Ключ проверяется на всех маршрутах, кроме проб /healthz, /readyz и
+# /metrics
+protected = [Depends(verify_api_key)]
+
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Процесс жив; после неудачного запуска - 503, чтобы его перезапустили"""
+    if lifecycle.readiness.state == "failed":
+        return JSONResponse(lifecycle.readiness.snapshot(), status_code=503)
+    return {"status": "ok"}
+
+
+@app.get("/readyz", include_in_schema=False)
+def readyz():
+    """Запуск завершён и база отвечает (в режиме снимка - снимок загружен)"""
+    state = lifecycle.readiness.snapshot()
+    if lifecycle.readiness.ready and settings.SNAPSHOT_PATH:
+        return state
+    if lifecycle.readiness.ready:
+        try:
+            lifecycle.ping_db()
+        except Exception as e:
+            state["state"] = "database_unavailable"
+            state["error"] = str(e)
+            return JSONResponse(state, status_code=503)
+        return state
+    return JSONResponse(state, status_code=503)
 
+
+if settings.METRICS_ENABLED:
+
+    @app.get("/metrics", include_in_schema=False)
+    async def read_metrics():
+        """Метрики процесса в формате Prometheus"""
+        return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# Выгрузка раньше маршрутов /{id}, иначе "export" разбирается как id
+app.include_router(export.router, tags=["Export"], dependencies=protected)
+
+if settings.ASYNC_DB_ENABLED and not settings.SNAPSHOT_PATH:
+    # Асинхронные GET-маршруты регистрируются первыми и перекрывают
+    # синхронные с тем же контрактом, поэтому в схему OpenAPI не
+    # попадают; запись остаётся на синхронных маршрутах
+    app.include_router(
+        async_organizations.router,
+        prefix="/organizations",
+        include_in_schema=False,
+        dependencies=protected,
+    )
+    app.include_router(
+        async_buildings.router,
+        prefix="/buildings",
+        include_in_schema=False,
+        dependencies=protected,
+    )
+    app.include_router(
+        async_activities.router,
+        prefix="/activities",
+        include_in_schema=False,
+        dependencies=protected,
+    )
+
+# Маршруты чтения берут данные из app.source: из базы или, с
+# SNAPSHOT_PATH, из снимка
 app.include_router(
-    organizations.router, prefix="/organizations", tags=["Organizations"]
+    organizations.router,
+    prefix="/organizations",
+    tags=["Organizations"],
+    dependencies=protected,
 )
-app.include_router(buildings.router, prefix="/buildings", tags=["Buildings"])
 app.include_router(
-    activities.router, prefix="/activities", tags=["Activities"]
+    buildings.router,
+    prefix="/buildings",
+    tags=["Buildings"],
+    dependencies=protected,
+)
+app.include_router(
+    activities.router,
+    prefix="/activities",
+    tags=["Activities"],
+    dependencies=protected,
+)
+app.include_router(
+    tiles.router, prefix="/tiles", tags=["Tiles"], dependencies=protected
+)
+
+if not settings.SNAPSHOT_PATH:
+    # Снимок только для чтения: маршрутов записи в этом режиме нет
+    app.include_router(
+        organizations.write_router,
+        prefix="/organizations",
+        tags=["Organizations"],
+        dependencies=protected,
+    )
+    app.include_router(
+        buildings.write_router,
+        prefix="/buildings",
+        tags=["Buildings"],
+        dependencies=protected,
+    )
+    app.include_router(
+        activities.write_router,
+        prefix="/activities",
+        tags=["Activities"],
+        dependencies=protected,
+    )
+app.include_router(
+    internal.router,
+    prefix="/internal",
+    tags=["Internal"],
+    dependencies=protected,
 )
 
 
-@app.get("/")
+@app.get("/", dependencies=protected)
 def read_root():
     return {"message": "Welcome to the API App Directory!"}
@@ -0,0 +1,267 @@
+"""
+Метрики Prometheus.
+
+Счётчики и гистограммы живут в памяти процесса и отдаются на /metrics в
+текстовом формате Prometheus. MetricsMiddleware на каждый запрос
+обновляет несколько счётчиков: длительность по шаблону маршрута, запросы
+в работе, число SQL-запросов и время в базе (их считают события движка в
+app.tracing). Пулы соединений и потоков опрашиваются только при сборе
+метрик, через функции on_collect. При нескольких воркерах каждый процесс
+отдаёт свои метрики, суммирует их Prometheus.
+"""
+
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from anyio import to_thread
+
+from app.tracing import current_trace
+
+Labels = Tuple[str, ...]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+METHODS = frozenset(
+    ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS")
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+        registry.append(self)
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            return [
+                (self.name, _labels(self.labels, labels), value)
+                for labels, value in sorted(self._values.items())
+            ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+
+class Histogram(Metric):
+    """Накопительные корзины считаются при выдаче, в памяти - по корзине"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Счётчики по корзинам и сумма последним элементом
+                series = self._series[labels] = [0] * len(self.buckets) + [0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            series = sorted(
+                (labels, list(values))
+                for labels, values in self._series.items()
+            )
+        samples = []
+        for labels, values in series:
+            count = 0
+            for bound, observed in zip(self.buckets, values):
+                count += observed
+                samples.append(
+                    (
+                        self.name + "_bucket",
+                        _labels(
+                            self.labels + ("le",), labels + (_number(bound),)
+                        ),
+                        count,
+                    )
+                )
+            rendered = _labels(self.labels, labels)
+            samples.append((self.name + "_sum", rendered, values[-1]))
+            samples.append((self.name + "_count", rendered, count))
+        return samples
+
+
+registry: List[Metric] = []
+_collectors: List[Callable[[], None]] = []
+
+
+def on_collect(func: Callable[[], None]) -> Callable[[], None]:
+    """Регистрирует функцию, обновляющую метрики перед каждой выдачей"""
+    _collectors.append(func)
+    return func
+
+
+def render() -> bytes:
+    """Все метрики процесса в текстовом формате Prometheus"""
+    for collect in _collectors:
+        collect()
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_number(value)}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route template and status",
+    ("method", "route", "status"),
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("method", "route"),
+    LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being processed"
+)
+DB_STATEMENTS = Histogram(
+    "db_statements_per_request",
+    "SQL statements executed per HTTP request",
+    ("method", "route"),
+    STATEMENT_BUCKETS,
+)
+DB_TIME = Histogram(
+    "db_time_per_request_seconds",
+    "Time spent executing SQL per HTTP request",
+    ("method", "route"),
+    LATENCY_BUCKETS,
+)
+THREADPOOL_SIZE = Gauge(
+    "threadpool_size", "Worker threads for synchronous routes"
+)
+THREADPOOL_BUSY = Gauge(
+    "threadpool_busy", "Worker threads currently running a route"
+)
+
+
+@on_collect
+def collect_threadpool() -> None:
+    limiter = to_thread.current_default_thread_limiter()
+    THREADPOOL_SIZE.set(limiter.total_tokens)
+    THREADPOOL_BUSY.set(limiter.borrowed_tokens)
+
+
+def route_template(scope) -> str:
+    """Шаблон маршрута ("/buildings/{building_id}"), а не путь запроса"""
+    route = scope.get("route")
+    if route is None:
+        # Неизвестные пути не раздувают число временных рядов
+        return "unmatched"
+    # FastAPI с include_router без копирования маршрутов хранит шаблон с
+    # префиксом роутера в своём контексте, а route.path - без префикса
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    return getattr(context, "path_format", None) or route.path
+
+
+class MetricsMiddleware:
+    """
+    ASGI-обёртка: длительность, статус и SQL-запросы каждого запроса.
+    Подключается внутри TracingMiddleware, чтобы видеть его Trace
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_PROGRESS.inc(amount=-1)
+            method = scope["method"]
+            labels = (
+                method if method in METHODS else "other",
+                route_template(scope),
+            )
+            REQUESTS.inc(labels + (str(status),))
+            REQUEST_DURATION.observe(elapsed, labels)
+            trace = current_trace()
+            if trace is not None:
+                DB_STATEMENTS.observe(trace.db_count, labels)
+                DB_TIME.observe(trace.db_time, labels)
@@ -1,9 +1,15 @@
-from typing import Optional
-
 from geoalchemy2 import Geometry
-from geoalchemy2.shape import to_shape
-from sqlalchemy import Column, Float, ForeignKey, Integer, String, Table
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Column,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Table,
+    func,
+)
+from sqlalchemy.orm import column_property, relationship
 
 from app.database import Base
 
@@ -17,7 +23,11 @@ organization_activity = Table(
         primary_key=True,
     ),
     Column(
-        "activity_id", Integer, ForeignKey("activities.id"), primary_key=True
+        "activity_id",
+        Integer,
+        ForeignKey("activities.id"),
+        primary_key=True,
+        index=True,
     ),
 )
 
@@ -35,6 +45,24 @@ class Organization(Base):
     )
     building = relationship("Building", back_populates="organizations")
 
+    # Естественный ключ для INSERT ... ON CONFLICT импорта; покрывает и
+    # внешний ключ building_id
+    __table_args__ = (
+        Index(
+            "uq_organizations_building_id_name",
+            "building_id",
+            "name",
+            unique=True,
+        ),
+        # Поиск по названию: ILIKE '%...%' и похожесть pg_trgm
+        Index(
+            "ix_organizations_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
+
     def to_schema(self):
         from app.schemas import OrganizationWithRelations
 
@@ -53,21 +81,25 @@ class Building(Base):
     id = Column(Integer, primary_key=True, index=True)
     address = Column(String, nullable=False)
     location = Column(Geometry('POINT', srid=4326))
+    # Координаты считает PostGIS в том же SELECT, без разбора WKB в Python
+    latitude = column_property(func.ST_Y(location))
+    longitude = column_property(func.ST_X(location))
     organizations = relationship("Organization", back_populates="building")
 
-    @property
-    def latitude(self) -> Optional[float]:
-        if self.location is None:
-            return None
-        shape = to_shape(self.location)
-        return shape.y
-
-    @property
-    def longitude(self) -> Optional[float]:
-        if self.location is None:
-            return None
-        shape = to_shape(self.location)
-        return shape.x
+    # Поиск по радиусу и ближайшие считаются по geography(location); обычный
+    # GiST-индекс location (его создаёт GeoAlchemy2) такое выражение не
+    # обслуживает
+    __table_args__ = (
+        Index(
+            "ix_buildings_location_geography",
+            func.Geography(location),
+            postgresql_using="gist",
+        ),
+        # Естественный ключ для INSERT ... ON CONFLICT импорта
+        Index(
+            "uq_buildings_address_location", "address", "location", unique=True
+        ),
+    )
 
     def to_schema(self):
         from app.schemas import BuildingWithRelations
@@ -85,13 +117,23 @@ class Activity(Base):
     __tablename__ = "activities"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
-    parent_id = Column(Integer, ForeignKey("activities.id"))
+    parent_id = Column(Integer, ForeignKey("activities.id"), index=True)
     organizations = relationship(
         "Organization",
         secondary=organization_activity,
         back_populates="activities",
     )
 
+    # Поиск вида деятельности по названию
+    __table_args__ = (
+        Index(
+            "ix_activities_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
+
     def to_schema(self):
         from app.schemas import ActivityWithRelations
 
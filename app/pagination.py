@@ -0,0 +1,91 @@
+import base64
+import json
+import math
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Не больше стольких записей в выборке по ids и в пакетном создании
+MAX_BATCH_SIZE = 1000
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List[Any]]:
+    """Разбирает непрозрачный cursor из запроса; None - первая страница"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+    return values
+
+
+def decode_id_cursor(cursor: Optional[str]) -> Optional[int]:
+    """id последней строки предыдущей страницы из курсора списка"""
+    values = decode_cursor(cursor, 1)
+    if values is None:
+        return None
+    if not _is_int(values[0]):
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+    return values[0]
+
+
+def decode_rank_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    """(rank, id) последней строки предыдущей страницы из курсора поиска"""
+    values = decode_cursor(cursor, 2)
+    if values is None:
+        return None
+    rank, last_id = values
+    if not _is_number(rank) or not _is_int(last_id):
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+    return rank, last_id
+
+
+def _is_int(value: Any) -> bool:
+    # bool - подкласс int, но в курсоре это подделка
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_number(value: Any) -> bool:
+    if isinstance(value, float):
+        return math.isfinite(value)
+    return _is_int(value)
+
+
+def parse_ids(
+    ids: Optional[str], max_ids: int = MAX_BATCH_SIZE
+) -> Optional[List[int]]:
+    """Список id из параметра вида ids=1,2,3; None - параметр не задан"""
+    if ids is None:
+        return None
+    try:
+        values = [int(v) for v in ids.split(",") if v.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="ids - список целых чисел через запятую"
+        )
+    if len(values) > max_ids:
+        raise HTTPException(
+            status_code=400, detail=f"Не больше {max_ids} ids за запрос"
+        )
+    return list(dict.fromkeys(values))
+
+
+def set_page_cursor(response: Response, page: list, limit: int) -> None:
+    """Полная страница - возможно, есть следующая: отдаём курсор на неё"""
+    if page and len(page) == limit:
+        set_next_cursor(response, encode_cursor(page[-1].id))
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
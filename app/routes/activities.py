@@ -1,49 +1,88 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from app import crud, schemas
+from app.cache import ALL_TAGS, cached
 from app.database import get_db
+from app.pagination import (
+    MAX_BATCH_SIZE,
+    decode_id_cursor,
+    parse_ids,
+    set_page_cursor,
+)
+from app.source import DataSource, get_source
 
 router = APIRouter()
+# Запись - отдельный роутер: в режиме снимка он не подключается
+write_router = APIRouter()
+
+
+def activity_or_404(activity):
+    if activity is None:
+        raise HTTPException(status_code=404, detail="Activity not found")
+    return activity
 
 
 @router.get("/", response_model=List[schemas.Activity])
+@cached(List[schemas.Activity], ("activities",))
 def read_activities(
-    skip: int = 0, limit: int = 100, db: Session = Depends(get_db)
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы из X-Next-Cursor"
+    ),
+    ids: Optional[str] = Query(
+        None, description="Выборка по списку id через запятую: ids=1,2,3"
+    ),
+    source: DataSource = Depends(get_source),
 ):
     """Получение списка всех видов деятельности"""
-    activities = crud.get_activities(db, skip=skip, limit=limit)
+    requested_ids = parse_ids(ids)
+    if requested_ids is not None:
+        return source.get_activities_by_ids(requested_ids)
+    activities = source.get_activities(
+        skip=skip, limit=limit, after_id=decode_id_cursor(cursor)
+    )
+    set_page_cursor(response, activities, limit)
     return activities
 
 
 @router.get("/{activity_id}", response_model=schemas.ActivityWithRelations)
-def read_activity(activity_id: int, db: Session = Depends(get_db)):
+@cached(schemas.ActivityWithRelations, ALL_TAGS)
+def read_activity(activity_id: int, source: DataSource = Depends(get_source)):
     """Получение информации о конкретном виде деятельности"""
-    activity = crud.get_activity(db, activity_id)
-    if activity is None:
-        raise HTTPException(status_code=404, detail="Activity not found")
-    return activity
+    return activity_or_404(source.get_activity(activity_id))
 
 
 @router.get(
     "/{activity_id}/organizations",
     response_model=List[schemas.OrganizationWithoutActivities],
 )
+@cached(List[schemas.OrganizationWithoutActivities], ALL_TAGS)
 def read_activity_organizations(
-    activity_id: int, db: Session = Depends(get_db)
+    activity_id: int, source: DataSource = Depends(get_source)
 ):
     """Получение списка организаций для конкретного вида деятельности"""
-    activity = crud.get_activity(db, activity_id)
-    if activity is None:
-        raise HTTPException(status_code=404, detail="Activity not found")
-    return activity.organizations
+    return activity_or_404(source.get_activity(activity_id)).organizations
 
 
-@router.post("/", response_model=schemas.Activity)
+@write_router.post("/", response_model=schemas.Activity)
 def create_activity(
     activity: schemas.ActivityCreate, db: Session = Depends(get_db)
 ):
     """Создание нового вида деятельности"""
     return crud.create_activity(db, activity)
+
+
+@write_router.post("/batch", response_model=List[schemas.Activity])
+def create_activities(
+    activities: List[schemas.ActivityCreate] = Body(
+        ..., max_length=MAX_BATCH_SIZE
+    ),
+    db: Session = Depends(get_db),
+):
+    """Создание нескольких видов деятельности одним запросом"""
+    return crud.create_activities(db, activities)
@@ -0,0 +1,37 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import async_crud
+from app.pagination import decode_id_cursor, parse_ids, set_page_cursor
+from app.routes import activities
+from app.routes.activities import activity_or_404
+from app.routes.async_mirror import AsyncMirror
+
+# Асинхронные двойники GET-маршрутов app.routes.activities: параметры,
+# описание, проверки и кэш - оттуда, здесь только вызовы async_crud
+mirror = AsyncMirror(activities.router)
+router = mirror.router
+
+
+@mirror(activities.read_activities)
+async def read_activities(
+    response, skip, limit, cursor, ids, db: AsyncSession
+):
+    requested_ids = parse_ids(ids)
+    if requested_ids is not None:
+        return await async_crud.get_activities_by_ids(db, requested_ids)
+    result = await async_crud.get_activities(
+        db, skip=skip, limit=limit, after_id=decode_id_cursor(cursor)
+    )
+    set_page_cursor(response, result, limit)
+    return result
+
+
+@mirror(activities.read_activity)
+async def read_activity(activity_id, db: AsyncSession):
+    return activity_or_404(await async_crud.get_activity(db, activity_id))
+
+
+@mirror(activities.read_activity_organizations)
+async def read_activity_organizations(activity_id, db: AsyncSession):
+    activity = await async_crud.get_activity(db, activity_id)
+    return activity_or_404(activity).organizations
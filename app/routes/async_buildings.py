@@ -0,0 +1,69 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import async_crud
+from app.geo import parse_bbox
+from app.pagination import decode_id_cursor, parse_ids, set_page_cursor
+from app.routes import buildings
+from app.routes.async_mirror import AsyncMirror
+from app.routes.buildings import building_or_404, with_distance
+
+# Асинхронные двойники GET-маршрутов app.routes.buildings: параметры,
+# описание, проверки и кэш - оттуда, здесь только вызовы async_crud
+mirror = AsyncMirror(buildings.router)
+router = mirror.router
+
+
+@mirror(buildings.get_buildings_in_bounds)
+async def get_buildings_in_bounds(
+    min_lat, max_lat, min_lon, max_lon, limit, db: AsyncSession
+):
+    return await async_crud.get_buildings_in_bounds(
+        db, min_lat, max_lat, min_lon, max_lon, limit
+    )
+
+
+@mirror(buildings.get_nearest_buildings)
+async def get_nearest_buildings(latitude, longitude, limit, db: AsyncSession):
+    return with_distance(
+        await async_crud.get_nearest_buildings(db, latitude, longitude, limit)
+    )
+
+
+@mirror(buildings.search_buildings_in_radius)
+async def search_buildings_in_radius(
+    latitude, longitude, radius, limit, db: AsyncSession
+):
+    return await async_crud.get_buildings_in_radius(
+        db, latitude, longitude, radius, limit
+    )
+
+
+@mirror(buildings.get_building_clusters)
+async def get_building_clusters(bbox, zoom, top_activities, db: AsyncSession):
+    min_lon, min_lat, max_lon, max_lat = parse_bbox(bbox)
+    return await async_crud.get_building_clusters(
+        db, min_lat, max_lat, min_lon, max_lon, zoom, top_activities
+    )
+
+
+@mirror(buildings.read_building)
+async def read_building(building_id, db: AsyncSession):
+    return building_or_404(await async_crud.get_building(db, building_id))
+
+
+@mirror(buildings.read_buildings)
+async def read_buildings(response, skip, limit, cursor, ids, db: AsyncSession):
+    requested_ids = parse_ids(ids)
+    if requested_ids is not None:
+        return await async_crud.get_buildings_by_ids(db, requested_ids)
+    result = await async_crud.get_buildings(
+        db, skip=skip, limit=limit, after_id=decode_id_cursor(cursor)
+    )
+    set_page_cursor(response, result, limit)
+    return result
+
+
+@mirror(buildings.read_building_organizations)
+async def read_building_organizations(building_id, db: AsyncSession):
+    building_or_404(await async_crud.get_building(db, building_id))
+    return await async_crud.get_organizations_by_building(db, building_id)
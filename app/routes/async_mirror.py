@@ -0,0 +1,67 @@
+import inspect
+
+from fastapi import APIRouter, Depends
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_async_db
+
+
+class AsyncMirror:
+    """
+    Асинхронные двойники GET-маршрутов синхронного роутера.
+
+    Путь, схема ответа, зависимости маршрута, параметры запроса (Query),
+    описание и кэш двойник берёт у синхронного эндпоинта, поэтому они не
+    расходятся; своё у двойника только тело с вызовами async_crud.
+    Параметр source синхронного эндпоинта у двойника - db: AsyncSession.
+    """
+
+    def __init__(self, sync_router: APIRouter):
+        self.router = APIRouter()
+        self._routes = {
+            route.endpoint: route
+            for route in sync_router.routes
+            if isinstance(route, APIRoute)
+        }
+
+    def __call__(self, sync_endpoint):
+        route = self._routes[sync_endpoint]
+
+        def decorator(func):
+            signature = inspect.signature(sync_endpoint)
+            names = [
+                "db" if name == "source" else name
+                for name in signature.parameters
+            ]
+            if list(inspect.signature(func).parameters) != names:
+                raise TypeError(
+                    f"{func.__qualname__}: параметры должны быть {names}"
+                )
+            func.__signature__ = signature.replace(
+                parameters=[
+                    (
+                        parameter.replace(
+                            name="db",
+                            annotation=AsyncSession,
+                            default=Depends(get_async_db),
+                        )
+                        if parameter.name == "source"
+                        else parameter
+                    )
+                    for parameter in signature.parameters.values()
+                ]
+            )
+            func.__doc__ = sync_endpoint.__doc__
+            # Кэш синхронного эндпоинта: та же схема ответа и те же теги
+            cache = getattr(sync_endpoint, "cache", None)
+            self.router.add_api_route(
+                route.path,
+                cache(func) if cache else func,
+                response_model=route.response_model,
+                dependencies=route.dependencies,
+                methods=route.methods,
+            )
+            return func
+
+        return decorator
@@ -0,0 +1,72 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import async_crud
+from app.pagination import (
+    decode_id_cursor,
+    decode_rank_cursor,
+    parse_ids,
+    set_page_cursor,
+)
+from app.routes import organizations
+from app.routes.async_mirror import AsyncMirror
+from app.routes.organizations import (
+    organization_or_404,
+    organization_search,
+    search_page,
+)
+
+# Асинхронные двойники GET-маршрутов app.routes.organizations: параметры,
+# описание, проверки и кэш - оттуда, здесь только вызовы async_crud
+mirror = AsyncMirror(organizations.router)
+router = mirror.router
+
+
+@mirror(organizations.read_organizations)
+async def read_organizations(
+    response, skip, limit, cursor, ids, db: AsyncSession
+):
+    requested_ids = parse_ids(ids)
+    if requested_ids is not None:
+        return await async_crud.get_organizations_by_ids(db, requested_ids)
+    result = await async_crud.get_organizations(
+        db, skip=skip, limit=limit, after_id=decode_id_cursor(cursor)
+    )
+    set_page_cursor(response, result, limit)
+    return result
+
+
+@mirror(organizations.search_organizations)
+async def search_organizations(
+    response,
+    name,
+    latitude,
+    longitude,
+    radius,
+    activity_name,
+    activity_depth,
+    building_id,
+    limit,
+    cursor,
+    db: AsyncSession,
+):
+    search = organization_search(
+        name,
+        latitude,
+        longitude,
+        radius,
+        activity_name,
+        activity_depth,
+        building_id,
+        limit,
+    )
+    ranked = await async_crud.search_organizations(
+        db, search, decode_rank_cursor(cursor)
+    )
+    return search_page(response, ranked, limit)
+
+
+@mirror(organizations.read_organization)
+async def read_organization(organization_id, db: AsyncSession):
+    return organization_or_404(
+        await async_crud.get_organization(db, organization_id)
+    )
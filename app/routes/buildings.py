@@ -1,16 +1,53 @@
-from typing import List
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy.sql import text
 
 from app import crud, schemas
+from app.auth import geo_rate_limit
+from app.cache import ALL_TAGS, cached
 from app.database import get_db
+from app.geo import parse_bbox
+from app.pagination import (
+    MAX_BATCH_SIZE,
+    decode_id_cursor,
+    parse_ids,
+    set_page_cursor,
+)
+from app.source import DataSource, get_source
 
 router = APIRouter()
+# Запись - отдельный роутер: в режиме снимка он не подключается
+write_router = APIRouter()
 
 
-@router.get("/bounds", response_model=List[schemas.BuildingWithRelations])
+def with_distance(
+    buildings_with_distance: List[Tuple[object, float]],
+) -> List[schemas.BuildingWithDistance]:
+    return [
+        schemas.BuildingWithDistance(
+            id=building.id,
+            address=building.address,
+            latitude=building.latitude,
+            longitude=building.longitude,
+            distance=distance,
+        )
+        for building, distance in buildings_with_distance
+    ]
+
+
+def building_or_404(building):
+    if building is None:
+        raise HTTPException(status_code=404, detail="Building not found")
+    return building
+
+
+@router.get(
+    "/bounds",
+    response_model=List[schemas.BuildingWithRelations],
+    dependencies=[Depends(geo_rate_limit)],
+)
+@cached(List[schemas.BuildingWithRelations], ALL_TAGS)
 def get_buildings_in_bounds(
     min_lat: float = Query(
         ..., ge=-90, le=90, description="Минимальная широта"
@@ -24,38 +61,44 @@ def get_buildings_in_bounds(
     max_lon: float = Query(
         ..., ge=-180, le=180, description="Максимальная долгота"
     ),
-    db: Session = Depends(get_db),
+    limit: int = Query(
+        1000, ge=1, le=10000, description="Максимальное количество зданий"
+    ),
+    source: DataSource = Depends(get_source),
 ):
-    """Получение зданий в заданных географических границах"""
-    return crud.get_buildings_in_bounds(db, min_lat, max_lat, min_lon, max_lon)
+    """
+    Получение зданий в заданных географических границах по возрастанию id;
+    min_lon > max_lon - границы через 180-й меридиан
+    """
+    return source.get_buildings_in_bounds(
+        min_lat, max_lat, min_lon, max_lon, limit
+    )
 
 
-@router.get("/nearest", response_model=List[schemas.BuildingWithDistance])
+@router.get(
+    "/nearest",
+    response_model=List[schemas.BuildingWithDistance],
+    dependencies=[Depends(geo_rate_limit)],
+)
+@cached(List[schemas.BuildingWithDistance], ("buildings",))
 def get_nearest_buildings(
     latitude: float = Query(..., ge=-90, le=90, description="Широта"),
     longitude: float = Query(..., ge=-180, le=180, description="Долгота"),
     limit: int = Query(5, ge=1, le=50, description="Количество результатов"),
-    db: Session = Depends(get_db),
+    source: DataSource = Depends(get_source),
 ):
     """Получение ближайших зданий с расстоянием"""
-    buildings_with_distance = crud.get_nearest_buildings(
-        db, latitude, longitude, limit
+    return with_distance(
+        source.get_nearest_buildings(latitude, longitude, limit)
     )
-    return [
-        schemas.BuildingWithDistance(
-            id=building.id,
-            address=building.address,
-            latitude=building.latitude,
-            longitude=building.longitude,
-            distance=distance,
-        )
-        for building, distance in buildings_with_distance
-    ]
 
 
 @router.get(
-    "/search/radius", response_model=List[schemas.BuildingWithRelations]
+    "/search/radius",
+    response_model=List[schemas.BuildingWithRelations],
+    dependencies=[Depends(geo_rate_limit)],
 )
+@cached(List[schemas.BuildingWithRelations], ALL_TAGS)
 def search_buildings_in_radius(
     latitude: float = Query(..., ge=-90, le=90, description="Широта"),
     longitude: float = Query(..., ge=-180, le=180, description="Долгота"),
@@ -63,34 +106,63 @@ def search_buildings_in_radius(
     limit: int = Query(
         10, ge=1, le=100, description="Максимальное количество результатов"
     ),
-    db: Session = Depends(get_db),
+    source: DataSource = Depends(get_source),
 ):
     """Поиск зданий в радиусе от точки"""
-    print(
-        f"Received search request: lat={latitude}, lon={longitude}, radius={radius}km"
-    )
+    return source.get_buildings_in_radius(latitude, longitude, radius, limit)
 
-    # Проверяем работу PostGIS
-    test_query = "SELECT PostGIS_Version(), PostGIS_Full_Version();"
-    result = db.execute(text(test_query)).first()
-    print(f"PostGIS version: {result[0]}")
 
-    return crud.get_buildings_in_radius(db, latitude, longitude, radius, limit)
+@router.get(
+    "/clusters",
+    response_model=schemas.BuildingClusters,
+    dependencies=[Depends(geo_rate_limit)],
+)
+@cached(schemas.BuildingClusters, ALL_TAGS)
+def get_building_clusters(
+    bbox: str = Query(..., description="min_lon,min_lat,max_lon,max_lat"),
+    zoom: int = Query(..., ge=0, le=22, description="Масштаб карты"),
+    top_activities: int = Query(
+        3, ge=0, le=10, description="Сколько видов деятельности на кластер"
+    ),
+    source: DataSource = Depends(get_source),
+):
+    """
+    Здания области, сгруппированные в кластеры по сетке масштаба zoom.
+    Если зданий немного, вместо кластеров возвращаются сами здания.
+    """
+    min_lon, min_lat, max_lon, max_lat = parse_bbox(bbox)
+    return source.get_building_clusters(
+        min_lat, max_lat, min_lon, max_lon, zoom, top_activities
+    )
 
 
 @router.get("/{building_id}", response_model=schemas.BuildingWithRelations)
-def read_building(building_id: int, db: Session = Depends(get_db)):
-    building = crud.get_building(db, building_id)
-    if building is None:
-        raise HTTPException(status_code=404, detail="Building not found")
-    return building
+@cached(schemas.BuildingWithRelations, ALL_TAGS)
+def read_building(building_id: int, source: DataSource = Depends(get_source)):
+    return building_or_404(source.get_building(building_id))
 
 
 @router.get("/", response_model=List[schemas.BuildingWithRelations])
+@cached(List[schemas.BuildingWithRelations], ALL_TAGS)
 def read_buildings(
-    skip: int = 0, limit: int = 100, db: Session = Depends(get_db)
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы из X-Next-Cursor"
+    ),
+    ids: Optional[str] = Query(
+        None, description="Выборка по списку id через запятую: ids=1,2,3"
+    ),
+    source: DataSource = Depends(get_source),
 ):
-    buildings = crud.get_buildings(db, skip=skip, limit=limit)
+    requested_ids = parse_ids(ids)
+    if requested_ids is not None:
+        return source.get_buildings_by_ids(requested_ids)
+    buildings = source.get_buildings(
+        skip=skip, limit=limit, after_id=decode_id_cursor(cursor)
+    )
+    set_page_cursor(response, buildings, limit)
     return buildings
 
 
@@ -98,17 +170,29 @@ def read_buildings(
     "/{building_id}/organizations",
     response_model=List[schemas.OrganizationWithRelations],
 )
+@cached(List[schemas.OrganizationWithRelations], ALL_TAGS)
 def read_building_organizations(
-    building_id: int, db: Session = Depends(get_db)
+    building_id: int, source: DataSource = Depends(get_source)
 ):
-    building = crud.get_building(db, building_id)
-    if building is None:
-        raise HTTPException(status_code=404, detail="Building not found")
-    return crud.get_organizations_by_building(db, building_id)
+    building_or_404(source.get_building(building_id))
+    return source.get_organizations_by_building(building_id)
 
 
-@router.post("/", response_model=schemas.BuildingWithRelations)
+@write_router.post("/", response_model=schemas.BuildingWithRelations)
 def create_building(
     building: schemas.BuildingCreate, db: Session = Depends(get_db)
 ):
     return crud.create_building(db, building)
+
+
+@write_router.post(
+    "/batch", response_model=List[schemas.BuildingWithRelations]
+)
+def create_buildings(
+    buildings: List[schemas.BuildingCreate] = Body(
+        ..., max_length=MAX_BATCH_SIZE
+    ),
+    db: Session = Depends(get_db),
+):
+    """Создание нескольких зданий одним запросом"""
+    return crud.create_buildings(db, buildings)
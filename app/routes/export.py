@@ -0,0 +1,155 @@
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from app import schemas
+from app.auth import hold_concurrency_slot
+from app.geo import check_coordinates
+from app.serialization import serializer
+from app.source import DataSource, get_source
+
+# Маршруты выгрузки живут отдельно от /organizations/{id} и регистрируются
+# раньше всех, чтобы в асинхронном режиме "/export" не принимался за id
+router = APIRouter()
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def stream_ndjson(batches: Iterable[Sequence], schema) -> Iterator[bytes]:
+    """Пачки строк источника в NDJSON, по одной пачке на кусок ответа"""
+    serialize = serializer(schema)
+    for batch in batches:
+        yield b"".join(serialize(row) + b"\n" for row in batch)
+
+
+def ndjson_response(
+    request: Request, batches: Iterable[Sequence], schema
+) -> StreamingResponse:
+    return StreamingResponse(
+        hold_concurrency_slot(request, stream_ndjson(batches, schema)),
+        media_type=NDJSON_MEDIA_TYPE,
+    )
+
+
+def export_search(
+    name: Optional[str],
+    latitude: Optional[float],
+    longitude: Optional[float],
+    radius: Optional[float],
+    activity_name: Optional[str],
+    activity_depth: int,
+    building_id: Optional[int],
+) -> schemas.OrganizationSearch:
+    """Фильтры выгрузки организаций: как у поиска, но без лимита"""
+    check_coordinates(latitude, longitude, radius)
+    return schemas.OrganizationSearch(
+        name=name or None,
+        latitude=latitude,
+        longitude=longitude,
+        radius=radius,
+        activity_name=activity_name or None,
+        activity_depth=activity_depth,
+        building_id=building_id,
+        limit=None,
+    )
+
+
+def export_bounds(
+    min_lat: Optional[float],
+    max_lat: Optional[float],
+    min_lon: Optional[float],
+    max_lon: Optional[float],
+) -> Optional[Tuple[float, float, float, float]]:
+    """Границы выгрузки зданий; None - без границ"""
+    bounds = (min_lat, max_lat, min_lon, max_lon)
+    if None in bounds:
+        if any(v is not None for v in bounds):
+            raise HTTPException(
+                status_code=400,
+                detail="min_lat, max_lat, min_lon и max_lon задаются вместе",
+            )
+        return None
+    if min_lat > max_lat:
+        # min_lon > max_lon допустимо - границы через 180-й меридиан
+        raise HTTPException(
+            status_code=400, detail="Минимум широты больше максимума"
+        )
+    return bounds
+
+
+@router.get("/organizations/export")
+def export_organizations(
+    request: Request,
+    name: Optional[str] = Query(None, description="Название организации"),
+    latitude: Optional[float] = Query(
+        None, ge=-90, le=90, description="Широта"
+    ),
+    longitude: Optional[float] = Query(
+        None, ge=-180, le=180, description="Долгота"
+    ),
+    radius: Optional[float] = Query(
+        None, gt=0, description="Радиус поиска в км"
+    ),
+    activity_name: Optional[str] = Query(
+        None, description="Название вида деятельности"
+    ),
+    activity_depth: int = Query(
+        3, ge=0, le=100, description="Глубина поиска по подвидам деятельности"
+    ),
+    building_id: Optional[int] = Query(None, description="ID здания"),
+    source: DataSource = Depends(get_source),
+):
+    """
+    Выгрузка организаций в NDJSON (одна организация на строку). Фильтры
+    те же, что у /organizations/search, все необязательные.
+    """
+    search = export_search(
+        name,
+        latitude,
+        longitude,
+        radius,
+        activity_name,
+        activity_depth,
+        building_id,
+    )
+    return ndjson_response(
+        request,
+        source.export_organizations(search),
+        schemas.OrganizationWithRelations,
+    )
+
+
+@router.get("/buildings/export")
+def export_buildings(
+    request: Request,
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lon: Optional[float] = Query(None, ge=-180, le=180),
+    max_lon: Optional[float] = Query(None, ge=-180, le=180),
+    source: DataSource = Depends(get_source),
+):
+    """Выгрузка зданий в NDJSON, при необходимости только в границах"""
+    bounds = export_bounds(min_lat, max_lat, min_lon, max_lon)
+    return ndjson_response(
+        request, source.export_buildings(bounds), schemas.BuildingWithRelations
+    )
+
+
+@router.get("/activities/export")
+def export_activities(
+    request: Request,
+    activity_name: Optional[str] = Query(
+        None, description="Выгрузить только это поддерево"
+    ),
+    activity_depth: int = Query(
+        3, ge=0, le=100, description="Глубина поддерева"
+    ),
+    source: DataSource = Depends(get_source),
+):
+    """Выгрузка видов деятельности в NDJSON"""
+    return ndjson_response(
+        request,
+        source.export_activities(activity_name, activity_depth),
+        schemas.Activity,
+    )
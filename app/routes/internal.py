@@ -0,0 +1,96 @@
+from anyio import to_thread
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app import database, snapshot
+from app.auth import verify_admin_key
+from app.cache import response_cache
+from app.config import settings
+from app.slow_queries import ORDERS, slow_query_log
+from app.tiles import tile_cache
+
+router = APIRouter()
+
+
+@router.get("/cache")
+def read_cache_stats():
+    """Статистика кэша ответов этого процесса"""
+    return response_cache.stats()
+
+
+@router.get("/tiles")
+def read_tile_cache_stats():
+    """Статистика кэша векторных тайлов этого процесса"""
+    return tile_cache.stats()
+
+
+@router.get("/snapshot")
+def read_snapshot_stats():
+    """Загруженный снимок справочника; null - приложение работает с базой"""
+    loaded = snapshot.current()
+    return loaded.stats() if loaded is not None else None
+
+
+@router.get("/replica")
+def read_replica_status():
+    """
+    Отставание реплики GET-запросов от основной базы и последний фоновый
+    замер, по которому GET-запросы уходят в основную базу при отставании
+    больше max_lag_seconds; null - реплика не настроена
+    """
+    status = database.replica_status()
+    if status is None:
+        return None
+    return {**status, **database.replica_lag.stats()}
+
+
+@router.get("/slow-queries", dependencies=[Depends(verify_admin_key)])
+def read_slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    order: str = Query("total", description="total, max или count"),
+):
+    """
+    Самые дорогие медленные SQL-запросы этого процесса по отпечатку: время,
+    самый медленный пример с параметрами и план EXPLAIN (ANALYZE, BUFFERS).
+    Параметры принадлежат запросам любых клиентов, поэтому только с
+    ADMIN_API_KEY
+    """
+    if order not in ORDERS:
+        raise HTTPException(
+            status_code=400, detail=f"order: одно из {', '.join(ORDERS)}"
+        )
+    return {
+        **slow_query_log.stats(),
+        "top": slow_query_log.top(limit, order),
+    }
+
+
+@router.get("/pool")
+async def read_pool_stats():
+    """
+    Пулы соединений и потоков этого процесса: сколько соединений выдано,
+    сколько сверх pool_size, сколько ждали выдачи и сколько потоков занято
+    синхронными маршрутами
+    """
+    limiter = to_thread.current_default_thread_limiter()
+    threadpool = {
+        "size": limiter.total_tokens,
+        "busy": limiter.borrowed_tokens,
+    }
+    if settings.SNAPSHOT_PATH:
+        # Режим снимка: соединений с базой нет
+        return {"threadpool": threadpool}
+    stats = {
+        "sync": database.pool_status(database.engine),
+        "threadpool": threadpool,
+    }
+    if settings.DATABASE_READ_URL:
+        stats["sync_read"] = database.pool_status(database.read_engine)
+    if database.async_engine is not None:
+        stats["async"] = database.pool_status(
+            database.async_engine.sync_engine
+        )
+        if settings.DATABASE_READ_URL:
+            stats["async_read"] = database.pool_status(
+                database.get_async_engine(read=True).sync_engine
+            )
+    return stats
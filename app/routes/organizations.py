@@ -1,24 +1,108 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from app import crud, schemas
+from app.auth import point_search_rate_limit
+from app.cache import ALL_TAGS, cached
 from app.database import get_db
+from app.geo import check_coordinates
+from app.pagination import (
+    MAX_BATCH_SIZE,
+    decode_id_cursor,
+    decode_rank_cursor,
+    encode_cursor,
+    parse_ids,
+    set_next_cursor,
+    set_page_cursor,
+)
+from app.source import DataSource, get_source
 
 router = APIRouter()
+# Запись - отдельный роутер: в режиме снимка он не подключается
+write_router = APIRouter()
+
+
+def organization_search(
+    name: Optional[str],
+    latitude: Optional[float],
+    longitude: Optional[float],
+    radius: Optional[float],
+    activity_name: Optional[str],
+    activity_depth: int,
+    building_id: Optional[int],
+    limit: int,
+) -> schemas.OrganizationSearch:
+    """Фильтры /organizations/search; 400, если не задано ни одного"""
+    check_coordinates(latitude, longitude, radius)
+    search = schemas.OrganizationSearch(
+        name=name or None,
+        latitude=latitude,
+        longitude=longitude,
+        radius=radius,
+        activity_name=activity_name or None,
+        activity_depth=activity_depth,
+        building_id=building_id,
+        limit=limit,
+    )
+    if not search.has_filters:
+        raise HTTPException(
+            status_code=400,
+            detail="Укажите параметры поиска: name, coordinates (latitude+longitude+radius), activity_name или building_id",
+        )
+    return search
+
+
+def search_page(
+    response: Response, ranked: List[Tuple[object, float]], limit: int
+) -> list:
+    """Организации страницы поиска; курсор следующей - в X-Next-Cursor"""
+    if len(ranked) == limit:
+        last, rank = ranked[-1]
+        set_next_cursor(response, encode_cursor(rank, last.id))
+    return [organization for organization, _ in ranked]
+
+
+def organization_or_404(organization):
+    if organization is None:
+        raise HTTPException(status_code=404, detail="Organization not found")
+    return organization
 
 
 @router.get("/", response_model=List[schemas.OrganizationWithRelations])
+@cached(List[schemas.OrganizationWithRelations], ALL_TAGS)
 def read_organizations(
-    skip: int = 0, limit: int = 100, db: Session = Depends(get_db)
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы из X-Next-Cursor"
+    ),
+    ids: Optional[str] = Query(
+        None, description="Выборка по списку id через запятую: ids=1,2,3"
+    ),
+    source: DataSource = Depends(get_source),
 ):
     """Получение списка всех организаций"""
-    return crud.get_organizations(db, skip=skip, limit=limit)
+    requested_ids = parse_ids(ids)
+    if requested_ids is not None:
+        return source.get_organizations_by_ids(requested_ids)
+    organizations = source.get_organizations(
+        skip=skip, limit=limit, after_id=decode_id_cursor(cursor)
+    )
+    set_page_cursor(response, organizations, limit)
+    return organizations
 
 
-@router.get("/search", response_model=List[schemas.OrganizationWithRelations])
+@router.get(
+    "/search",
+    response_model=List[schemas.OrganizationWithRelations],
+    dependencies=[Depends(point_search_rate_limit)],
+)
+@cached(List[schemas.OrganizationWithRelations], ALL_TAGS)
 def search_organizations(
+    response: Response,
     name: Optional[str] = Query(None, description="Название организации"),
     latitude: Optional[float] = Query(
         None, ge=-90, le=90, description="Широта"
@@ -32,42 +116,67 @@ def search_organizations(
     activity_name: Optional[str] = Query(
         None, description="Название вида деятельности"
     ),
-    db: Session = Depends(get_db),
+    activity_depth: int = Query(
+        3, ge=0, le=100, description="Глубина поиска по подвидам деятельности"
+    ),
+    building_id: Optional[int] = Query(None, description="ID здания"),
+    limit: int = Query(
+        100, ge=1, le=1000, description="Максимальное количество результатов"
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы из X-Next-Cursor"
+    ),
+    source: DataSource = Depends(get_source),
 ):
     """
-    Поиск организаций по различным параметрам:
+    Поиск организаций по любому сочетанию параметров (в базе - одним
+    запросом):
     - По названию
-    - По координатам в заданном радиусе
-    - По виду деятельности
+    - По координатам в заданном радиусе (результаты по расстоянию)
+    - По виду деятельности с подвидами
+    - По зданию
     """
-    if name:
-        return crud.get_organizations_by_name(db, name)
-    if all(v is not None for v in [latitude, longitude, radius]):
-        return crud.get_organizations_by_coordinates(
-            db, latitude, longitude, radius
-        )
-    if activity_name:
-        return crud.get_organizations_by_activity(db, activity_name)
-    raise HTTPException(
-        status_code=400,
-        detail="Укажите параметры поиска: name, coordinates (latitude+longitude+radius), или activity_name",
+    search = organization_search(
+        name,
+        latitude,
+        longitude,
+        radius,
+        activity_name,
+        activity_depth,
+        building_id,
+        limit,
     )
+    ranked = source.search_organizations(search, decode_rank_cursor(cursor))
+    return search_page(response, ranked, limit)
 
 
 @router.get(
     "/{organization_id}", response_model=schemas.OrganizationWithRelations
 )
-def read_organization(organization_id: int, db: Session = Depends(get_db)):
+@cached(schemas.OrganizationWithRelations, ALL_TAGS)
+def read_organization(
+    organization_id: int, source: DataSource = Depends(get_source)
+):
     """Получение информации о конкретной организации"""
-    organization = crud.get_organization(db, organization_id)
-    if organization is None:
-        raise HTTPException(status_code=404, detail="Organization not found")
-    return organization
+    return organization_or_404(source.get_organization(organization_id))
 
 
-@router.post("/", response_model=schemas.OrganizationWithRelations)
+@write_router.post("/", response_model=schemas.OrganizationWithRelations)
 def create_organization(
     organization: schemas.OrganizationCreate, db: Session = Depends(get_db)
 ):
     """Создание новой организации"""
     return crud.create_organization(db, organization)
+
+
+@write_router.post(
+    "/batch", response_model=List[schemas.OrganizationWithRelations]
+)
+def create_organizations(
+    organizations: List[schemas.OrganizationCreate] = Body(
+        ..., max_length=MAX_BATCH_SIZE
+    ),
+    db: Session = Depends(get_db),
+):
+    """Создание нескольких организаций одним запросом"""
+    return crud.create_organizations(db, organizations)
@@ -0,0 +1,56 @@
+import hashlib
+from typing import Callable
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+
+from app.config import settings
+from app.source import DataSource, get_source
+from app.tiles import MVT_MEDIA_TYPE, tile_cache, tile_exists
+
+router = APIRouter()
+
+
+def etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+def tile_response(
+    request: Request, z: int, x: int, y: int, render: Callable[[], bytes]
+) -> Response:
+    """Тайл из кэша или render() с ETag; 304, если у клиента тот же тайл"""
+    if not tile_exists(z, x, y):
+        raise HTTPException(status_code=404, detail="Tile not found")
+    tile = (z, x, y)
+    entry = tile_cache.get(tile) if settings.TILE_CACHE_ENABLED else None
+    if entry is not None:
+        body, headers = entry.body, entry.headers
+    else:
+        generation = tile_cache.generation
+        body = render()
+        headers = {"ETag": etag(body)}
+        if settings.TILE_CACHE_ENABLED:
+            tile_cache.set(tile, body, (tile,), headers, generation)
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=MVT_MEDIA_TYPE, headers=headers)
+
+
+@router.get(
+    "/{z}/{x}/{y}.mvt",
+    response_class=Response,
+    responses={200: {"content": {MVT_MEDIA_TYPE: {}}}},
+)
+def read_tile(
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    source: DataSource = Depends(get_source),
+):
+    """
+    Векторный тайл зданий (Mapbox Vector Tile, слой buildings). Ответ
+    помечен ETag: неизменившийся тайл отдаётся как 304 без тела.
+    """
+    return tile_response(
+        request, z, x, y, lambda: source.get_building_tile(z, x, y)
+    )
@@ -52,6 +52,29 @@ class BuildingWithDistance(BuildingBase):
         from_attributes = True
 
 
+class ActivityCount(BaseModel):
+    id: int
+    name: str
+    count: int  # организаций с этим видом деятельности в ячейке
+
+
+class BuildingCluster(BaseModel):
+    latitude: float  # центроид зданий ячейки
+    longitude: float
+    count: int
+    bounds: List[float]  # ячейка: [min_lon, min_lat, max_lon, max_lat]
+    top_activities: List[ActivityCount] = []
+
+
+class BuildingClusters(BaseModel):
+    zoom: int
+    cell_size: float  # сторона ячейки в градусах
+    total: int
+    clusters: List[BuildingCluster] = []
+    # Отдельные здания - только если их в области не больше порога
+    buildings: List[Building] = []
+
+
 class OrganizationBase(BaseModel):
     name: str
     phone_numbers: Optional[str] = None
@@ -97,3 +120,22 @@ class OrganizationSearch(BaseModel):
     longitude: Optional[float] = Field(None, ge=-180, le=180)
     radius: Optional[float] = Field(None, gt=0)
     activity_name: Optional[str] = Field(None, min_length=1)
+    activity_depth: int = Field(3, ge=0, le=100)
+    building_id: Optional[int] = None
+    # None - без лимита, для выгрузки
+    limit: Optional[int] = Field(100, ge=1, le=1000)
+
+    @property
+    def has_point(self) -> bool:
+        return all(
+            v is not None for v in [self.latitude, self.longitude, self.radius]
+        )
+
+    @property
+    def has_filters(self) -> bool:
+        return bool(
+            self.name
+            or self.activity_name
+            or self.building_id is not None
+            or self.has_point
+        )
@@ -0,0 +1,132 @@
+"""
+Быстрая сериализация ответов без валидации Pydantic.
+
+Данные из базы уже соответствуют схемам, поэтому для горячих схем ответ
+собирается словарями напрямую из атрибутов ORM-объектов и кодируется
+orjson. Ключи идут в порядке полей схемы, так что байты совпадают с
+TypeAdapter(schema).dump_json(). Схемы без сборщика сериализуются
+обычным путём.
+"""
+
+import typing
+from typing import Any, Callable, Dict, List, Optional
+
+import orjson
+from pydantic import TypeAdapter
+
+from app import schemas
+from app.config import settings
+
+
+def activity(a) -> dict:
+    return {"name": a.name, "parent_id": a.parent_id, "id": a.id}
+
+
+def building(b) -> dict:
+    return {
+        "address": b.address,
+        "id": b.id,
+        "latitude": b.latitude,
+        "longitude": b.longitude,
+    }
+
+
+def building_with_distance(b) -> dict:
+    return {
+        "address": b.address,
+        "id": b.id,
+        "latitude": b.latitude,
+        "longitude": b.longitude,
+        "distance": b.distance,
+    }
+
+
+def organization_without_building(o) -> dict:
+    return {
+        "name": o.name,
+        "phone_numbers": o.phone_numbers,
+        "building_id": o.building_id,
+        "id": o.id,
+        "activities": [activity(a) for a in o.activities],
+    }
+
+
+def organization_without_activities(o) -> dict:
+    return {
+        "name": o.name,
+        "phone_numbers": o.phone_numbers,
+        "building_id": o.building_id,
+        "id": o.id,
+        "building": building(o.building),
+    }
+
+
+def organization_with_relations(o) -> dict:
+    return {
+        "name": o.name,
+        "phone_numbers": o.phone_numbers,
+        "building_id": o.building_id,
+        "id": o.id,
+        "activities": [activity(a) for a in o.activities],
+        "building": building(o.building),
+    }
+
+
+def building_with_relations(b) -> dict:
+    result = building(b)
+    result["organizations"] = [
+        organization_without_building(o) for o in b.organizations
+    ]
+    return result
+
+
+def activity_with_relations(a) -> dict:
+    result = activity(a)
+    result["organizations"] = [
+        organization_without_activities(o) for o in a.organizations
+    ]
+    return result
+
+
+BUILDERS: Dict[type, Callable[[Any], dict]] = {
+    schemas.Activity: activity,
+    schemas.ActivityWithRelations: activity_with_relations,
+    schemas.Building: building,
+    schemas.BuildingWithDistance: building_with_distance,
+    schemas.BuildingWithRelations: building_with_relations,
+    schemas.OrganizationWithoutActivities: organization_without_activities,
+    schemas.OrganizationWithoutBuilding: organization_without_building,
+    schemas.OrganizationWithRelations: organization_with_relations,
+}
+
+
+def _fast_serializer(model) -> Optional[Callable[[Any], bytes]]:
+    if typing.get_origin(model) in (list, List):
+        (item,) = typing.get_args(model)
+        build = BUILDERS.get(item)
+        if build is not None:
+            return lambda rows: orjson.dumps([build(row) for row in rows])
+    else:
+        build = BUILDERS.get(model)
+        if build is not None:
+            return lambda row: orjson.dumps(build(row))
+    return None
+
+
+def serializer(model) -> Callable[[Any], bytes]:
+    """
+    Функция, превращающая результат эндпоинта со схемой model в JSON.
+
+    При FAST_SERIALIZATION_ENABLED и известной схеме - сборка словарей и
+    orjson, иначе валидация через Pydantic.
+    """
+    adapter = TypeAdapter(model)
+
+    def validated(result) -> bytes:
+        return adapter.dump_json(
+            adapter.validate_python(result, from_attributes=True)
+        )
+
+    if settings.FAST_SERIALIZATION_ENABLED:
+        return _fast_serializer(model) or validated
+    return validated
@@ -0,0 +1,304 @@
+"""
+Журнал медленных SQL-запросов.
+
+Включается SLOW_QUERY_LOG_ENABLED. События движка замеряют каждый
+запрос; запросы дольше SLOW_QUERY_MS группируются по отпечатку - тексту
+запроса без литералов и параметров, так что один и тот же поиск с
+разными координатами попадает в одну запись. Для записи хранится число
+срабатываний, суммарное и максимальное время, самый медленный пример с
+параметрами и план EXPLAIN (ANALYZE, BUFFERS). План снимается только для
+SELECT и не на пути запроса: запрос ставится в очередь, а фоновый поток
+выполняет EXPLAIN на своём соединении и записывает план, когда тот
+готов. ANALYZE выполняет запрос ещё раз, поэтому для каждого отпечатка
+не чаще раза в SLOW_QUERY_EXPLAIN_INTERVAL секунд. Самые дорогие запросы
+процесса - GET /internal/slow-queries (только с ADMIN_API_KEY: примеры и
+планы содержат параметры чужих запросов), каждое срабатывание пишется в
+лог app.slow_query.
+"""
+
+import asyncio
+import hashlib
+import logging
+import queue
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+
+logger = logging.getLogger("app.slow_query")
+
+# Сколько символов запроса и параметров хранится в примере
+SAMPLE_LIMIT = 4000
+# Сколько запросов может ждать EXPLAIN; остальные остаются без плана
+EXPLAIN_QUEUE_SIZE = 100
+ORDERS = ("total", "max", "count")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PARAMETER = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(statement: str) -> str:
+    """
+    Текст запроса без значений: литералы и параметры заменены на ?,
+    списки IN (?, ?, ...) любой длины - на (...)
+    """
+    statement = _STRING.sub("?", statement)
+    statement = _PARAMETER.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _LIST.sub("(...)", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+class SlowStatement:
+    __slots__ = (
+        "fingerprint",
+        "statement",
+        "count",
+        "total",
+        "max",
+        "last_seen",
+        "sample",
+        "plan",
+        "plan_at",
+    )
+
+    def __init__(self, key: str, statement: str):
+        self.fingerprint = key
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last_seen = 0.0
+        self.sample: Optional[dict] = None
+        self.plan: Optional[str] = None
+        # monotonic-время последней попытки EXPLAIN
+        self.plan_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "statement": self.statement,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 2),
+            "avg_ms": round(self.total / self.count * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+            "last_seen": self.last_seen,
+            "sample": self.sample,
+            "plan": self.plan,
+        }
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, max_statements: int):
+        self.threshold = threshold_ms / 1000
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._statements: Dict[str, SlowStatement] = {}
+        self.evictions = 0
+        self._explains: queue.Queue = queue.Queue(EXPLAIN_QUEUE_SIZE)
+        self._worker: Optional[threading.Thread] = None
+        self.explains_dropped = 0
+
+    def instrument(
+        self, bind, pool: str, explain_bind: Optional[Callable] = None
+    ) -> None:
+        """
+        Замер запросов движка; pool - имя пула в примерах, explain_bind() -
+        движок той же базы и того же драйвера для EXPLAIN (по умолчанию bind)
+        """
+        explain_engine = explain_bind or (lambda: bind)
+
+        def before(conn, cursor, statement, parameters, context, many):
+            conn.info["slow_query_started"] = time.perf_counter()
+
+        def after(conn, cursor, statement, parameters, context, many):
+            elapsed = time.perf_counter() - conn.info["slow_query_started"]
+            if elapsed >= self.threshold:
+                self.record(
+                    statement,
+                    parameters,
+                    context,
+                    many,
+                    elapsed,
+                    pool,
+                    explain_engine,
+                )
+
+        event.listen(bind, "before_cursor_execute", before)
+        event.listen(bind, "after_cursor_execute", after)
+
+    def record(
+        self,
+        statement,
+        parameters,
+        context,
+        many,
+        elapsed,
+        pool,
+        explain_bind: Callable,
+    ) -> None:
+        normalized = normalize(statement)
+        key = fingerprint(normalized)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                if len(self._statements) >= self.max_statements:
+                    # Вытесняется запись, стоившая меньше всего времени
+                    cheapest = min(
+                        self._statements.values(), key=lambda e: e.total
+                    )
+                    del self._statements[cheapest.fingerprint]
+                    self.evictions += 1
+                entry = self._statements[key] = SlowStatement(key, normalized)
+            entry.count += 1
+            entry.total += elapsed
+            entry.last_seen = time.time()
+            if elapsed >= entry.max:
+                entry.max = elapsed
+                entry.sample = {
+                    "statement": statement[:SAMPLE_LIMIT],
+                    "parameters": repr(parameters)[:SAMPLE_LIMIT],
+                    "duration_ms": round(elapsed * 1000, 2),
+                    "pool": pool,
+                }
+            explain = (
+                settings.SLOW_QUERY_EXPLAIN_INTERVAL > 0
+                and not many
+                and statement.lstrip()[:6].upper() == "SELECT"
+                and context is not None
+                and not context.execution_options.get("stream_results")
+                and (
+                    entry.plan_at is None
+                    or now - entry.plan_at
+                    >= settings.SLOW_QUERY_EXPLAIN_INTERVAL
+                )
+            )
+            if explain:
+                entry.plan_at = now
+        logger.warning(
+            "slow query",
+            extra={
+                "fields": {
+                    "fingerprint": key,
+                    "duration_ms": round(elapsed * 1000, 2),
+                    "pool": pool,
+                    "statement": normalized[:500],
+                }
+            },
+        )
+        if explain:
+            self._queue_explain(entry, statement, parameters, explain_bind)
+
+    def _queue_explain(self, entry, statement, parameters, explain_bind):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._explain_loop,
+                    name="slow-query-explain",
+                    daemon=True,
+                )
+                self._worker.start()
+        try:
+            self._explains.put_nowait(
+                (entry, statement, parameters, explain_bind)
+            )
+        except queue.Full:
+            with self._lock:
+                self.explains_dropped += 1
+
+    def _explain_loop(self) -> None:
+        while True:
+            entry, statement, parameters, explain_bind = self._explains.get()
+            try:
+                plan = explain_analyze(explain_bind(), statement, parameters)
+            except Exception as e:
+                plan = f"EXPLAIN failed: {e}"
+            with self._lock:
+                entry.plan = plan
+
+    def top(self, limit: int = 20, order: str = "total") -> List[dict]:
+        with self._lock:
+            entries = sorted(
+                self._statements.values(),
+                key=lambda e: getattr(e, order),
+                reverse=True,
+            )[:limit]
+            return [entry.to_dict() for entry in entries]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": settings.SLOW_QUERY_LOG_ENABLED,
+                "threshold_ms": self.threshold * 1000,
+                "explain_interval": settings.SLOW_QUERY_EXPLAIN_INTERVAL,
+                "statements": len(self._statements),
+                "max_statements": self.max_statements,
+                "evictions": self.evictions,
+                "explains_pending": self._explains.qsize(),
+                "explains_dropped": self.explains_dropped,
+            }
+
+
+def explain_analyze(engine, statement: str, parameters) -> str:
+    """
+    План запроса с фактическим временем на отдельном соединении движка.
+    Курсор DBAPI - мимо событий движка, чтобы EXPLAIN не замерялся сам;
+    транзакция откатывается
+    """
+    if isinstance(engine, AsyncEngine):
+        return asyncio.run(
+            explain_analyze_async(engine, statement, parameters)
+        )
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                "EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters
+            )
+            return "\n".join(row[0] for row in cursor.fetchall())
+        finally:
+            cursor.close()
+            connection.rollback()
+    finally:
+        connection.close()
+
+
+async def explain_analyze_async(
+    engine: AsyncEngine, statement: str, parameters
+) -> str:
+    """
+    План запроса asyncpg: параметры $1::INTEGER и позиционные значения
+    понимает только он, поэтому EXPLAIN идёт через соединение asyncpg
+    """
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        driver = raw.driver_connection
+        transaction = driver.transaction()
+        await transaction.start()
+        try:
+            rows = await driver.fetch(
+                "EXPLAIN (ANALYZE, BUFFERS) " + statement, *parameters
+            )
+        finally:
+            await transaction.rollback()
+    return "\n".join(row[0] for row in rows)
+
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=settings.SLOW_QUERY_MS,
+    max_statements=settings.SLOW_QUERY_MAX_STATEMENTS,
+)
@@ -0,0 +1,1002 @@
+"""
+Снимок справочника для развёртываний только на чтение.
+
+Команда выгрузки читает таблицы через модели в одной транзакции и пишет
+каталог: массивы NumPy (.npy) и строковые таблицы - UTF-8 подряд в .bin
+и смещения строк в .npy. Строки каждой таблицы лежат по возрастанию id,
+ссылки между таблицами - позиции строк, а связи один-ко-многим - пары
+массивов offsets/values: потомки строки i - values[offsets[i]:
+offsets[i + 1]]. Рядом лежат массивы сеточного индекса зданий (как у
+SpatialIndex) и триграммы названий организаций для поиска по похожести,
+как у pg_trgm.
+
+С SNAPSHOT_PATH приложение не подключается к базе: файлы отображаются в
+память только на чтение, поэтому воркеры uvicorn делят одну копию в
+page cache, а GET-маршруты отвечают из снимка. Путь снимка - символическая
+ссылка на каталог версии рядом с ним (path.v<время>). Новая версия
+пишется в свой каталог, а ссылка подменяется переименованием, атомарно:
+воркер, который открывает снимок в этот момент, получает старую или
+новую версию целиком. Запущенные воркеры дочитывают старую до
+перезапуска; хранятся текущая и предыдущая версии.
+
+    python -m app.snapshot /data/directory.snapshot
+"""
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import re
+import shutil
+import sys
+import time
+from collections import defaultdict
+from collections.abc import Mapping
+from datetime import datetime, timezone
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.activity_tree import ActivityTree
+from app.config import settings
+from app.crud import cluster_cell_size, clusters_response
+from app.database import SessionLocal
+from app.spatial_index import SpatialIndex
+from app.tiles import encode_point_layer, tile_bbox, tile_point
+
+FORMAT_VERSION = 1
+# Порог оператора % из pg_trgm (pg_trgm.similarity_threshold)
+SIMILARITY_THRESHOLD = 0.3
+# Слова для триграмм, как в pg_trgm: буквы и цифры
+WORD = re.compile(r"[^\W_]+")
+
+
+def trigrams(value: str) -> Set[str]:
+    """Триграммы строки по правилам pg_trgm: слово - "  слово " """
+    result = set()
+    for word in WORD.findall(value.lower()):
+        padded = f"  {word} "
+        result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def top_counts(
+    groups: np.ndarray, items: np.ndarray, top: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Самые частые items в каждой группе: массивы (группа, item, сколько
+    раз), не больше top строк на группу, по группам, внутри - по убыванию
+    частоты и возрастанию item
+    """
+    if not len(groups):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    order = np.lexsort((items, groups))
+    groups, items = groups[order], items[order]
+    starts = np.flatnonzero(
+        np.r_[True, (groups[1:] != groups[:-1]) | (items[1:] != items[:-1])]
+    )
+    counts = np.diff(np.r_[starts, len(groups)])
+    groups, items = groups[starts], items[starts]
+    order = np.lexsort((items, -counts, groups))
+    groups, items, counts = groups[order], items[order], counts[order]
+    firsts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    places = np.arange(len(groups)) - np.repeat(
+        firsts, np.diff(np.r_[firsts, len(groups)])
+    )
+    keep = places < top
+    return groups[keep], items[keep], counts[keep]
+
+
+class StringTable:
+    """Строки подряд в UTF-8 и смещения начала каждой; nulls - где None"""
+
+    def __init__(self, offsets: np.ndarray, data, nulls=None):
+        self.offsets = offsets
+        self.data = data
+        self.nulls = nulls
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position: int) -> Optional[str]:
+        if self.nulls is not None and self.nulls[position]:
+            return None
+        start = int(self.offsets[position])
+        end = int(self.offsets[position + 1])
+        return self.data[start:end].decode()
+
+    def containing(self, needle: str) -> List[int]:
+        """Позиции строк, в которых встречается needle"""
+        needle = needle.encode()
+        found = []
+        start = 0
+        while needle:
+            at = self.data.find(needle, start)
+            if at < 0:
+                break
+            position = int(np.searchsorted(self.offsets, at, "right")) - 1
+            end = int(self.offsets[position + 1])
+            if at + len(needle) <= end:
+                found.append(position)
+                start = end
+            else:
+                # Совпадение на стыке двух строк
+                start = at + 1
+        return found
+
+
+class Links(NamedTuple):
+    """Связь один-ко-многим: потомки i - values[offsets[i]:offsets[i + 1]]"""
+
+    offsets: np.ndarray
+    values: np.ndarray
+
+    def of(self, position: int) -> np.ndarray:
+        return self.values[self.offsets[position] : self.offsets[position + 1]]
+
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def gather(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Потомки сразу многих строк: (номер строки в positions, потомок)
+        """
+        starts = self.offsets[positions]
+        lengths = self.offsets[positions + 1] - starts
+        owners = np.repeat(np.arange(len(positions)), lengths)
+        shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return owners, self.values[np.arange(int(lengths.sum())) + shifts]
+
+
+def positions_of(ids: np.ndarray, values) -> np.ndarray:
+    """Позиции values в отсортированном ids; -1 - нет такого id или None"""
+    result = np.full(len(values), -1, dtype=np.int32)
+    if not len(ids) or not len(values):
+        return result
+    wanted = np.array([-1 if v is None else v for v in values], dtype=np.int64)
+    found = np.minimum(np.searchsorted(ids, wanted), len(ids) - 1)
+    hit = ids[found] == wanted
+    result[hit] = found[hit]
+    return result
+
+
+class Writer:
+    """Файлы каталога снимка"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.bytes = 0
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def array(self, name: str, values, dtype) -> np.ndarray:
+        values = np.asarray(values, dtype=dtype)
+        np.save(self._file(f"{name}.npy"), values)
+        self.bytes += values.nbytes
+        return values
+
+    def strings(self, name: str, values: List[Optional[str]]) -> None:
+        encoded = [b"" if v is None else v.encode() for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        self.array(f"{name}.offsets", offsets, np.int64)
+        with open(self._file(f"{name}.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+        self.bytes += int(offsets[-1])
+        if any(v is None for v in values):
+            self.array(f"{name}.nulls", [v is None for v in values], bool)
+
+    def links(
+        self, name: str, parents: np.ndarray, children: np.ndarray, size: int
+    ) -> Links:
+        """Связь родитель -> потомки по позициям; size - строк у родителя"""
+        parents = np.asarray(parents, dtype=np.int64)
+        children = np.asarray(children, dtype=np.int32)
+        order = np.lexsort((children, parents))
+        offsets = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(parents, minlength=size), out=offsets[1:])
+        return Links(
+            self.array(f"{name}.offsets", offsets, np.int64),
+            self.array(f"{name}.values", children[order], np.int32),
+        )
+
+
+def write(db: Session, path: str, cell_size: float) -> dict:
+    """
+    Пишет снимок справочника из базы в каталог path и возвращает его
+    meta.json. Таблицы читаются в одной транзакции REPEATABLE READ,
+    поэтому связи в снимке согласованы.
+    """
+    db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    activities = (
+        db.query(
+            models.Activity.id, models.Activity.name, models.Activity.parent_id
+        )
+        .order_by(models.Activity.id)
+        .all()
+    )
+    buildings = (
+        db.query(
+            models.Building.id,
+            models.Building.address,
+            models.Building.latitude,
+            models.Building.longitude,
+        )
+        .order_by(models.Building.id)
+        .all()
+    )
+    organizations = (
+        db.query(
+            models.Organization.id,
+            models.Organization.name,
+            models.Organization.phone_numbers,
+            models.Organization.building_id,
+        )
+        .order_by(models.Organization.id)
+        .all()
+    )
+    links = db.query(
+        models.organization_activity.c.organization_id,
+        models.organization_activity.c.activity_id,
+    ).all()
+    return write_rows(
+        path, activities, buildings, organizations, links, cell_size
+    )
+
+
+def write_rows(
+    path: str,
+    activities: List[tuple],
+    buildings: List[tuple],
+    organizations: List[tuple],
+    links: List[tuple],
+    cell_size: float,
+) -> dict:
+    """
+    Снимок из строк таблиц по возрастанию id: activities - (id, name,
+    parent_id), buildings - (id, address, latitude, longitude),
+    organizations - (id, name, phone_numbers, building_id), links -
+    (organization_id, activity_id)
+    """
+    version = f"{path}.v{time.time_ns()}"
+    os.makedirs(version)
+    writer = Writer(version)
+
+    activity_ids = writer.array(
+        "activity_ids", [row[0] for row in activities], np.int64
+    )
+    writer.array(
+        "activity_parent_ids",
+        [-1 if row[2] is None else row[2] for row in activities],
+        np.int64,
+    )
+    writer.strings("activity_names", [row[1] for row in activities])
+
+    building_ids = writer.array(
+        "building_ids", [row[0] for row in buildings], np.int64
+    )
+    writer.array(
+        "building_latitudes",
+        [np.nan if row[2] is None else row[2] for row in buildings],
+        np.float64,
+    )
+    writer.array(
+        "building_longitudes",
+        [np.nan if row[3] is None else row[3] for row in buildings],
+        np.float64,
+    )
+    writer.strings("building_addresses", [row[1] for row in buildings])
+
+    organization_ids = writer.array(
+        "organization_ids", [row[0] for row in organizations], np.int64
+    )
+    organization_buildings = writer.array(
+        "organization_buildings",
+        positions_of(building_ids, [row[3] for row in organizations]),
+        np.int32,
+    )
+    names = [row[1] for row in organizations]
+    writer.strings("organization_names", names)
+    writer.strings("organization_names_lower", [n.lower() for n in names])
+    writer.strings(
+        "organization_phone_numbers",
+        [row[2] for row in organizations],
+    )
+
+    link_organizations = positions_of(
+        organization_ids, [row[0] for row in links]
+    )
+    link_activities = positions_of(activity_ids, [row[1] for row in links])
+    writer.links(
+        "organization_activities",
+        link_organizations,
+        link_activities,
+        len(organizations),
+    )
+    writer.links(
+        "activity_organizations",
+        link_activities,
+        link_organizations,
+        len(activities),
+    )
+    located = np.flatnonzero(organization_buildings >= 0)
+    writer.links(
+        "building_organizations",
+        organization_buildings[located],
+        located,
+        len(buildings),
+    )
+    # Самый частый вид деятельности организаций здания - атрибут тайла
+    link_buildings = organization_buildings[link_organizations]
+    with_building = link_buildings >= 0
+    top_buildings, top_activities, _ = top_counts(
+        link_buildings[with_building], link_activities[with_building], 1
+    )
+    top_activity = np.full(len(buildings), -1, dtype=np.int32)
+    top_activity[top_buildings] = top_activities
+    writer.array("building_top_activities", top_activity, np.int32)
+
+    postings: Dict[str, List[int]] = defaultdict(list)
+    trigram_counts = np.zeros(len(names), dtype=np.int32)
+    for position, name in enumerate(names):
+        grams = trigrams(name)
+        trigram_counts[position] = len(grams)
+        for gram in grams:
+            postings[gram].append(position)
+    vocabulary = sorted(postings)
+    writer.array("organization_trigram_counts", trigram_counts, np.int32)
+    writer.strings("trigrams", vocabulary)
+    writer.links(
+        "trigram_organizations",
+        np.repeat(
+            np.arange(len(vocabulary)),
+            [len(postings[gram]) for gram in vocabulary],
+        ),
+        np.fromiter(
+            (p for gram in vocabulary for p in postings[gram]),
+            dtype=np.int32,
+        ),
+        len(vocabulary),
+    )
+
+    index = SpatialIndex(cell_size=cell_size)
+    index.build(buildings)
+    for name, values, dtype in zip(
+        ("grid_keys", "grid_ids", "grid_latitudes", "grid_longitudes"),
+        index.arrays(),
+        (np.int64, np.int64, np.float64, np.float64),
+    ):
+        writer.array(name, values, dtype)
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "cell_size": cell_size,
+        "activities": len(activities),
+        "buildings": len(buildings),
+        "organizations": len(organizations),
+        "links": len(links),
+        "bytes": writer.bytes,
+    }
+    with open(os.path.join(version, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    publish(path, version)
+    return meta
+
+
+def publish(path: str, version: str) -> None:
+    """
+    Делает каталог version текущим снимком path: новая ссылка пишется
+    рядом и переименованием заменяет прежнюю, так что path существует
+    всё время. Версии, кроме новой и предыдущей, удаляются
+    """
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    if os.path.isdir(path) and previous is None:
+        # Каталог, записанный до перехода на версии: становится версией
+        # один раз, на время этого переноса path нет
+        previous = f"{path}.v0"
+        os.rename(path, previous)
+    link = f"{path}.link"
+    if os.path.lexists(link):
+        os.remove(link)
+    # Относительная ссылка: каталог со снимками можно перенести целиком
+    os.symlink(os.path.basename(version), link)
+    os.replace(link, path)
+
+    keep = {os.path.realpath(version), previous}
+    directory = os.path.dirname(os.path.abspath(path))
+    pattern = re.compile(re.escape(os.path.basename(path)) + r"\.v\d+")
+    for name in os.listdir(directory):
+        old = os.path.join(directory, name)
+        if pattern.fullmatch(name) and os.path.realpath(old) not in keep:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+class SnapshotActivity:
+    """Вид деятельности из снимка: атрибуты совпадают с models.Activity"""
+
+    __slots__ = ("_snapshot", "_position", "id", "name", "parent_id")
+
+    def __init__(self, snapshot: "Snapshot", position: int):
+        self._snapshot = snapshot
+        self._position = position
+        self.id = int(snapshot.activity_ids[position])
+        self.name = snapshot.activity_names[position]
+        parent_id = int(snapshot.activity_parent_ids[position])
+        self.parent_id = None if parent_id < 0 else parent_id
+
+    @property
+    def organizations(self) -> List["SnapshotOrganization"]:
+        return self._snapshot.organizations_at(
+            self._snapshot.activity_organizations.of(self._position)
+        )
+
+
+class SnapshotBuilding:
+    """Здание из снимка: атрибуты совпадают с models.Building"""
+
+    __slots__ = ("_snapshot", "_position", "id", "address")
+
+    def __init__(self, snapshot: "Snapshot", position: int):
+        self._snapshot = snapshot
+        self._position = position
+        self.id = int(snapshot.building_ids[position])
+        self.address = snapshot.building_addresses[position]
+
+    @property
+    def latitude(self) -> Optional[float]:
+        value = float(self._snapshot.building_latitudes[self._position])
+        return None if np.isnan(value) else value
+
+    @property
+    def longitude(self) -> Optional[float]:
+        value = float(self._snapshot.building_longitudes[self._position])
+        return None if np.isnan(value) else value
+
+    @property
+    def organizations(self) -> List["SnapshotOrganization"]:
+        return self._snapshot.organizations_at(
+            self._snapshot.building_organizations.of(self._position)
+        )
+
+
+class SnapshotOrganization:
+    """Организация из снимка: атрибуты совпадают с models.Organization"""
+
+    __slots__ = ("_snapshot", "_position", "id", "name", "phone_numbers")
+
+    def __init__(self, snapshot: "Snapshot", position: int):
+        self._snapshot = snapshot
+        self._position = position
+        self.id = int(snapshot.organization_ids[position])
+        self.name = snapshot.organization_names[position]
+        self.phone_numbers = snapshot.organization_phone_numbers[position]
+
+    @property
+    def building_id(self) -> Optional[int]:
+        position = int(self._snapshot.organization_buildings[self._position])
+        if position < 0:
+            return None
+        return int(self._snapshot.building_ids[position])
+
+    @property
+    def building(self) -> Optional[SnapshotBuilding]:
+        position = int(self._snapshot.organization_buildings[self._position])
+        if position < 0:
+            return None
+        return SnapshotBuilding(self._snapshot, position)
+
+    @property
+    def activities(self) -> List[SnapshotActivity]:
+        return self._snapshot.activities_at(
+            self._snapshot.organization_activities.of(self._position)
+        )
+
+
+class BuildingAddresses(Mapping):
+    """Адреса зданий снимка по id - для SpatialIndex.attach"""
+
+    def __init__(self, snapshot: "Snapshot"):
+        self._snapshot = snapshot
+
+    def __getitem__(self, building_id: int) -> str:
+        position = self._snapshot.building_position(building_id)
+        if position < 0:
+            raise KeyError(building_id)
+        return self._snapshot.building_addresses[position]
+
+    def __iter__(self):
+        return iter(self._snapshot.building_ids.tolist())
+
+    def __len__(self) -> int:
+        return len(self._snapshot.building_ids)
+
+
+def _page(
+    ids: np.ndarray, skip: int, limit: int, after_id: Optional[int]
+) -> range:
+    """Позиции страницы в порядке id, как у crud.paginate"""
+    if after_id is not None:
+        start = int(np.searchsorted(ids, after_id, "right"))
+    else:
+        start = max(skip, 0)
+    return range(start, min(start + max(limit, 0), len(ids)))
+
+
+class Snapshot:
+    """
+    Снимок, отображённый в память только на чтение. Методы повторяют
+    чтение из app.crud и возвращают объекты с атрибутами моделей, поэтому
+    ответы сериализуются теми же схемами.
+    """
+
+    def __init__(self, path: str):
+        # Все файлы - из одной версии, даже если ссылку подменят во время
+        # загрузки
+        self.path = os.path.realpath(path)
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Снимок версии {self.meta.get('version')}, "
+                f"ожидается {FORMAT_VERSION}: выгрузите его заново"
+            )
+        self._files = []
+
+        self.activity_ids = self._array("activity_ids")
+        self.activity_parent_ids = self._array("activity_parent_ids")
+        self.activity_names = self._strings("activity_names")
+        self.activity_organizations = self._links("activity_organizations")
+
+        self.building_ids = self._array("building_ids")
+        self.building_latitudes = self._array("building_latitudes")
+        self.building_longitudes = self._array("building_longitudes")
+        self.building_addresses = self._strings("building_addresses")
+        self.building_organizations = self._links("building_organizations")
+        self.building_top_activities = self._array("building_top_activities")
+
+        self.organization_ids = self._array("organization_ids")
+        self.organization_buildings = self._array("organization_buildings")
+        self.organization_names = self._strings("organization_names")
+        self.organization_names_lower = self._strings(
+            "organization_names_lower"
+        )
+        self.organization_phone_numbers = self._strings(
+            "organization_phone_numbers"
+        )
+        self.organization_activities = self._links("organization_activities")
+        self.organization_trigram_counts = self._array(
+            "organization_trigram_counts"
+        )
+        self.trigrams = self._strings("trigrams")
+        self.trigram_organizations = self._links("trigram_organizations")
+
+        self.index = SpatialIndex(cell_size=self.meta["cell_size"])
+        self.index.attach(
+            self._array("grid_keys"),
+            self._array("grid_ids"),
+            self._array("grid_latitudes"),
+            self._array("grid_longitudes"),
+            BuildingAddresses(self),
+        )
+        # Дерево нужно поиску по названию вида деятельности; ttl=0 - не
+        # перечитывать, базы нет
+        self.activity_tree = ActivityTree(ttl=0)
+        self.activity_tree.build(
+            zip(
+                self.activity_ids.tolist(),
+                (
+                    self.activity_names[i]
+                    for i in range(len(self.activity_ids))
+                ),
+                (
+                    None if parent_id < 0 else parent_id
+                    for parent_id in self.activity_parent_ids.tolist()
+                ),
+            )
+        )
+
+    def _array(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+    def _strings(self, name: str) -> StringTable:
+        nulls = None
+        if os.path.exists(os.path.join(self.path, f"{name}.nulls.npy")):
+            nulls = self._array(f"{name}.nulls")
+        with open(os.path.join(self.path, f"{name}.bin"), "rb") as f:
+            # Пустой файл не отображается в память
+            if os.fstat(f.fileno()).st_size:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._files.append(data)
+            else:
+                data = b""
+        return StringTable(self._array(f"{name}.offsets"), data, nulls)
+
+    def _links(self, name: str) -> Links:
+        return Links(
+            self._array(f"{name}.offsets"), self._array(f"{name}.values")
+        )
+
+    def stats(self) -> dict:
+        return {"path": self.path, **self.meta}
+
+    def building_position(self, building_id: int) -> int:
+        return int(positions_of(self.building_ids, [building_id])[0])
+
+    def activities_at(
+        self, positions: Iterable[int]
+    ) -> List[SnapshotActivity]:
+        return [SnapshotActivity(self, int(p)) for p in positions]
+
+    def buildings_at(self, positions: Iterable[int]) -> List[SnapshotBuilding]:
+        return [SnapshotBuilding(self, int(p)) for p in positions]
+
+    def organizations_at(
+        self, positions: Iterable[int]
+    ) -> List[SnapshotOrganization]:
+        return [SnapshotOrganization(self, int(p)) for p in positions]
+
+    @staticmethod
+    def _found(ids: np.ndarray, requested: List[int]) -> np.ndarray:
+        """Позиции найденных id в порядке requested"""
+        positions = positions_of(ids, requested)
+        return positions[positions >= 0]
+
+    def get_activities(
+        self, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+    ) -> List[SnapshotActivity]:
+        return self.activities_at(
+            _page(self.activity_ids, skip, limit, after_id)
+        )
+
+    def get_activities_by_ids(
+        self, activity_ids: List[int]
+    ) -> List[SnapshotActivity]:
+        return self.activities_at(self._found(self.activity_ids, activity_ids))
+
+    def get_activity(self, activity_id: int) -> Optional[SnapshotActivity]:
+        found = self.get_activities_by_ids([activity_id])
+        return found[0] if found else None
+
+    def get_buildings(
+        self, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+    ) -> List[SnapshotBuilding]:
+        return self.buildings_at(
+            _page(self.building_ids, skip, limit, after_id)
+        )
+
+    def get_buildings_by_ids(
+        self, building_ids: List[int]
+    ) -> List[SnapshotBuilding]:
+        return self.buildings_at(self._found(self.building_ids, building_ids))
+
+    def get_building(self, building_id: int) -> Optional[SnapshotBuilding]:
+        found = self.get_buildings_by_ids([building_id])
+        return found[0] if found else None
+
+    def get_buildings_in_radius(
+        self, latitude: float, longitude: float, radius: float, limit: int = 10
+    ) -> List[SnapshotBuilding]:
+        hits = self.index.in_radius(latitude, longitude, radius, limit)
+        return self.get_buildings_by_ids([i for i, _ in hits])
+
+    def get_nearest_buildings(
+        self, latitude: float, longitude: float, limit: int = 5
+    ):
+        return self.index.nearest(latitude, longitude, limit)
+
+    def get_buildings_in_bounds(
+        self,
+        min_lat: float,
+        max_lat: float,
+        min_lon: float,
+        max_lon: float,
+        limit: Optional[int] = None,
+    ) -> List[SnapshotBuilding]:
+        if min_lat > max_lat:
+            return []
+        ids = sorted(self.index.in_bounds(min_lat, max_lat, min_lon, max_lon))
+        return self.get_buildings_by_ids(ids[:limit])
+
+    def _top_cluster_activities(
+        self, building_ids: List[int], cell_size: float, top: int
+    ) -> Dict[Tuple[int, int], List[dict]]:
+        buildings = self._found(self.building_ids, building_ids)
+        cols = np.floor(
+            (self.building_longitudes[buildings] + 180) / cell_size
+        ).astype(np.int64)
+        rows = np.floor(
+            (self.building_latitudes[buildings] + 90) / cell_size
+        ).astype(np.int64)
+        owners, organizations = self.building_organizations.gather(buildings)
+        links, activities = self.organization_activities.gather(organizations)
+        owners = owners[links]
+        width = int(np.ceil(360 / cell_size)) + 1
+        cells, activities, counts = top_counts(
+            rows[owners] * width + cols[owners], activities, top
+        )
+        result = defaultdict(list)
+        for cell, activity, count in zip(
+            cells.tolist(), activities.tolist(), counts.tolist()
+        ):
+            row, col = divmod(cell, width)
+            result[col, row].append(
+                {
+                    "id": int(self.activity_ids[activity]),
+                    "name": self.activity_names[activity],
+                    "count": count,
+                }
+            )
+        return result
+
+    def get_building_clusters(
+        self,
+        min_lat: float,
+        max_lat: float,
+        min_lon: float,
+        max_lon: float,
+        zoom: int,
+        top_activities: int = 3,
+    ) -> dict:
+        cell_size = cluster_cell_size(zoom)
+        cells, buildings = self.index.clusters(
+            min_lat,
+            max_lat,
+            min_lon,
+            max_lon,
+            cell_size,
+            settings.CLUSTER_MAX_POINTS,
+        )
+        activities = {}
+        if cells and top_activities:
+            activities = self._top_cluster_activities(
+                self.index.in_bounds(min_lat, max_lat, min_lon, max_lon),
+                cell_size,
+                top_activities,
+            )
+        return clusters_response(zoom, cell_size, cells, buildings, activities)
+
+    def get_building_tile(self, z: int, x: int, y: int) -> bytes:
+        """Тайл с теми же атрибутами, что собирает crud.get_building_tile"""
+        min_lon, min_lat, max_lon, max_lat = tile_bbox(z, x, y)
+        ids = sorted(self.index.in_bounds(min_lat, max_lat, min_lon, max_lon))
+        buildings = self._found(self.building_ids, ids)
+        counts = self.building_organizations.counts()
+        features = []
+        for building_id, position in zip(ids, buildings.tolist()):
+            point = tile_point(
+                float(self.building_latitudes[position]),
+                float(self.building_longitudes[position]),
+                z,
+                x,
+                y,
+            )
+            if point is None:
+                continue
+            activity = int(self.building_top_activities[position])
+            features.append(
+                (
+                    building_id,
+                    *point,
+                    {
+                        "address": self.building_addresses[position],
+                        "organizations": int(counts[position]),
+                        "activity": (
+                            self.activity_names[activity]
+                            if activity >= 0
+                            else None
+                        ),
+                    },
+                )
+            )
+        return encode_point_layer("buildings", features)
+
+    def get_organizations(
+        self, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+    ) -> List[SnapshotOrganization]:
+        return self.organizations_at(
+            _page(self.organization_ids, skip, limit, after_id)
+        )
+
+    def get_organizations_by_ids(
+        self, organization_ids: List[int]
+    ) -> List[SnapshotOrganization]:
+        return self.organizations_at(
+            self._found(self.organization_ids, organization_ids)
+        )
+
+    def get_organization(
+        self, organization_id: int
+    ) -> Optional[SnapshotOrganization]:
+        found = self.get_organizations_by_ids([organization_id])
+        return found[0] if found else None
+
+    def get_organizations_by_building(
+        self, building_id: int
+    ) -> List[SnapshotOrganization]:
+        position = self.building_position(building_id)
+        if position < 0:
+            return []
+        return self.organizations_at(self.building_organizations.of(position))
+
+    def name_similarity(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (совпадает ли, похожесть) для каждой организации: совпадают
+        названия с подстрокой name или похожие не меньше порога pg_trgm
+        """
+        grams = trigrams(name)
+        common = np.zeros(len(self.organization_ids), dtype=np.int32)
+        for gram in grams:
+            i = bisect.bisect_left(self.trigrams, gram)
+            if i < len(self.trigrams) and self.trigrams[i] == gram:
+                common[self.trigram_organizations.of(i)] += 1
+        total = len(grams) + self.organization_trigram_counts - common
+        similarity = common / np.maximum(total, 1)
+        matches = similarity >= SIMILARITY_THRESHOLD
+        matches[self.organization_names_lower.containing(name.lower())] = True
+        return matches, similarity
+
+    def search_organizations(
+        self,
+        search: schemas.OrganizationSearch,
+        after: Optional[Tuple[float, int]] = None,
+    ) -> List[Tuple[SnapshotOrganization, float]]:
+        """
+        Поиск с теми же фильтрами и порядком, что у
+        crud.search_organizations: по расстоянию в метрах, если задана
+        точка, иначе по похожести названия, иначе по id
+        """
+        selected = np.ones(len(self.organization_ids), dtype=bool)
+        rank, descending = None, False
+
+        if search.building_id is not None:
+            position = self.building_position(search.building_id)
+            if position < 0:
+                return []
+            in_building = np.zeros_like(selected)
+            in_building[self.building_organizations.of(position)] = True
+            selected &= in_building
+        if search.activity_name:
+            activity_ids = self.activity_tree.subtree_for_name(
+                None, search.activity_name, search.activity_depth
+            )
+            if not activity_ids:
+                return []
+            _, organizations = self.activity_organizations.gather(
+                self._found(self.activity_ids, sorted(activity_ids))
+            )
+            with_activity = np.zeros_like(selected)
+            with_activity[organizations] = True
+            selected &= with_activity
+        if search.has_point:
+            hits = self.index.in_radius(
+                search.latitude, search.longitude, search.radius
+            )
+            buildings = self._found(self.building_ids, [i for i, _ in hits])
+            distances = np.array([d for _, d in hits], dtype=np.float64)
+            owners, organizations = self.building_organizations.gather(
+                buildings
+            )
+            rank = np.full(len(selected), np.inf)
+            rank[organizations] = distances[owners] * 1000
+            selected &= np.isfinite(rank)
+        if search.name:
+            matches, similarity = self.name_similarity(search.name)
+            selected &= matches
+            if rank is None:
+                rank, descending = similarity, True
+
+        positions = np.flatnonzero(selected)
+        ids = self.organization_ids[positions]
+        ranks = ids.astype(np.float64) if rank is None else rank[positions]
+        if after is not None:
+            after_rank, after_id = after
+            beyond = ranks < after_rank if descending else ranks > after_rank
+            keep = beyond | ((ranks == after_rank) & (ids > after_id))
+            positions, ids, ranks = positions[keep], ids[keep], ranks[keep]
+        order = np.lexsort((ids, -ranks if descending else ranks))
+        if search.limit is not None:
+            order = order[: search.limit]
+        return list(
+            zip(
+                self.organizations_at(positions[order]),
+                ranks[order].tolist(),
+            )
+        )
+
+    def export_organizations(
+        self, search: schemas.OrganizationSearch
+    ) -> Iterator[List[SnapshotOrganization]]:
+        return _batches(
+            [
+                organization
+                for organization, _ in self.search_organizations(search)
+            ]
+        )
+
+    def export_activities(
+        self, activity_name: Optional[str] = None, depth: int = 3
+    ) -> Iterator[List[SnapshotActivity]]:
+        if not activity_name:
+            return _batches(self.activities_at(range(len(self.activity_ids))))
+        activity_ids = self.activity_tree.subtree_for_name(
+            None, activity_name, depth
+        )
+        return _batches(self.get_activities_by_ids(sorted(activity_ids)))
+
+    def export_buildings(
+        self, bounds: Optional[Tuple[float, float, float, float]] = None
+    ) -> Iterator[List[SnapshotBuilding]]:
+        if bounds is None:
+            return _batches(self.buildings_at(range(len(self.building_ids))))
+        return _batches(self.get_buildings_in_bounds(*bounds))
+
+
+def _batches(rows: List) -> Iterator[List]:
+    """Выгрузка пачками по EXPORT_BATCH_SIZE, как у выгрузки из базы"""
+    batch = settings.EXPORT_BATCH_SIZE
+    for start in range(0, len(rows), batch):
+        yield rows[start : start + batch]
+
+
+_snapshot: Optional[Snapshot] = None
+
+
+def load(path: str) -> Snapshot:
+    global _snapshot
+    _snapshot = Snapshot(path)
+    return _snapshot
+
+
+def current() -> Optional[Snapshot]:
+    return _snapshot
+
+
+def get_snapshot() -> Snapshot:
+    """Зависимость маршрутов режима снимка; 503, пока снимок не загружен"""
+    if _snapshot is None:
+        raise HTTPException(status_code=503, detail="Снимок ещё не загружен")
+    return _snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "path", help="путь снимка: ссылка на каталог текущей версии"
+    )
+    parser.add_argument(
+        "--cell-size",
+        type=float,
+        default=settings.SPATIAL_INDEX_CELL_SIZE,
+        help="ячейка сетки индекса зданий в градусах",
+    )
+    args = parser.parse_args()
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        meta = write(db, args.path, args.cell_size)
+    print(
+        f"{meta['activities']} видов деятельности, {meta['buildings']} "
+        f"зданий, {meta['organizations']} организаций, {meta['links']} "
+        f"связей, {meta['bytes'] / 2**20:.1f} МБ "
+        f"за {time.perf_counter() - started:.1f} с",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
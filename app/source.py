@@ -0,0 +1,87 @@
+"""
+Источник данных маршрутов чтения.
+
+Маршруты чтения одни на оба режима и получают источник зависимостью
+get_source: с SNAPSHOT_PATH - загруженный снимок (app.snapshot), иначе
+CrudSource - функции app.crud с сессией запроса. Методы у обоих одни и
+те же: имена и аргументы app.crud без db, выгрузка - export_* пачками
+строк.
+"""
+
+from contextlib import contextmanager
+from functools import partial
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+from fastapi import Request
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import crud, schemas
+from app.config import settings
+from app.database import get_db, session_factory
+from app.snapshot import Snapshot, get_snapshot
+
+
+class CrudSource:
+    """Функции app.crud с уже подставленной сессией запроса"""
+
+    def __init__(self, db: Session, sessions: sessionmaker):
+        self.db = db
+        self.sessions = sessions
+
+    def __getattr__(self, name: str):
+        return partial(getattr(crud, name), self.db)
+
+    def _stream(self, build) -> Iterator[List]:
+        """
+        Строки запроса build(db) пачками по EXPORT_BATCH_SIZE.
+
+        Сессия своя, а не сессия запроса: генератор дочитывается уже после
+        выхода из обработчика. yield_per включает серверный курсор
+        (stream_results), поэтому в памяти одновременно лежит не больше
+        одной пачки строк.
+        """
+        with self.sessions() as db:
+            statement = build(db)
+            if statement is None:
+                return
+            result = db.execute(
+                statement.execution_options(
+                    yield_per=settings.EXPORT_BATCH_SIZE
+                )
+            )
+            for partition in result.scalars().partitions():
+                yield partition
+                db.expunge_all()
+
+    def export_organizations(
+        self, search: schemas.OrganizationSearch
+    ) -> Iterator[Sequence]:
+        return self._stream(
+            lambda db: crud.organization_export_statement(db, search)
+        )
+
+    def export_buildings(
+        self, bounds: Optional[Tuple[float, float, float, float]] = None
+    ) -> Iterator[Sequence]:
+        return self._stream(lambda db: crud.building_export_statement(bounds))
+
+    def export_activities(
+        self, activity_name: Optional[str] = None, depth: int = 3
+    ) -> Iterator[Sequence]:
+        return self._stream(
+            lambda db: crud.activity_export_statement(db, activity_name, depth)
+        )
+
+
+DataSource = Union[CrudSource, Snapshot]
+
+
+def get_source(request: Request) -> Iterator[DataSource]:
+    """Зависимость маршрутов чтения: снимок или база, см. описание модуля"""
+    if settings.SNAPSHOT_PATH:
+        yield get_snapshot()
+        return
+    # get_db - генератор-зависимость FastAPI; contextmanager закрывает
+    # сессию и при исключении в обработчике
+    with contextmanager(get_db)(request) as db:
+        yield CrudSource(db, session_factory(request))
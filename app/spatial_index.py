@@ -0,0 +1,428 @@
+import logging
+import threading
+import time
+from typing import Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+from app.database import SessionLocal
+
+logger = logging.getLogger("app.spatial_index")
+
+# Средний радиус WGS 84: тот же шар, что у ST_Distance и ST_DWithin по
+# geography с use_spheroid=false (см. crud.building_distance)
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+# Сколько новых зданий копится в буфере, прежде чем он будет слит
+# с отсортированными массивами
+MERGE_THRESHOLD = 4096
+
+
+class IndexedBuilding:
+    """Облегчённое здание из индекса: атрибуты совпадают с models.Building"""
+
+    __slots__ = ("id", "address", "latitude", "longitude")
+
+    def __init__(
+        self, id: int, address: str, latitude: float, longitude: float
+    ):
+        self.id = id
+        self.address = address
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+def haversine_km(
+    lat: float, lon: float, lats: np.ndarray, lons: np.ndarray
+) -> np.ndarray:
+    lat1 = np.radians(lat)
+    lats2 = np.radians(lats)
+    dlat = lats2 - lat1
+    dlon = np.radians(lons - lon)
+    a = (
+        np.sin(dlat / 2) ** 2
+        + np.cos(lat1) * np.cos(lats2) * np.sin(dlon / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpatialIndex:
+    """
+    Сеточный индекс зданий в памяти процесса.
+
+    Точки хранятся в массивах NumPy, отсортированных по номеру ячейки
+    сетки (строка по широте, столбец по долготе), поэтому каждая строка
+    сетки внутри прямоугольника запроса - это один непрерывный срез.
+    Новые здания сначала попадают в небольшой несортированный буфер,
+    который просматривается целиком и периодически сливается с основными
+    массивами.
+    """
+
+    def __init__(self, cell_size: float = 0.01):
+        self.cell_size = cell_size
+        self._cols = int(np.ceil(360 / cell_size))
+        self._rows = int(np.ceil(180 / cell_size))
+        self._lock = threading.Lock()
+        self._keys = np.empty(0, dtype=np.int64)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._lats = np.empty(0, dtype=np.float64)
+        self._lons = np.empty(0, dtype=np.float64)
+        self._pending: List[Tuple[int, float, float]] = []
+        self._addresses: Mapping[int, str] = {}
+        # Наибольший id, прочитанный из базы (build/sync). add() его не
+        # двигает: здание, созданное этим процессом, не означает, что
+        # здания с меньшими id из других процессов уже загружены
+        self.synced_id = 0
+        self.ready = False
+        self.synced_at = 0.0
+        self.loaded_at = 0.0
+        self._reloading = False
+
+    def __len__(self) -> int:
+        return len(self._addresses)
+
+    def _row(self, lat):
+        return np.clip(
+            ((np.asarray(lat) + 90) // self.cell_size).astype(np.int64),
+            0,
+            self._rows - 1,
+        )
+
+    def _col(self, lon):
+        return np.clip(
+            ((np.asarray(lon) + 180) // self.cell_size).astype(np.int64),
+            0,
+            self._cols - 1,
+        )
+
+    def build(self, rows: Iterable[Tuple[int, str, float, float]]) -> None:
+        ids, lats, lons, addresses = [], [], [], {}
+        for building_id, address, lat, lon in rows:
+            if lat is None or lon is None:
+                continue
+            ids.append(building_id)
+            lats.append(lat)
+            lons.append(lon)
+            addresses[building_id] = address
+        ids = np.asarray(ids, dtype=np.int64)
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        keys = self._row(lats) * self._cols + self._col(lons)
+        order = np.argsort(keys, kind="stable")
+        with self._lock:
+            self._keys = keys[order]
+            self._ids = ids[order]
+            self._lats = lats[order]
+            self._lons = lons[order]
+            self._pending = []
+            self._addresses = addresses
+            self.synced_id = int(ids.max()) if len(ids) else 0
+            self.ready = True
+            self.synced_at = self.loaded_at = time.monotonic()
+
+    def attach(
+        self,
+        keys: np.ndarray,
+        ids: np.ndarray,
+        lats: np.ndarray,
+        lons: np.ndarray,
+        addresses: Mapping[int, str],
+    ) -> None:
+        """
+        Подключает готовые массивы, отсортированные по ячейкам сетки с тем
+        же cell_size (см. arrays()), без копирования - например,
+        отображённые в память из снимка. addresses - id здания -> адрес.
+        """
+        with self._lock:
+            self._keys, self._ids, self._lats, self._lons = (
+                keys,
+                ids,
+                lats,
+                lons,
+            )
+            self._pending = []
+            self._addresses = addresses
+            self.synced_id = int(ids.max()) if len(ids) else 0
+            self.ready = True
+            self.synced_at = self.loaded_at = time.monotonic()
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(keys, ids, lats, lons) в порядке ячеек сетки, вместе с буфером"""
+        with self._lock:
+            if self._pending:
+                self._merge_pending()
+            return self._keys, self._ids, self._lats, self._lons
+
+    def add(
+        self, building_id: int, address: str, latitude: float, longitude: float
+    ) -> None:
+        with self._lock:
+            if building_id in self._addresses:
+                return
+            self._addresses[building_id] = address
+            self._pending.append((building_id, latitude, longitude))
+            if len(self._pending) >= MERGE_THRESHOLD:
+                self._merge_pending()
+
+    def _merge_pending(self) -> None:
+        ids, lats, lons = (np.asarray(v) for v in zip(*self._pending))
+        keys = self._row(lats) * self._cols + self._col(lons)
+        all_keys = np.concatenate([self._keys, keys])
+        order = np.argsort(all_keys, kind="stable")
+        self._keys = all_keys[order]
+        self._ids = np.concatenate([self._ids, ids.astype(np.int64)])[order]
+        self._lats = np.concatenate([self._lats, lats.astype(np.float64)])[
+            order
+        ]
+        self._lons = np.concatenate([self._lons, lons.astype(np.float64)])[
+            order
+        ]
+        self._pending = []
+
+    def _snapshot(self):
+        with self._lock:
+            keys, ids, lats, lons = (
+                self._keys,
+                self._ids,
+                self._lats,
+                self._lons,
+            )
+            pending = list(self._pending)
+        return keys, ids, lats, lons, pending
+
+    def _in_box(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Все точки в прямоугольнике; min_lon > max_lon - переход через 180°"""
+        keys, ids, lats, lons, pending = self._snapshot()
+        if min_lon > max_lon:
+            lon_ranges = [(min_lon, 180.0), (-180.0, max_lon)]
+        else:
+            lon_ranges = [(min_lon, max_lon)]
+
+        rows = np.arange(self._row(min_lat), self._row(max_lat) + 1)
+        slices = []
+        for lo_lon, hi_lon in lon_ranges:
+            base = rows * self._cols
+            starts = np.searchsorted(keys, base + self._col(lo_lon), "left")
+            ends = np.searchsorted(keys, base + self._col(hi_lon), "right")
+            slices.extend(
+                np.arange(s, e) for s, e in zip(starts, ends) if e > s
+            )
+        positions = (
+            np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+        )
+        c_ids, c_lats, c_lons = (
+            ids[positions],
+            lats[positions],
+            lons[positions],
+        )
+        if pending:
+            p_ids, p_lats, p_lons = (np.asarray(v) for v in zip(*pending))
+            c_ids = np.concatenate([c_ids, p_ids.astype(np.int64)])
+            c_lats = np.concatenate([c_lats, p_lats.astype(np.float64)])
+            c_lons = np.concatenate([c_lons, p_lons.astype(np.float64)])
+
+        mask = (c_lats >= min_lat) & (c_lats <= max_lat)
+        if min_lon > max_lon:
+            mask &= (c_lons >= min_lon) | (c_lons <= max_lon)
+        else:
+            mask &= (c_lons >= min_lon) & (c_lons <= max_lon)
+        return c_ids[mask], c_lats[mask], c_lons[mask]
+
+    def in_bounds(
+        self, min_lat: float, max_lat: float, min_lon: float, max_lon: float
+    ) -> List[int]:
+        ids, _, _ = self._in_box(min_lat, max_lat, min_lon, max_lon)
+        return ids.tolist()
+
+    def clusters(
+        self,
+        min_lat: float,
+        max_lat: float,
+        min_lon: float,
+        max_lon: float,
+        cell_size: float,
+        max_points: int,
+    ):
+        """
+        Здания прямоугольника по ячейкам сетки cell_size градусов.
+
+        Возвращает (cells, buildings): если зданий не больше max_points -
+        cells пуст, а buildings - сами здания; иначе cells - кортежи
+        (столбец, строка, число зданий, широта и долгота центроида).
+        """
+        ids, lats, lons = self._in_box(min_lat, max_lat, min_lon, max_lon)
+        if len(ids) <= max_points:
+            order = np.argsort(ids)
+            return [], [
+                IndexedBuilding(i, self._addresses.get(i), lat, lon)
+                for i, lat, lon in zip(
+                    ids[order].tolist(),
+                    lats[order].tolist(),
+                    lons[order].tolist(),
+                )
+            ]
+        cols = np.floor((lons + 180) / cell_size).astype(np.int64)
+        rows = np.floor((lats + 90) / cell_size).astype(np.int64)
+        keys = rows * (int(np.ceil(360 / cell_size)) + 1) + cols
+        _, first, inverse, counts = np.unique(
+            keys, return_index=True, return_inverse=True, return_counts=True
+        )
+        lat_sums = np.bincount(inverse, weights=lats)
+        lon_sums = np.bincount(inverse, weights=lons)
+        cells = list(
+            zip(
+                cols[first].tolist(),
+                rows[first].tolist(),
+                counts.tolist(),
+                (lat_sums / counts).tolist(),
+                (lon_sums / counts).tolist(),
+            )
+        )
+        return cells, []
+
+    def _radius_hits(
+        self,
+        latitude: float,
+        longitude: float,
+        radius: float,
+        limit: Optional[int] = None,
+    ):
+        dlat = radius / KM_PER_DEGREE
+        min_lat, max_lat = latitude - dlat, latitude + dlat
+        if min_lat <= -90 or max_lat >= 90:
+            # Круг захватывает полюс - берём все долготы
+            box = (max(min_lat, -90), min(max_lat, 90), -180.0, 180.0)
+        else:
+            cos_lat = np.cos(np.radians(max(abs(min_lat), abs(max_lat))))
+            dlon = dlat / cos_lat
+            if dlon >= 180:
+                box = (min_lat, max_lat, -180.0, 180.0)
+            else:
+                min_lon = (longitude - dlon + 180) % 360 - 180
+                max_lon = (longitude + dlon + 180) % 360 - 180
+                box = (min_lat, max_lat, min_lon, max_lon)
+
+        ids, lats, lons = self._in_box(*box)
+        distances = haversine_km(latitude, longitude, lats, lons)
+        mask = distances <= radius
+        ids, lats, lons = ids[mask], lats[mask], lons[mask]
+        distances = distances[mask]
+        if limit is not None and limit < len(ids):
+            top = np.argpartition(distances, limit)[:limit]
+            ids, lats, lons = ids[top], lats[top], lons[top]
+            distances = distances[top]
+        order = np.argsort(distances, kind="stable")
+        return ids[order], lats[order], lons[order], distances[order]
+
+    def in_radius(
+        self,
+        latitude: float,
+        longitude: float,
+        radius: float,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, float]]:
+        """Пары (id здания, расстояние в км), отсортированные по расстоянию"""
+        ids, _, _, distances = self._radius_hits(
+            latitude, longitude, radius, limit
+        )
+        return list(zip(ids.tolist(), distances.tolist()))
+
+    def nearest(
+        self, latitude: float, longitude: float, limit: int = 5
+    ) -> List[Tuple[IndexedBuilding, float]]:
+        # Расширяем радиус, пока в круг не попадёт limit зданий: всё, что
+        # вне круга, заведомо дальше найденных
+        radius = self.cell_size * KM_PER_DEGREE
+        max_radius = np.pi * EARTH_RADIUS_KM
+        while True:
+            ids, lats, lons, distances = self._radius_hits(
+                latitude, longitude, radius, limit
+            )
+            if len(ids) >= limit or radius >= max_radius:
+                break
+            radius = min(radius * 4, max_radius)
+
+        return [
+            (
+                IndexedBuilding(
+                    building_id, self._addresses.get(building_id), lat, lon
+                ),
+                distance,
+            )
+            for building_id, lat, lon, distance in zip(
+                ids.tolist(), lats.tolist(), lons.tolist(), distances.tolist()
+            )
+        ]
+
+    def load(self, db: Session) -> None:
+        self.build(_query_rows(db))
+
+    def sync(self, db: Session) -> None:
+        """
+        Догружает здания, созданные другими процессами; уже добавленные
+        этим процессом через add() пропускаются.
+
+        Догрузка видит только id больше synced_id: здание из транзакции,
+        которая получила id раньше, а зафиксировалась позже, и изменённые
+        координаты появятся в индексе лишь после полной перезагрузки
+        (SPATIAL_INDEX_RELOAD_INTERVAL)
+        """
+        synced_id = self.synced_id
+        for row in _query_rows(db, after_id=synced_id):
+            self.add(*row)
+            synced_id = max(synced_id, row[0])
+        with self._lock:
+            self.synced_id = max(self.synced_id, synced_id)
+        self.synced_at = time.monotonic()
+
+    def maybe_sync(self, db: Session) -> None:
+        now = time.monotonic()
+        reload_interval = settings.SPATIAL_INDEX_RELOAD_INTERVAL
+        if reload_interval and now - self.loaded_at > reload_interval:
+            self._start_reload()
+        interval = settings.SPATIAL_INDEX_REFRESH_INTERVAL
+        if interval and now - self.synced_at > interval:
+            self.sync(db)
+
+    def _start_reload(self) -> None:
+        """Полная перезагрузка в фоне; запросы пока читают прежние массивы"""
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(
+            target=self._reload, name="spatial-index-reload", daemon=True
+        ).start()
+
+    def _reload(self) -> None:
+        try:
+            with SessionLocal() as db:
+                self.load(db)
+        except Exception:
+            logger.exception("spatial index reload failed")
+            # Следующая попытка - через интервал, а не на каждом запросе
+            self.loaded_at = time.monotonic()
+        finally:
+            self._reloading = False
+
+
+def _query_rows(db: Session, after_id: int = 0):
+    return (
+        db.query(
+            models.Building.id,
+            models.Building.address,
+            models.Building.latitude,
+            models.Building.longitude,
+        )
+        .filter(models.Building.id > after_id)
+        .filter(models.Building.location.isnot(None))
+        .yield_per(10000)
+    )
+
+
+building_index = SpatialIndex(cell_size=settings.SPATIAL_INDEX_CELL_SIZE)
@@ -0,0 +1,202 @@
+"""
+Векторные тайлы зданий (Mapbox Vector Tile) и их кэш.
+
+Тайл собирает PostGIS (ST_AsMVT) в проекции Web Mercator: точка на
+каждое здание с числом организаций и самым частым видом деятельности в
+атрибутах. Готовые тайлы лежат в памяти процесса; запись здания или
+организации сбрасывает только тайлы, в которые попадает точка здания,
+на всех масштабах.
+"""
+
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.cache import ResponseCache
+from app.config import settings
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+MAX_ZOOM = 22
+# Размер тайла в единицах MVT и запас по краю, в который попадают точки
+# соседних тайлов, чтобы значки на границе не обрезались
+EXTENT = 4096
+BUFFER = 64
+# Половина стороны мира в метрах Web Mercator (EPSG:3857)
+MERCATOR_HALF_WORLD = 20037508.342789244
+MAX_MERCATOR_LAT = 85.0511287798066
+
+Tile = Tuple[int, int, int]
+
+
+def tile_exists(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z
+
+
+def tile_margin(z: int) -> float:
+    """Запас BUFFER в метрах Web Mercator для тайла масштаба z"""
+    return 2 * MERCATOR_HALF_WORLD / 2**z * BUFFER / EXTENT
+
+
+def _tile_position(latitude: float, longitude: float) -> Tuple[float, float]:
+    """Положение точки в долях мира: (0, 0) - северо-западный угол"""
+    lat = math.radians(max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, latitude)))
+    fx = (longitude + 180) / 360
+    fy = (1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2
+    return fx, fy
+
+
+def tile_for_point(latitude: float, longitude: float, z: int) -> Tile:
+    fx, fy = _tile_position(latitude, longitude)
+    n = 2**z
+    return z, min(n - 1, int(fx * n)), min(n - 1, int(fy * n))
+
+
+def tiles_for_point(latitude: float, longitude: float) -> List[Tile]:
+    """Тайлы всех масштабов, в которые точка попадает вместе с запасом"""
+    fx, fy = _tile_position(latitude, longitude)
+    tiles = []
+    for z in range(MAX_ZOOM + 1):
+        n = 2**z
+        margin = BUFFER / EXTENT
+        for x in range(
+            math.floor(fx * n - margin), math.floor(fx * n + margin) + 1
+        ):
+            for y in range(
+                math.floor(fy * n - margin), math.floor(fy * n + margin) + 1
+            ):
+                if tile_exists(z, x, y):
+                    tiles.append((z, x, y))
+    return tiles
+
+
+def _latitude(fy: float) -> float:
+    """Широта по доле мира от северного края"""
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * fy))))
+
+
+def tile_bbox(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """
+    (min_lon, min_lat, max_lon, max_lat) тайла вместе с запасом BUFFER, без
+    перехода через 180-й меридиан - как ST_Expand(ST_TileEnvelope(...))
+    """
+    n = 2**z
+    margin = BUFFER / EXTENT
+    min_lon = max(-180.0, (x - margin) / n * 360 - 180)
+    max_lon = min(180.0, (x + 1 + margin) / n * 360 - 180)
+    max_lat = _latitude(max(0.0, (y - margin) / n))
+    min_lat = _latitude(min(1.0, (y + 1 + margin) / n))
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def tile_point(
+    latitude: float, longitude: float, z: int, x: int, y: int
+) -> Optional[Tuple[int, int]]:
+    """
+    Координаты точки в тайле в единицах EXTENT, ось y вниз, как у
+    ST_AsMVTGeom; None - точка вне тайла с запасом BUFFER
+    """
+    if abs(latitude) > MAX_MERCATOR_LAT:
+        return None
+    fx, fy = _tile_position(latitude, longitude)
+    n = 2**z
+    px = round((fx * n - x) * EXTENT)
+    py = round((fy * n - y) * EXTENT)
+    if -BUFFER <= px <= EXTENT + BUFFER and -BUFFER <= py <= EXTENT + BUFFER:
+        return px, py
+    return None
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _message(field: int, payload: bytes) -> bytes:
+    """Поле protobuf с длиной (wire type 2)"""
+    return _varint(field << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _uint(field: int, value: int) -> bytes:
+    return _varint(field << 3) + _varint(value)
+
+
+def _packed(field: int, values: Iterable[int]) -> bytes:
+    return _message(field, b"".join(_varint(v) for v in values))
+
+
+def _tile_value(value) -> bytes:
+    if isinstance(value, str):
+        return _message(1, value.encode())
+    if value >= 0:
+        return _uint(5, value)
+    return _varint(6 << 3) + _varint(_zigzag(value))
+
+
+def encode_point_layer(
+    name: str, features: Iterable[Tuple[int, int, int, Dict[str, object]]]
+) -> bytes:
+    """
+    Тайл MVT из одного слоя точек: features - (id, x, y, атрибуты) в
+    единицах EXTENT; атрибуты None не пишутся, как у ST_AsMVT. Без точек -
+    пустой тайл, как у ST_AsMVT по пустой выборке.
+    """
+    keys: Dict[str, int] = {}
+    values: Dict[tuple, int] = {}
+    encoded = []
+    for feature_id, px, py, properties in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        # MoveTo с одной точкой: команда 1, число точек 1
+        geometry = (1 | 1 << 3, _zigzag(px), _zigzag(py))
+        encoded.append(
+            _message(
+                2,
+                _uint(1, feature_id)
+                + _packed(2, tags)
+                + _uint(3, 1)
+                + _packed(4, geometry),
+            )
+        )
+    if not encoded:
+        return b""
+    layer = (
+        _uint(15, 2)
+        + _message(1, name.encode())
+        + b"".join(encoded)
+        + b"".join(_message(3, key.encode()) for key in keys)
+        + b"".join(_message(4, _tile_value(value)) for _, value in values)
+        + _uint(5, EXTENT)
+    )
+    return _message(3, layer)
+
+
+class TileCache(ResponseCache):
+    """Кэш тайлов: каждая запись помечена своим тайлом"""
+
+    def invalidate_points(self, points: Iterable[Tuple[float, float]]) -> None:
+        tiles = set()
+        for latitude, longitude in points:
+            tiles.update(tiles_for_point(latitude, longitude))
+        if tiles:
+            self.invalidate(*tiles)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "enabled": settings.TILE_CACHE_ENABLED}
+
+
+tile_cache = TileCache(
+    max_entries=settings.TILE_CACHE_MAX_ENTRIES,
+    max_bytes=settings.TILE_CACHE_MAX_BYTES,
+    ttl=settings.TILE_CACHE_TTL,
+)
@@ -0,0 +1,205 @@
+"""
+Структурные логи и трассировка запросов.
+
+Каждый запрос получает id (из заголовка X-Request-ID или новый), который
+попадает во все записи лога и в ответ. Число SQL-запросов и время в базе
+считаются для каждого запроса (их читают и метрики), а для выборки
+запросов (TRACE_SAMPLE_RATE) собираются ещё и спаны: каждый SQL-запрос и
+участки, обёрнутые в span(), например сериализация. Итог запроса пишется
+одной JSON-строкой в лог app.request, если запрос попал в выборку,
+оказался медленнее TRACE_SLOW_MS или завершился ошибкой (тогда в той же
+строке и трассировка исключения); остальные запросы почти ничего не
+стоят.
+"""
+
+import json
+import logging
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+
+from app.config import settings
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+logger = logging.getLogger("app.request")
+
+
+class Trace:
+    __slots__ = ("request_id", "sampled", "spans", "db_count", "db_time")
+
+    def __init__(self, request_id: str, sampled: bool):
+        self.request_id = request_id
+        self.sampled = sampled
+        self.spans: List[Tuple[str, float, float]] = []
+        self.db_count = 0
+        self.db_time = 0.0
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    trace = _trace.get()
+    return trace.request_id if trace is not None else None
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+@contextmanager
+def span(name: str):
+    """Замеряет участок кода, если текущий запрос трассируется"""
+    trace = _trace.get()
+    if trace is None or not trace.sampled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append((name, started, time.perf_counter() - started))
+
+
+def _before_cursor_execute(conn, cursor, statement, *args):
+    if _trace.get() is not None:
+        # Одно значение, а не стек: после ошибки запроса after не
+        # вызывается, и следующий запрос просто перезапишет замер
+        conn.info["trace_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, *args):
+    trace = _trace.get()
+    if trace is None:
+        return
+    started = conn.info["trace_started"]
+    elapsed = time.perf_counter() - started
+    trace.db_count += 1
+    trace.db_time += elapsed
+    if trace.sampled:
+        name = "db: " + " ".join(statement.split())[:200]
+        trace.spans.append((name, started, elapsed))
+
+
+def instrument_engine(engine) -> None:
+    """Спаны SQL-запросов движка (для AsyncEngine - его sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись; поля из extra={"fields": {...}}"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = current_request_id()
+        if request_id is not None:
+            entry["request_id"] = request_id
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging() -> None:
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    root = logging.getLogger("app")
+    root.handlers[:] = [handler]
+    root.setLevel(settings.LOG_LEVEL)
+    root.propagate = False
+    # Пулы из app.database логируют через логгер своего модуля - их
+    # служебные сообщения (dispose, recreate) в логах не нужны
+    logging.getLogger("app.database").setLevel(logging.WARNING)
+
+
+class TracingMiddleware:
+    """ASGI-обёртка: id запроса, трассировка и итоговая строка лога"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")[:128]
+                break
+        trace = Trace(
+            request_id or uuid.uuid4().hex,
+            random.random() < settings.TRACE_SAMPLE_RATE,
+        )
+        token = _trace.set(trace)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (REQUEST_ID_HEADER, trace.request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        except Exception as e:
+            # Пишется один раз - в итоговой строке запроса
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            if (
+                trace.sampled
+                or status >= 500
+                or elapsed * 1000 >= settings.TRACE_SLOW_MS
+            ):
+                _log_request(scope, trace, status, elapsed, started, error)
+            _trace.reset(token)
+
+
+def _log_request(
+    scope, trace: Trace, status, elapsed, started, error=None
+) -> None:
+    fields = {
+        "method": scope["method"],
+        "path": scope["path"],
+        "status": status,
+        "duration_ms": round(elapsed * 1000, 2),
+        "sampled": trace.sampled,
+        "db_count": trace.db_count,
+        "db_ms": round(trace.db_time * 1000, 2),
+    }
+    if trace.sampled:
+        fields["spans"] = [
+            {
+                "name": name,
+                "start_ms": round((span_started - started) * 1000, 2),
+                "duration_ms": round(duration * 1000, 2),
+            }
+            for name, span_started, duration in trace.spans
+        ]
+    if error is not None:
+        logger.error(
+            "unhandled error", exc_info=error, extra={"fields": fields}
+        )
+    else:
+        logger.info("request", extra={"fields": fields})
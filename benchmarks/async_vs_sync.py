@@ -0,0 +1,126 @@
+"""
+Сравнение пропускной способности синхронного и асинхронного режимов.
+
+Поднимает по одному процессу uvicorn (один воркер) с ASYNC_DB_ENABLED=false
+и ASYNC_DB_ENABLED=true поверх той же базы и гоняет одинаковую нагрузку
+из гео-запросов с заданным числом одновременных запросов.
+
+    python -m benchmarks.async_vs_sync --concurrency 500 --requests 20000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+GEO_PATHS = [
+    "/buildings/nearest?latitude=55.7648&longitude=37.6059&limit=5",
+    "/buildings/search/radius?latitude=55.7648&longitude=37.6059&radius=5",
+    "/organizations/search?latitude=56.8386&longitude=60.5950&radius=3",
+]
+
+
+def start_server(port: int, async_mode: bool) -> subprocess.Popen:
+    env = dict(os.environ, ASYNC_DB_ENABLED="true" if async_mode else "false")
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(port),
+            "--workers",
+            "1",
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+    )
+
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get("/")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Сервер не поднялся")
+
+
+async def run_load(base_url: str, api_key: str, total: int, concurrency: int):
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        headers={"X-API-Key": api_key},
+        limits=limits,
+        timeout=120,
+    ) as client:
+        await wait_until_up(client)
+        latencies = []
+        errors = 0
+        queue = iter(range(total))
+
+        async def worker():
+            nonlocal errors
+            for i in queue:
+                started = time.perf_counter()
+                response = await client.get(GEO_PATHS[i % len(GEO_PATHS)])
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    api_key = os.environ["API_KEY"]
+
+    print(
+        f"{'mode':<6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}"
+    )
+    for async_mode in (False, True):
+        server = start_server(args.port, async_mode)
+        try:
+            stats = asyncio.run(
+                run_load(
+                    f"http://127.0.0.1:{args.port}",
+                    api_key,
+                    args.requests,
+                    args.concurrency,
+                )
+            )
+        finally:
+            server.terminate()
+            server.wait()
+        mode = "async" if async_mode else "sync"
+        print(
+            f"{mode:<6} {stats['rps']:>9.1f} {stats['p50_ms']:>9.1f} "
+            f"{stats['p99_ms']:>9.1f} {stats['errors']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
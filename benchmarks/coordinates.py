@@ -0,0 +1,82 @@
+"""
+Микробенчмарк декодирования координат зданий.
+
+Сравнивает, сколько стоит получить latitude/longitude для N зданий:
+- по-старому: to_shape() на каждое обращение к свойству (два разбора WKB
+  на здание при сериализации);
+- одним векторным проходом shapely.from_wkb по всему результату;
+- с column_property ST_Y/ST_X, когда координаты уже пришли из базы числами.
+
+Базе данных не нужен: WKB генерируется в памяти.
+
+    python -m benchmarks.coordinates --rows 10000
+"""
+
+import argparse
+import random
+import timeit
+
+import numpy as np
+import shapely
+from geoalchemy2.shape import from_shape, to_shape
+from shapely.geometry import Point
+
+
+class LegacyBuilding:
+    def __init__(self, location):
+        self.location = location
+
+    @property
+    def latitude(self):
+        return to_shape(self.location).y
+
+    @property
+    def longitude(self):
+        return to_shape(self.location).x
+
+
+class SqlBuilding:
+    def __init__(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    coords = [
+        (rng.uniform(41, 70), rng.uniform(19, 180)) for _ in range(args.rows)
+    ]
+    elements = [from_shape(Point(lon, lat), srid=4326) for lat, lon in coords]
+    legacy = [LegacyBuilding(element) for element in elements]
+    sql = [SqlBuilding(lat, lon) for lat, lon in coords]
+
+    def per_row_to_shape():
+        return [(b.latitude, b.longitude) for b in legacy]
+
+    def vectorized_from_wkb():
+        points = shapely.from_wkb([bytes(e.data) for e in elements])
+        return list(zip(shapely.get_y(points), shapely.get_x(points)))
+
+    def column_property():
+        return [(b.latitude, b.longitude) for b in sql]
+
+    assert np.allclose(per_row_to_shape(), column_property())
+    assert np.allclose(vectorized_from_wkb(), column_property())
+
+    print(f"{args.rows} зданий, лучшее из {args.repeat} прогонов:")
+    for name, fn in [
+        ("to_shape на свойство", per_row_to_shape),
+        ("shapely.from_wkb пачкой", vectorized_from_wkb),
+        ("ST_Y/ST_X column_property", column_property),
+    ]:
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        print(f"  {name:<28} {best * 1000:9.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Синтетический справочник для нагрузочных замеров.
+
+Детерминированно (при одном и том же --seed) порождает N зданий, M
+организаций и дерево видов деятельности заданной глубины. Здания
+сгущаются вокруг городов России пропорционально населению, небольшая
+доля разбросана по всей стране, включая Чукотку за 180-м меридианом.
+Данные пишутся в базу из DATABASE_URL через COPY с явными id, поэтому
+одинаковые параметры дают одинаковую базу и замеры разных коммитов
+сравнимы.
+
+Непустой справочник не перезаписывается без --replace.
+
+    python -m benchmarks.dataset --buildings 100000 --organizations 300000
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+from typing import Iterator, List, NamedTuple, Tuple
+
+from app.database import get_engine
+from app.importer import copy_rows, point_ewkb
+
+KM_PER_DEGREE = 111.32
+
+
+class City(NamedTuple):
+    name: str
+    latitude: float
+    longitude: float
+    population: float  # млн, вес при выборе города
+    spread_km: float  # стандартное отклонение застройки от центра
+
+
+CITIES = [
+    City("Москва", 55.7558, 37.6173, 13.1, 14),
+    City("Санкт-Петербург", 59.9386, 30.3141, 5.6, 11),
+    City("Новосибирск", 55.0302, 82.9204, 1.6, 9),
+    City("Екатеринбург", 56.8386, 60.6050, 1.5, 8),
+    City("Казань", 55.7964, 49.1089, 1.3, 7),
+    City("Нижний Новгород", 56.3287, 44.0020, 1.2, 7),
+    City("Красноярск", 56.0106, 92.8526, 1.2, 7),
+    City("Челябинск", 55.1598, 61.4025, 1.2, 7),
+    City("Самара", 53.1959, 50.1002, 1.2, 7),
+    City("Уфа", 54.7348, 55.9579, 1.1, 7),
+    City("Ростов-на-Дону", 47.2225, 39.7187, 1.1, 7),
+    City("Омск", 54.9893, 73.3682, 1.1, 6),
+    City("Воронеж", 51.6615, 39.2003, 1.0, 6),
+    City("Пермь", 58.0105, 56.2502, 1.0, 6),
+    City("Владивосток", 43.1155, 131.8855, 0.6, 5),
+    City("Калининград", 54.7104, 20.4522, 0.5, 5),
+    City("Петропавловск-Камчатский", 53.0370, 158.6559, 0.2, 4),
+    City("Анадырь", 64.7337, 177.5089, 0.02, 2),
+]
+CITY_WEIGHTS = [city.population for city in CITIES]
+# Доля зданий вне городов: равномерно по рамке страны
+RURAL_SHARE = 0.05
+RUSSIA_LATITUDES = (43.0, 70.0)
+# Рамка через 180-й меридиан: от Калининграда до Чукотки
+RUSSIA_LONGITUDES = (20.0, 190.0)
+BUSINESS_CENTER_SHARE = 0.3
+
+STREETS = [
+    "Ленина",
+    "Мира",
+    "Советская",
+    "Гагарина",
+    "Пушкина",
+    "Садовая",
+    "Лесная",
+    "Молодёжная",
+    "Центральная",
+    "Школьная",
+    "Набережная",
+    "Заводская",
+]
+ROOT_ACTIVITIES = [
+    "Финансовые услуги",
+    "Торговля",
+    "Развлечения",
+    "Бизнес",
+    "Еда",
+    "Автомобили",
+    "Медицина",
+    "Образование",
+]
+ORGANIZATION_FORMS = ["ООО", "АО", "ИП", "ПАО", "НКО"]
+ORGANIZATION_WORDS = [
+    "Рога и Копыта",
+    "ДоброЗайм",
+    "Ромашка",
+    "Сервис Центр",
+    "Экспресс",
+    "Финанс",
+    "Вектор",
+    "Альянс",
+    "Север",
+    "Гранит",
+]
+
+
+def activity_name(root: int, path: Tuple[int, ...]) -> str:
+    """Имя вида деятельности: корень и номер узла в дереве, "Еда 2.1" """
+    name = ROOT_ACTIVITIES[root % len(ROOT_ACTIVITIES)]
+    if root >= len(ROOT_ACTIVITIES):
+        name += f" {root // len(ROOT_ACTIVITIES) + 1}"
+    if path:
+        name += " " + ".".join(str(i) for i in path)
+    return name
+
+
+def generate_activities(
+    roots: int, branching: int, depth: int
+) -> List[Tuple[int, str, int]]:
+    """(id, name, parent_id) в порядке обхода в ширину; depth - уровней"""
+    rows = []
+    level = []
+    for root in range(roots):
+        rows.append((len(rows) + 1, activity_name(root, ()), None))
+        level.append((rows[-1][0], root, ()))
+    for _ in range(depth - 1):
+        next_level = []
+        for parent_id, root, path in level:
+            for i in range(1, branching + 1):
+                child_path = path + (i,)
+                rows.append(
+                    (len(rows) + 1, activity_name(root, child_path), parent_id)
+                )
+                next_level.append((rows[-1][0], root, child_path))
+        level = next_level
+    return rows
+
+
+def random_point(rng: random.Random) -> Tuple[str, float, float]:
+    """(название города, широта, долгота) для очередного здания"""
+    if rng.random() < RURAL_SHARE:
+        latitude = rng.uniform(*RUSSIA_LATITUDES)
+        longitude = rng.uniform(*RUSSIA_LONGITUDES)
+        if longitude > 180:
+            longitude -= 360
+        return "пос. Сельский", latitude, longitude
+    city = rng.choices(CITIES, weights=CITY_WEIGHTS)[0]
+    latitude = city.latitude + rng.gauss(0, city.spread_km / KM_PER_DEGREE)
+    longitude = city.longitude + rng.gauss(
+        0,
+        city.spread_km
+        / (KM_PER_DEGREE * math.cos(math.radians(city.latitude))),
+    )
+    if longitude > 180:
+        longitude -= 360
+    return f"г. {city.name}", latitude, longitude
+
+
+def generate_buildings(
+    count: int, rng: random.Random
+) -> Iterator[Tuple[int, str, float, float]]:
+    for building_id in range(1, count + 1):
+        place, latitude, longitude = random_point(rng)
+        address = (
+            f"{place}, ул. {rng.choice(STREETS)}, "
+            f"{rng.randint(1, 150)}, офис {rng.randint(1, 400)}"
+        )
+        yield building_id, address, latitude, longitude
+
+
+def generate_organizations(
+    count: int,
+    buildings: int,
+    activity_ids: List[int],
+    rng: random.Random,
+) -> Iterator[Tuple[int, str, str, int, List[int]]]:
+    """(id, name, phone_numbers, building_id, activity_ids)"""
+    for organization_id in range(1, count + 1):
+        name = (
+            f"{rng.choice(ORGANIZATION_FORMS)} "
+            f'"{rng.choice(ORGANIZATION_WORDS)} {organization_id}"'
+        )
+        phone = None
+        if rng.random() < 0.8:
+            phone = (
+                f"+7 ({rng.randint(300, 999)}) {rng.randint(100, 999)}-"
+                f"{rng.randint(10, 99)}-{rng.randint(10, 99)}"
+            )
+        # Треть организаций сидит в 1% зданий - бизнес-центрах
+        if rng.random() < BUSINESS_CENTER_SHARE:
+            building_id = rng.randint(1, max(1, buildings // 100))
+        else:
+            building_id = rng.randint(1, buildings)
+        activities = sorted(set(rng.sample(activity_ids, rng.randint(1, 3))))
+        yield organization_id, name, phone, building_id, activities
+
+
+def write(args) -> None:
+    rng = random.Random(args.seed)
+    activities = generate_activities(
+        args.activity_roots, args.activity_branching, args.activity_depth
+    )
+    connection = get_engine().raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT EXISTS (SELECT 1 FROM buildings)"
+                " OR EXISTS (SELECT 1 FROM activities)"
+            )
+            if cursor.fetchone()[0]:
+                if not args.replace:
+                    sys.exit("Справочник не пуст; --replace перезапишет его")
+                cursor.execute(
+                    "TRUNCATE organization_activity, organizations,"
+                    " buildings, activities RESTART IDENTITY"
+                )
+
+            started = time.perf_counter()
+            copy_rows(
+                cursor, "activities", ["id", "name", "parent_id"], activities
+            )
+            copy_rows(
+                cursor,
+                "buildings",
+                ["id", "address", "location"],
+                (
+                    (building_id, address, point_ewkb(latitude, longitude))
+                    for building_id, address, latitude, longitude in (
+                        generate_buildings(args.buildings, rng)
+                    )
+                ),
+            )
+            organizations = list(
+                generate_organizations(
+                    args.organizations,
+                    args.buildings,
+                    [row[0] for row in activities],
+                    rng,
+                )
+            )
+            copy_rows(
+                cursor,
+                "organizations",
+                ["id", "name", "phone_numbers", "building_id"],
+                (row[:4] for row in organizations),
+            )
+            links = [
+                (row[0], activity_id)
+                for row in organizations
+                for activity_id in row[4]
+            ]
+            copy_rows(
+                cursor,
+                "organization_activity",
+                ["organization_id", "activity_id"],
+                links,
+            )
+            # Явные id не двигают последовательности
+            for table in ("activities", "buildings", "organizations"):
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'),"
+                    f" (SELECT max(id) FROM {table}))"
+                )
+            for table in (
+                "activities",
+                "buildings",
+                "organizations",
+                "organization_activity",
+            ):
+                cursor.execute(f"ANALYZE {table}")
+        connection.commit()
+    finally:
+        connection.close()
+    print(
+        f"{len(activities)} видов деятельности, {args.buildings} зданий, "
+        f"{args.organizations} организаций, {len(links)} связей "
+        f"за {time.perf_counter() - started:.1f} с",
+        file=sys.stderr,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--buildings", type=int, default=100_000)
+    parser.add_argument("--organizations", type=int, default=300_000)
+    parser.add_argument("--activity-roots", type=int, default=8)
+    parser.add_argument("--activity-branching", type=int, default=4)
+    parser.add_argument(
+        "--activity-depth",
+        type=int,
+        default=5,
+        help="уровней в дереве вместе с корнями",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replace", action="store_true")
+    args = parser.parse_args()
+    write(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""
+Замер всех маршрутов API в процессе, без сети.
+
+Рассчитан на синтетический справочник (python -m benchmarks.dataset):
+точки берутся вокруг тех же городов, id - из диапазона таблиц, имена
+видов деятельности - из базы. Запросы к каждому маршруту строятся от
+--seed и имени маршрута, поэтому при тех же данных и параметрах они
+одинаковы от запуска к запуску. Запросы идут через TestClient
+последовательно; по каждому маршруту печатаются p50/p95/p99 задержки,
+запросов в секунду и SQL-запросов на запрос. Маршруты записи замеряются
+только с --writes: они меняют справочник.
+
+--output сохраняет результаты в JSON вместе с коммитом, --compare
+печатает изменение p50/p95 относительно сохранённого файла.
+Ограничение частоты запросов на время замера отключается.
+
+    python -m benchmarks.endpoints --requests 200 --output before.json
+    python -m benchmarks.endpoints --requests 200 --compare before.json
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app import database, lifecycle
+from app.config import settings
+from app.main import app
+from app.routes import (
+    activities,
+    buildings,
+    export,
+    internal,
+    organizations,
+    tiles,
+)
+from app.tiles import tile_for_point
+from benchmarks.dataset import ORGANIZATION_WORDS, random_point
+
+# Роутеры с префиксами, как они подключены в app.main
+ROUTERS = [
+    (export.router, ""),
+    (organizations.router, "/organizations"),
+    (organizations.write_router, "/organizations"),
+    (buildings.router, "/buildings"),
+    (buildings.write_router, "/buildings"),
+    (activities.router, "/activities"),
+    (activities.write_router, "/activities"),
+    (tiles.router, "/tiles"),
+    (internal.router, "/internal"),
+]
+
+
+class Dataset(NamedTuple):
+    buildings: int
+    organizations: int
+    activities: int
+    activity_names: List[str]
+
+
+# Запрос: метод, путь с параметрами и тело для POST
+Request = Tuple[str, str, Optional[object]]
+Scenario = Callable[[random.Random, Dataset], Request]
+
+
+def get(path: str) -> Request:
+    return "GET", path, None
+
+
+def point(rng: random.Random) -> Tuple[float, float]:
+    _, latitude, longitude = random_point(rng)
+    return round(latitude, 5), round(longitude, 5)
+
+
+def ids(rng: random.Random, high: int, count: int = 20) -> str:
+    return ",".join(str(rng.randint(1, high)) for _ in range(count))
+
+
+def box(rng: random.Random, half: float) -> str:
+    latitude, longitude = point(rng)
+    return (
+        f"min_lat={latitude - half:.5f}&max_lat={latitude + half:.5f}"
+        f"&min_lon={longitude - half:.5f}&max_lon={longitude + half:.5f}"
+    )
+
+
+def list_or_ids(prefix: str, high: Callable[[Dataset], int]) -> Scenario:
+    def scenario(rng, data):
+        if rng.random() < 0.5:
+            return get(f"{prefix}/?ids={ids(rng, high(data))}")
+        skip = rng.randint(0, max(0, high(data) - 100))
+        return get(f"{prefix}/?skip={skip}&limit=100")
+
+    return scenario
+
+
+def search_organizations(rng, data):
+    latitude, longitude = point(rng)
+    variant = rng.randrange(4)
+    if variant == 0:
+        return get(
+            f"/organizations/search?name={rng.choice(ORGANIZATION_WORDS)}"
+        )
+    if variant == 1:
+        return get(
+            f"/organizations/search?latitude={latitude}"
+            f"&longitude={longitude}&radius={rng.choice([0.5, 1, 3])}"
+        )
+    if variant == 2:
+        return get(
+            "/organizations/search?activity_name="
+            f"{rng.choice(data.activity_names)}&activity_depth=2"
+        )
+    return get(
+        f"/organizations/search?latitude={latitude}&longitude={longitude}"
+        f"&radius=5&activity_name={rng.choice(data.activity_names)}"
+    )
+
+
+def read_tile(rng, data):
+    latitude, longitude = point(rng)
+    z, x, y = tile_for_point(latitude, longitude, rng.randint(10, 15))
+    return get(f"/tiles/{z}/{x}/{y}.mvt")
+
+
+def clusters(rng, data):
+    latitude, longitude = point(rng)
+    bbox = ",".join(
+        f"{v:.5f}"
+        for v in (
+            longitude - 0.5,
+            latitude - 0.3,
+            longitude + 0.5,
+            latitude + 0.3,
+        )
+    )
+    return get(f"/buildings/clusters?bbox={bbox}&zoom={rng.randint(8, 12)}")
+
+
+def new_building(rng) -> dict:
+    latitude, longitude = point(rng)
+    return {
+        "address": f"Бенчмарк, {rng.randint(1, 10**6)}",
+        "latitude": latitude,
+        "longitude": longitude,
+    }
+
+
+def new_organization(rng, data) -> dict:
+    return {
+        "name": f"Бенчмарк {rng.randint(1, 10**6)}",
+        "phone_numbers": None,
+        "building_id": rng.randint(1, data.buildings),
+    }
+
+
+def new_activity(rng, data) -> dict:
+    return {
+        "name": f"Бенчмарк {rng.randint(1, 10**6)}",
+        "parent_id": rng.randint(1, data.activities),
+    }
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "GET /organizations/export": lambda rng, data: get(
+        "/organizations/export?latitude={}&longitude={}&radius=1".format(
+            *point(rng)
+        )
+    ),
+    "GET /buildings/export": lambda rng, data: get(
+        f"/buildings/export?{box(rng, 0.02)}"
+    ),
+    "GET /activities/export": lambda rng, data: get(
+        "/activities/export?activity_depth=2&activity_name="
+        + rng.choice(data.activity_names)
+    ),
+    "GET /organizations/": list_or_ids(
+        "/organizations", lambda data: data.organizations
+    ),
+    "GET /organizations/search": search_organizations,
+    "GET /organizations/{organization_id}": lambda rng, data: get(
+        f"/organizations/{rng.randint(1, data.organizations)}"
+    ),
+    "GET /buildings/bounds": lambda rng, data: get(
+        f"/buildings/bounds?{box(rng, 0.05)}"
+    ),
+    "GET /buildings/nearest": lambda rng, data: get(
+        "/buildings/nearest?latitude={}&longitude={}&limit=10".format(
+            *point(rng)
+        )
+    ),
+    "GET /buildings/search/radius": lambda rng, data: get(
+        "/buildings/search/radius?latitude={}&longitude={}&radius={}".format(
+            *point(rng), rng.choice([0.5, 1, 3])
+        )
+    ),
+    "GET /buildings/clusters": clusters,
+    "GET /buildings/{building_id}": lambda rng, data: get(
+        f"/buildings/{rng.randint(1, data.buildings)}"
+    ),
+    "GET /buildings/": list_or_ids("/buildings", lambda data: data.buildings),
+    "GET /buildings/{building_id}/organizations": lambda rng, data: get(
+        f"/buildings/{rng.randint(1, data.buildings)}/organizations"
+    ),
+    "GET /activities/": list_or_ids(
+        "/activities", lambda data: data.activities
+    ),
+    "GET /activities/{activity_id}": lambda rng, data: get(
+        f"/activities/{rng.randint(1, data.activities)}"
+    ),
+    "GET /activities/{activity_id}/organizations": lambda rng, data: get(
+        f"/activities/{rng.randint(1, data.activities)}/organizations"
+    ),
+    "GET /tiles/{z}/{x}/{y}.mvt": read_tile,
+    "GET /internal/cache": lambda rng, data: get("/internal/cache"),
+    "GET /internal/tiles": lambda rng, data: get("/internal/tiles"),
+    "GET /internal/pool": lambda rng, data: get("/internal/pool"),
+    "GET /internal/snapshot": lambda rng, data: get("/internal/snapshot"),
+    "GET /internal/replica": lambda rng, data: get("/internal/replica"),
+    "GET /internal/slow-queries": lambda rng, data: get(
+        "/internal/slow-queries"
+    ),
+    "POST /organizations/": lambda rng, data: (
+        "POST",
+        "/organizations/",
+        new_organization(rng, data),
+    ),
+    "POST /organizations/batch": lambda rng, data: (
+        "POST",
+        "/organizations/batch",
+        [new_organization(rng, data) for _ in range(100)],
+    ),
+    "POST /buildings/": lambda rng, data: (
+        "POST",
+        "/buildings/",
+        new_building(rng),
+    ),
+    "POST /buildings/batch": lambda rng, data: (
+        "POST",
+        "/buildings/batch",
+        [new_building(rng) for _ in range(100)],
+    ),
+    "POST /activities/": lambda rng, data: (
+        "POST",
+        "/activities/",
+        new_activity(rng, data),
+    ),
+    "POST /activities/batch": lambda rng, data: (
+        "POST",
+        "/activities/batch",
+        [new_activity(rng, data) for _ in range(100)],
+    ),
+}
+
+
+def route_names() -> List[str]:
+    return [
+        f"{method} {prefix}{route.path}"
+        for router, prefix in ROUTERS
+        for route in router.routes
+        for method in sorted(route.methods)
+    ]
+
+
+def load_dataset() -> Dataset:
+    with database.get_engine().connect() as conn:
+        counts = [
+            conn.execute(
+                text(f"SELECT coalesce(max(id), 0) FROM {table}")
+            ).scalar()
+            for table in ("buildings", "organizations", "activities")
+        ]
+        names = conn.execute(
+            text("SELECT name FROM activities ORDER BY id LIMIT 200")
+        ).scalars()
+        return Dataset(*counts, list(names))
+
+
+def count_queries():
+    """
+    Счётчики запросов синхронного и, если он есть, асинхронного движка;
+    с DATABASE_READ_URL - и движков реплики
+    """
+    counters = [database.QueryCounter()]
+    if settings.DATABASE_READ_URL:
+        counters.append(database.QueryCounter(database.read_engine))
+    if database.async_engine is not None:
+        counters.append(
+            database.QueryCounter(database.async_engine.sync_engine)
+        )
+        if settings.DATABASE_READ_URL:
+            counters.append(
+                database.QueryCounter(
+                    database.get_async_engine(read=True).sync_engine
+                )
+            )
+    return counters
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def measure(
+    client: TestClient,
+    name: str,
+    scenario: Scenario,
+    data: Dataset,
+    args,
+) -> dict:
+    rng = random.Random(f"{args.seed}:{name}")
+    requests = [scenario(rng, data) for _ in range(args.warmup)]
+    requests += [scenario(rng, data) for _ in range(args.requests)]
+    latencies, queries, errors = [], 0, 0
+    for i, (method, path, body) in enumerate(requests):
+        counters = count_queries()
+        for counter in counters:
+            counter.__enter__()
+        started = time.perf_counter()
+        try:
+            response = client.request(method, path, json=body)
+        finally:
+            elapsed = time.perf_counter() - started
+            for counter in counters:
+                counter.__exit__(None, None, None)
+        if i < args.warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        queries += sum(counter.count for counter in counters)
+        errors += response.status_code >= 400
+    total = sum(latencies) / 1000
+    return {
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "rps": round(len(latencies) / total, 1) if total else 0.0,
+        "queries": round(queries / len(latencies), 2),
+        "errors": errors,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def change(new: float, old: Optional[float]) -> str:
+    if not old:
+        return ""
+    return f" ({(new - old) / old:+.0%})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--writes", action="store_true")
+    parser.add_argument(
+        "--route", action="append", help="замерить только эти маршруты"
+    )
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    parser.add_argument("--compare", help="JSON прошлого запуска")
+    args = parser.parse_args()
+
+    settings.RATE_LIMIT_ENABLED = False
+    names = route_names()
+    missing = [name for name in names if name not in SCENARIOS]
+    if missing:
+        sys.exit(f"Нет сценария для маршрутов: {', '.join(missing)}")
+    if args.route:
+        names = [name for name in names if name in args.route]
+    if not args.writes:
+        names = [name for name in names if not name.startswith("POST ")]
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)["routes"]
+
+    with TestClient(
+        app, headers={"X-API-Key": os.environ["API_KEY"]}
+    ) as client:
+        while lifecycle.readiness.state == "starting":
+            time.sleep(0.1)
+        data = load_dataset()
+        print(
+            f"{data.buildings} зданий, {data.organizations} организаций, "
+            f"{data.activities} видов деятельности; "
+            f"{args.requests} запросов на маршрут"
+        )
+        results = {}
+        for name in names:
+            result = results[name] = measure(
+                client, name, SCENARIOS[name], data, args
+            )
+            old = previous.get(name, {})
+            print(
+                f"{name:<46} "
+                f"p50 {result['p50_ms']:8.2f} мс"
+                f"{change(result['p50_ms'], old.get('p50_ms')):>7} "
+                f"p95 {result['p95_ms']:8.2f} мс"
+                f"{change(result['p95_ms'], old.get('p95_ms')):>7} "
+                f"p99 {result['p99_ms']:8.2f} мс "
+                f"{result['rps']:8.1f} rps "
+                f"{result['queries']:5.1f} SQL"
+                + (f" ошибок: {result['errors']}" if result["errors"] else "")
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "revision": git_revision(),
+                    "dataset": data._asdict(),
+                    "requests": args.requests,
+                    "seed": args.seed,
+                    "routes": results,
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
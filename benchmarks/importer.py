@@ -0,0 +1,92 @@
+"""
+Пропускная способность импорта: первый импорт и повторный с изменёнными
+телефонами (INSERT ... ON CONFLICT DO UPDATE по естественным ключам).
+
+Записи с уникальной меткой в адресе и названии импортируются в базу
+пачками через app.importer и удаляются после замеров.
+
+    python -m benchmarks.importer --records 200000 --batch-size 20000
+"""
+
+import argparse
+import random
+import time
+
+from app.database import get_engine
+from app.importer import Importer, batches
+
+ACTIVITIES = ["Займы", "Кредиты", "Торговля", "Кафе", "Сервис"]
+
+
+def make_records(tag: str, total: int, phone_seed: int):
+    rng = random.Random(0)
+    phones = random.Random(phone_seed)
+    for i in range(total):
+        # По четыре организации на здание
+        building = i // 4
+        yield {
+            "address": f"{tag} здание {building}",
+            "latitude": 55.0 + rng.uniform(-1, 1),
+            "longitude": 37.0 + rng.uniform(-1, 1) + building * 1e-9,
+            "name": f"{tag} организация {i}",
+            "phone_numbers": f"+7 {phones.randrange(10**9):09d}",
+            "activities": ";".join(rng.sample(ACTIVITIES, 2)),
+        }
+
+
+def measure(connection, records, batch_size: int) -> float:
+    importer = Importer(connection)
+    importer.prepare()
+    total = 0
+    started = time.perf_counter()
+    for batch in batches(records, batch_size):
+        importer.import_batch(batch)
+        total += len(batch)
+    return total / (time.perf_counter() - started)
+
+
+def cleanup(connection, tag: str) -> None:
+    pattern = f"{tag}%"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM organization_activity WHERE organization_id IN ("
+            " SELECT id FROM organizations WHERE name LIKE %s)",
+            (pattern,),
+        )
+        cursor.execute(
+            "DELETE FROM organizations WHERE name LIKE %s", (pattern,)
+        )
+        cursor.execute(
+            "DELETE FROM buildings WHERE address LIKE %s", (pattern,)
+        )
+    connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=20000)
+    args = parser.parse_args()
+    tag = f"bench import {time.time_ns()}"
+
+    connection = get_engine().raw_connection()
+    try:
+        print(f"{args.records} записей, пачки по {args.batch_size}:")
+        for label, phone_seed in [
+            ("первый импорт", 1),
+            ("повторный, те же данные", 1),
+            ("повторный, новые телефоны", 2),
+        ]:
+            rate = measure(
+                connection,
+                make_records(tag, args.records, phone_seed),
+                args.batch_size,
+            )
+            print(f"  {label:<28} {rate:>12,.0f} записей/с")
+    finally:
+        cleanup(connection, tag)
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
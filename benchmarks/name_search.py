@@ -0,0 +1,98 @@
+"""
+Задержка поиска организаций по названию с триграммным индексом и без него.
+
+Создаёт временную таблицу с синтетическими названиями (в рамках одного
+соединения, в базу ничего не остаётся), замеряет старый запрос
+ILIKE '%x%' без лимита и новый ранжированный запрос с лимитом, затем
+строит GIN-индекс gin_trgm_ops и повторяет замеры.
+
+    python -m benchmarks.name_search --rows 1000000
+"""
+
+import argparse
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app.database import engine
+
+TERMS = ["займ", "кредит", "ромашка", "сервис", "центр 12", "мфо"]
+
+LEGACY_QUERY = text(
+    "SELECT id, name FROM bench_orgs WHERE name ILIKE :pattern"
+)
+RANKED_QUERY = text(
+    "SELECT id, name, similarity(name, :term) AS score FROM bench_orgs "
+    "WHERE name ILIKE :pattern OR name % :term "
+    "ORDER BY score DESC, id LIMIT :limit"
+)
+
+WORDS = [
+    "Займ",
+    "Кредит",
+    "Деньги",
+    "Ромашка",
+    "Сервис",
+    "Центр",
+    "Экспресс",
+    "Финанс",
+    "Быстро",
+    "МФО",
+    "Капитал",
+    "Сбер",
+]
+
+
+def measure(conn, query, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        for term in TERMS:
+            params = {"pattern": f"%{term}%", "term": term, "limit": 20}
+            started = time.perf_counter()
+            conn.execute(query, params).fetchall()
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def report(conn, label: str, repeat: int) -> None:
+    for name, query in [
+        ("ILIKE", LEGACY_QUERY),
+        ("ранжирование", RANKED_QUERY),
+    ]:
+        elapsed = measure(conn, query, repeat)
+        print(f"  {name + ' ' + label:<28} {elapsed:9.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    words = "ARRAY[" + ",".join(f"'{w}'" for w in WORDS) + "]"
+    with engine.connect() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(
+            text(
+                "CREATE TEMP TABLE bench_orgs AS "
+                f"SELECT g AS id, ({words})[1 + g % {len(WORDS)}] || ' ' || "
+                f"({words})[1 + (g / {len(WORDS)}) % {len(WORDS)}] || ' ' || "
+                "g AS name FROM generate_series(1, :rows) AS g"
+            ),
+            {"rows": args.rows},
+        )
+        conn.execute(text("ANALYZE bench_orgs"))
+
+        print(f"{args.rows} организаций, медиана по {len(TERMS)} запросам:")
+        report(conn, "без индекса", args.repeat)
+        conn.execute(
+            text("CREATE INDEX ON bench_orgs USING gin (name gin_trgm_ops)")
+        )
+        conn.execute(text("ANALYZE bench_orgs"))
+        report(conn, "с GIN", args.repeat)
+        conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
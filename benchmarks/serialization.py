@@ -0,0 +1,99 @@
+"""
+Сериализация страницы OrganizationWithRelations: Pydantic против orjson.
+
+Сравнивает путь по умолчанию (validate_python(from_attributes=True) +
+dump_json, как у FastAPI с response_model) с быстрым путём
+FAST_SERIALIZATION_ENABLED (сборка словарей + orjson), проверяет, что
+байты ответа совпадают, и печатает, сколько страниц в секунду успевает
+сериализовать одно ядро - верхнюю границу запросов/с на ядро.
+
+Базе данных не нужен: объекты генерируются в памяти.
+
+    python -m benchmarks.serialization --rows 100
+"""
+
+import argparse
+import random
+import timeit
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+
+from app import schemas
+from app.serialization import organization_with_relations
+
+NAMES = ["Рога и Копыта", "ДоброЗайм", 'ООО "Ромашка"', "Сервис\tЦентр"]
+
+
+class Row:
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+def make_page(rows: int, rng: random.Random) -> List[Row]:
+    activities = [
+        Row(id=i, name=f"Деятельность {i}", parent_id=i // 3 or None)
+        for i in range(1, 30)
+    ]
+    page = []
+    for i in range(1, rows + 1):
+        building = Row(
+            id=i,
+            address=f"г. Москва, ул. Ленина {i}, офис {rng.randint(1, 99)}",
+            latitude=rng.uniform(41, 70),
+            longitude=rng.uniform(19, 180),
+        )
+        page.append(
+            Row(
+                id=i,
+                name=f"{rng.choice(NAMES)} {i}",
+                phone_numbers=rng.choice([None, "+7 (343) 311-21-21"]),
+                building_id=building.id,
+                building=building,
+                activities=rng.sample(activities, rng.randint(0, 4)),
+            )
+        )
+    return page
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    page = make_page(args.rows, random.Random(0))
+    adapter = TypeAdapter(List[schemas.OrganizationWithRelations])
+
+    def pydantic_validate():
+        return adapter.dump_json(
+            adapter.validate_python(page, from_attributes=True)
+        )
+
+    def orjson_dicts():
+        return orjson.dumps([organization_with_relations(o) for o in page])
+
+    assert pydantic_validate() == orjson_dicts(), "ответы различаются"
+
+    print(
+        f"Страница из {args.rows} OrganizationWithRelations, "
+        f"лучшее из {args.repeat} прогонов:"
+    )
+    for name, fn in [
+        ("Pydantic from_attributes", pydantic_validate),
+        ("словари + orjson", orjson_dicts),
+    ]:
+        best = min(
+            timeit.repeat(fn, number=args.number, repeat=args.repeat)
+        )
+        per_page = best / args.number
+        print(
+            f"  {name:<26} {per_page * 1000:8.3f} мс/страница "
+            f"{1 / per_page:10,.0f} страниц/с на ядро"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Дерево видов деятельности в памяти.
+
+База не нужна: дерево собирается из строк через build(), ttl=0 - без
+перезагрузки.
+"""
+
+from app.activity_tree import ActivityTree
+
+ROWS = [
+    (1, "Еда", None),
+    (2, "Мясная продукция", 1),
+    (3, "Молочная продукция", 1),
+    (4, "Сыры", 3),
+    (5, "Продукция", None),
+]
+
+
+def make_tree(rows=ROWS) -> ActivityTree:
+    tree = ActivityTree(ttl=0)
+    tree.build(rows)
+    return tree
+
+
+def test_find_exact_name_first():
+    # Точное совпадение важнее меньшего id с подстрокой
+    assert make_tree().find(None, "продукция") == 5
+
+
+def test_find_substring_lowest_id():
+    assert make_tree().find(None, "ПРОДУК") == 2
+    assert make_tree().find(None, "нет такого") is None
+
+
+def test_descendants_depth():
+    tree = make_tree()
+    assert tree.descendants(None, 1, depth=1) == {1, 2, 3}
+    assert tree.descendants(None, 1, depth=None) == {1, 2, 3, 4}
+
+
+def test_stale_descendants_not_cached_after_rebuild():
+    tree = make_tree()
+    rebuilt = ROWS + [(6, "Творог", 3)]
+    children = tree._children
+
+    class RebuildOnRead(dict):
+        """Конкурентный build() посреди обхода старого дерева"""
+
+        def get(self, key, default=None):
+            if tree._children is children:
+                tree.build(rebuilt)
+            return dict.get(self, key, default)
+
+    tree._children = children = RebuildOnRead(children)
+    # Посчитано по старому дереву, но в кэш после build() не попадает
+    assert tree.descendants(None, 3, depth=None) == {3, 4}
+    assert tree.descendants(None, 3, depth=None) == {3, 4, 6}
@@ -0,0 +1,68 @@
+"""
+Асинхронные двойники GET-маршрутов повторяют синхронные: путь, параметры
+запроса с проверками, зависимости, схему ответа, описание и кэш.
+
+База не нужна: сравниваются сами маршруты.
+"""
+
+import pytest
+from fastapi.routing import APIRoute
+
+from app.routes import (
+    activities,
+    async_activities,
+    async_buildings,
+    async_organizations,
+    buildings,
+    organizations,
+)
+from app.routes.async_mirror import AsyncMirror
+
+PAIRS = [
+    (buildings, async_buildings),
+    (organizations, async_organizations),
+    (activities, async_activities),
+]
+
+
+def describe(route: APIRoute):
+    dependant = route.dependant
+    return (
+        route.path,
+        route.methods,
+        route.response_model,
+        route.endpoint.__doc__,
+        [
+            (param.name, repr(param.field_info))
+            for param in dependant.query_params + dependant.path_params
+        ],
+        [
+            dependency.call
+            for dependency in dependant.dependencies
+            if dependency.name not in ("db", "source")
+        ],
+    )
+
+
+@pytest.mark.parametrize("sync_module, async_module", PAIRS)
+def test_async_routes_mirror_sync(sync_module, async_module):
+    sync_routes = {
+        route.path: route
+        for route in sync_module.router.routes
+        if "GET" in route.methods
+    }
+    async_routes = async_module.router.routes
+    assert [route.path for route in async_routes] == list(sync_routes)
+    for route in async_routes:
+        assert describe(route) == describe(sync_routes[route.path])
+        assert hasattr(route.endpoint, "cache")
+        assert route.dependant.dependencies[-1].name == "db"
+
+
+def test_mirror_rejects_mismatched_parameters():
+    mirror = AsyncMirror(buildings.router)
+    with pytest.raises(TypeError):
+
+        @mirror(buildings.get_nearest_buildings)
+        async def get_nearest_buildings(latitude, longitude, db):
+            pass
@@ -0,0 +1,148 @@
+"""
+Гео-запросы и выборка по зданию идут по индексам.
+
+SQL функций crud перехватывается вместе с параметрами и прогоняется
+через EXPLAIN (FORMAT JSON) с enable_seqscan = off: на маленькой
+тестовой базе планировщик и так выбрал бы последовательное чтение, а
+здесь важно, может ли условие вообще обслуживаться индексом. Seq Scan
+при выключенном enable_seqscan остаётся, только если подходящего индекса
+нет. Для радиуса годится любой из двух GiST-индексов: geography(location)
+под ST_DWithin или location под рамкой &&.
+"""
+
+import json
+from typing import Callable, List, Set, Tuple
+
+import pytest
+from sqlalchemy import event
+
+from app import crud, schemas
+from app.database import SessionLocal, get_engine
+from app.spatial_index import building_index
+
+GEOGRAPHY_INDEX = "ix_buildings_location_geography"
+GEOMETRY_INDEX = "idx_buildings_location"
+BUILDING_ID_INDEX = "uq_organizations_building_id_name"
+
+# Название, запрос, таблица, которую нельзя читать целиком, и индексы,
+# хотя бы один из которых должен быть в плане
+CASES: List[Tuple[str, Callable, str, Set[str]]] = [
+    (
+        "здания в радиусе",
+        lambda db: crud.get_buildings_in_radius(db, 55.75, 37.61, 5),
+        "buildings",
+        {GEOGRAPHY_INDEX, GEOMETRY_INDEX},
+    ),
+    (
+        "здания в радиусе через 180-й меридиан",
+        lambda db: crud.get_buildings_in_radius(db, 65.0, 179.99, 50),
+        "buildings",
+        {GEOGRAPHY_INDEX, GEOMETRY_INDEX},
+    ),
+    (
+        "ближайшие здания (KNN)",
+        lambda db: crud.get_nearest_buildings(db, 55.75, 37.61, 5),
+        "buildings",
+        {GEOGRAPHY_INDEX},
+    ),
+    (
+        "здания в границах",
+        lambda db: crud.get_buildings_in_bounds(db, 55, 56, 37, 38),
+        "buildings",
+        {GEOMETRY_INDEX},
+    ),
+    (
+        "здания в границах через 180-й меридиан",
+        lambda db: crud.get_buildings_in_bounds(db, 60, 70, 170, -170),
+        "buildings",
+        {GEOMETRY_INDEX},
+    ),
+    (
+        "организации в радиусе",
+        lambda db: crud.get_organizations_by_coordinates(db, 55.75, 37.61, 3),
+        "buildings",
+        {GEOGRAPHY_INDEX, GEOMETRY_INDEX},
+    ),
+    (
+        "поиск организаций по точке",
+        lambda db: crud.search_organizations(
+            db,
+            schemas.OrganizationSearch(
+                latitude=55.75, longitude=37.61, radius=3
+            ),
+        ),
+        "buildings",
+        {GEOGRAPHY_INDEX, GEOMETRY_INDEX},
+    ),
+    (
+        "организации здания",
+        lambda db: crud.get_organizations_by_building(db, 1),
+        "organizations",
+        {BUILDING_ID_INDEX},
+    ),
+    (
+        "поиск организаций по зданию",
+        lambda db: crud.search_organizations(
+            db, schemas.OrganizationSearch(building_id=1)
+        ),
+        "organizations",
+        {BUILDING_ID_INDEX},
+    ),
+]
+
+
+def capture(func: Callable) -> List[Tuple[str, object]]:
+    """SQL-запросы с параметрами, выполненные func(db)"""
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, *args):
+        statements.append((statement, parameters))
+
+    engine = get_engine()
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        with SessionLocal() as db:
+            func(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+    return statements
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(statement: str, parameters) -> List[dict]:
+    with get_engine().connect() as conn:
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        result = conn.exec_driver_sql(
+            "EXPLAIN (FORMAT JSON) " + statement, parameters
+        ).scalar()
+        conn.rollback()
+    if isinstance(result, str):
+        result = json.loads(result)
+    return list(plan_nodes(result[0]["Plan"]))
+
+
+@pytest.mark.parametrize(
+    "func, table, expected",
+    [case[1:] for case in CASES],
+    ids=[case[0] for case in CASES],
+)
+def test_uses_index(client, dataset, monkeypatch, func, table, expected):
+    # Запросы к базе, а не к пространственному индексу в памяти
+    monkeypatch.setattr(building_index, "ready", False)
+    nodes = []
+    for statement, parameters in capture(func):
+        nodes += explain(statement, parameters)
+    seq_scans = [
+        node
+        for node in nodes
+        if node["Node Type"] == "Seq Scan"
+        and node.get("Relation Name") == table
+    ]
+    assert not seq_scans, f"Seq Scan по {table}"
+    used = {node["Index Name"] for node in nodes if "Index Name" in node}
+    assert expected & used, f"индексы в плане: {sorted(used)}"
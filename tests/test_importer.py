@@ -0,0 +1,73 @@
+"""
+Импорт справочника: повторный и параллельный импорт без дублей.
+
+Нужна база (фикстура client создаёт схему с уникальными ключами импорта).
+"""
+
+import threading
+import time
+
+from sqlalchemy import text
+
+from app.database import SessionLocal, get_engine
+from app.importer import Importer
+
+
+def make_records(tag: str, phone: str, activities: bool = True):
+    return [
+        {
+            "address": f"{tag} здание {i % 5}",
+            "latitude": 55.7 + i % 5 / 100,
+            "longitude": 37.6,
+            "name": f"{tag} организация {i}",
+            "phone_numbers": phone,
+            "activities": f"{tag} вид" if activities else None,
+        }
+        for i in range(20)
+    ]
+
+
+def run_import(records) -> None:
+    connection = get_engine().raw_connection()
+    try:
+        importer = Importer(connection)
+        importer.prepare()
+        importer.import_batch(records)
+    finally:
+        connection.close()
+
+
+def imported(tag: str):
+    """Число зданий, организаций и телефоны организаций с меткой tag"""
+    with SessionLocal() as db:
+        buildings = db.scalar(
+            text("SELECT count(*) FROM buildings WHERE address LIKE :tag"),
+            {"tag": f"{tag}%"},
+        )
+        phones = db.scalars(
+            text(
+                "SELECT phone_numbers FROM organizations WHERE name LIKE :tag"
+            ),
+            {"tag": f"{tag}%"},
+        ).all()
+    return buildings, len(phones), set(phones)
+
+
+def test_reimport_updates_changed_fields(client):
+    tag = f"import {time.time_ns()}"
+    run_import(make_records(tag, "+7 000"))
+    run_import(make_records(tag, "+7 111"))
+    assert imported(tag) == (5, 20, {"+7 111"})
+
+
+def test_concurrent_imports_create_no_duplicates(client):
+    tag = f"import {time.time_ns()}"
+    records = make_records(tag, "+7 000", activities=False)
+    threads = [
+        threading.Thread(target=run_import, args=(records,)) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert imported(tag) == (5, 20, {"+7 000"})
@@ -0,0 +1,31 @@
+"""
+Остановка приложения во время запуска.
+
+База не нужна: ping_db подменён недоступной базой.
+"""
+
+import threading
+import time
+
+from app import lifecycle
+from app.config import settings
+from app.lifecycle import Readiness
+
+
+def test_stop_interrupts_wait_for_db(monkeypatch):
+    def ping_db():
+        raise ConnectionError("база недоступна")
+
+    monkeypatch.setattr(lifecycle, "ping_db", ping_db)
+    monkeypatch.setattr(lifecycle, "readiness", Readiness())
+    monkeypatch.setattr(settings, "SNAPSHOT_PATH", None)
+    monkeypatch.setattr(settings, "DB_WAIT_TIMEOUT", 60.0)
+    stop = threading.Event()
+    thread = threading.Thread(target=lifecycle.startup, args=(stop,))
+    thread.start()
+    time.sleep(0.1)
+    stop.set()
+    thread.join(5)
+    assert not thread.is_alive()
+    # Остановка - не ошибка запуска
+    assert lifecycle.readiness.state == "starting"
@@ -0,0 +1,130 @@
+import asyncio
+import gc
+from types import SimpleNamespace
+
+import pytest
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app import auth
+from app.auth import hold_concurrency_slot, verify_api_key
+from app.config import settings
+from app.limits import KeyLimits, Limiter, parse_api_keys
+
+
+@pytest.fixture(autouse=True)
+def defaults(monkeypatch):
+    monkeypatch.setattr(settings, "API_KEY", None)
+    monkeypatch.setattr(settings, "RATE_LIMIT_PER_SECOND", 20.0)
+    monkeypatch.setattr(settings, "RATE_LIMIT_BURST", 40)
+    monkeypatch.setattr(settings, "RATE_LIMIT_CONCURRENCY", 8)
+    monkeypatch.setattr(settings, "GEO_RATE_LIMIT_PER_SECOND", 5.0)
+    monkeypatch.setattr(settings, "GEO_RATE_LIMIT_BURST", 10)
+
+
+def keys(monkeypatch, api_keys: str):
+    monkeypatch.setattr(settings, "API_KEYS", api_keys)
+    return parse_api_keys()
+
+
+def test_overrides(monkeypatch):
+    assert keys(monkeypatch, "a, b:1.5:3:2, c::5") == {
+        "a": KeyLimits(20.0, 40, 8),
+        "b": KeyLimits(1.5, 3, 2),
+        "c": KeyLimits(20.0, 5, 8),
+    }
+
+
+@pytest.mark.parametrize(
+    "api_keys, error",
+    [
+        ("a:x", "запись 1: rate - не число"),
+        ("a, b:1:2.5", "запись 2: burst - не число"),
+        ("a:1:2:3:4", "запись 1: ожидается key:rate:burst:concurrency"),
+        (":5", "запись 1: пустой ключ"),
+        ("a:0", "запись 1: пределы должны быть положительными"),
+        ("a:-1", "запись 1: пределы должны быть положительными"),
+        ("a:nan", "запись 1: пределы должны быть положительными"),
+        ("a:1:0", "запись 1: пределы должны быть положительными"),
+        ("a:1:1:0", "запись 1: пределы должны быть положительными"),
+    ],
+)
+def test_invalid_entry(monkeypatch, api_keys, error):
+    with pytest.raises(ValueError, match=error):
+        keys(monkeypatch, api_keys)
+
+
+def test_error_does_not_leak_key(monkeypatch):
+    with pytest.raises(ValueError) as raised:
+        keys(monkeypatch, "secret-key:0")
+    assert "secret-key" not in str(raised.value)
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [
+        ("RATE_LIMIT_PER_SECOND", 0.0),
+        ("RATE_LIMIT_BURST", 0),
+        ("GEO_RATE_LIMIT_PER_SECOND", 0.0),
+    ],
+)
+def test_invalid_defaults(monkeypatch, name, value):
+    monkeypatch.setattr(settings, name, value)
+    with pytest.raises(ValueError, match="RATE_LIMIT"):
+        keys(monkeypatch, "a")
+
+
+@pytest.fixture
+def slots(monkeypatch):
+    """Ключ "k" с одним слотом одновременных запросов"""
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    limiter = Limiter({"k": KeyLimits(100.0, 100, 1)})
+    monkeypatch.setattr(auth, "limiter", limiter)
+    return limiter.clients["k"]
+
+
+def test_stream_holds_slot_after_dependency_exit(slots):
+    async def respond():
+        request = SimpleNamespace(state=SimpleNamespace())
+        dependency = verify_api_key(request, "k")
+        await dependency.__anext__()
+        stream = hold_concurrency_slot(request, iter([b"a", b"b"]))
+        # Выход из зависимости до отправки тела, как в FastAPI < 0.118
+        await dependency.aclose()
+        return stream
+
+    stream = asyncio.run(respond())
+    assert slots.active == 1
+    assert next(stream) == b"a"
+    assert slots.active == 1
+    assert list(stream) == [b"b"]
+    assert slots.active == 0
+
+
+def test_unread_stream_releases_slot(slots):
+    request = SimpleNamespace(state=SimpleNamespace(concurrency_slot=slots))
+    slots.try_enter()
+    stream = hold_concurrency_slot(request, iter([b"a"]))
+    del stream
+    gc.collect()
+    assert slots.active == 0
+
+
+def test_streaming_export_counts_against_limit(slots):
+    app = FastAPI()
+    active = []
+
+    @app.get("/export", dependencies=[Depends(verify_api_key)])
+    def export(request: Request):
+        def chunks():
+            for chunk in (b"a", b"b"):
+                active.append(slots.active)
+                yield chunk
+
+        return StreamingResponse(hold_concurrency_slot(request, chunks()))
+
+    response = TestClient(app).get("/export", headers={"X-API-Key": "k"})
+    assert response.content == b"ab"
+    assert active == [1, 1]
+    assert slots.active == 0
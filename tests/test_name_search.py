@@ -0,0 +1,98 @@
+"""
+Поиск организаций по названию и постраничная выдача по X-Next-Cursor.
+
+Нужна база: к dataset добавляются организации с уникальным словом в
+названии.
+"""
+
+import time
+
+import pytest
+from sqlalchemy import text
+
+from app import crud, schemas
+from app.database import SessionLocal
+from app.pagination import NEXT_CURSOR_HEADER, encode_cursor
+
+
+@pytest.fixture(scope="module")
+def named(dataset):
+    """
+    Названия с уникальным словом по убыванию похожести на него: каждое
+    следующее добавляет триграммы. Создаются в обратном порядке, чтобы
+    порядок id не совпадал с порядком похожести
+    """
+    word = f"трг{time.time_ns()}"
+    names = [
+        word,
+        f"{word} сервис",
+        f"{word} сервис центр",
+        f"{word} сервис центр москва",
+        f"дом {word} сервис центр москва",
+    ]
+    with SessionLocal() as db:
+        organizations = crud.create_organizations(
+            db,
+            [
+                schemas.OrganizationCreate(
+                    name=name, building_id=dataset["buildings"][0]
+                )
+                for name in reversed(names)
+            ],
+        )
+    return word, names, sorted(o.id for o in organizations)
+
+
+def pages(client, url: str, params: dict) -> list:
+    """Все страницы по курсору из X-Next-Cursor"""
+    results = []
+    while True:
+        response = client.get(url, params=params)
+        assert response.status_code == 200, response.text
+        results.append(response.json())
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return results
+        params = dict(params, cursor=cursor)
+
+
+def test_trigram_indexes_created(client):
+    with SessionLocal() as db:
+        indexes = set(
+            db.scalars(
+                text(
+                    "SELECT indexname FROM pg_indexes "
+                    "WHERE indexdef LIKE '%gin_trgm_ops%'"
+                )
+            )
+        )
+    assert {"ix_organizations_name_trgm", "ix_activities_name_trgm"} <= (
+        indexes
+    )
+
+
+def test_name_search_ordered_by_similarity(client, named):
+    word, names, _ = named
+    response = client.get("/organizations/search", params={"name": word})
+    assert response.status_code == 200, response.text
+    assert [o["name"] for o in response.json()] == names
+
+
+def test_name_search_pages(client, named):
+    word, names, _ = named
+    found = pages(client, "/organizations/search", {"name": word, "limit": 2})
+    assert [len(page) for page in found] == [2, 2, 1]
+    assert [o["name"] for page in found for o in page] == names
+
+
+def test_list_pages_by_id(client, named):
+    _, _, ids = named
+    # Первая страница - сразу перед организациями named
+    found = pages(
+        client,
+        "/organizations/",
+        {"limit": 2, "cursor": encode_cursor(ids[0] - 1)},
+    )
+    listed = [o["id"] for page in found for o in page]
+    assert listed == sorted(set(listed))
+    assert listed[: len(ids)] == ids
@@ -0,0 +1,61 @@
+"""
+Бюджет SQL-запросов на эндпоинт.
+
+Каждый список запрашивается с маленькой и большой страницей: запросов
+не больше бюджета, и их число не зависит от размера страницы (нет N+1
+при сериализации связей).
+"""
+
+from contextlib import ExitStack
+
+import pytest
+
+from app.database import (
+    QueryCounter,
+    get_async_engine,
+    get_engine,
+    get_read_engine,
+)
+
+# Запрос строк и по одному selectinload на каждую связь схемы ответа
+BUDGETS = {
+    # организации с JOIN здания + виды деятельности
+    "/organizations/?limit={limit}": 2,
+    # здания + организации + их виды деятельности
+    "/buildings/?limit={limit}": 3,
+    "/activities/?limit={limit}": 1,
+    "/buildings/search/radius?latitude=55.75&longitude=37.61"
+    "&radius=50&limit={limit}": 3,
+    "/buildings/bounds?min_lat=55&max_lat=56&min_lon=37&max_lon=38"
+    "&limit={limit}": 3,
+    "/organizations/search?latitude=55.75&longitude=37.61&radius=50"
+    "&limit={limit}": 2,
+}
+
+
+def fetch(client, url):
+    """Число строк ответа и SQL-запросов ко всем движкам приложения"""
+    engines = {get_engine(), get_read_engine()}
+    for read in (False, True):
+        # С ASYNC_DB_ENABLED GET-маршруты обслуживает AsyncEngine
+        async_engine = get_async_engine(read)
+        if async_engine is not None:
+            engines.add(async_engine.sync_engine)
+    with ExitStack() as stack:
+        counters = [
+            stack.enter_context(QueryCounter(engine)) for engine in engines
+        ]
+        response = client.get(url)
+    assert response.status_code == 200, response.text
+    return len(response.json()), sum(counter.count for counter in counters)
+
+
+@pytest.mark.parametrize("endpoint", BUDGETS)
+def test_query_budget(client, dataset, endpoint):
+    small_rows, small = fetch(client, endpoint.format(limit=5))
+    large_rows, large = fetch(client, endpoint.format(limit=100))
+    assert small_rows < large_rows
+    assert (
+        small == large
+    ), f"{small} запросов на {small_rows} строк, {large} на {large_rows}"
+    assert large <= BUDGETS[endpoint]
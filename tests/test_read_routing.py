@@ -0,0 +1,186 @@
+"""
+Маршрутизация сессий между основной базой и репликой.
+
+База не нужна: фабрики сессий подменены, проверяется только, какую из них
+выбирает запрос.
+"""
+
+import threading
+import time
+
+import pytest
+from starlette.requests import Request
+
+from app import cache, database
+from app.cache import ResponseCache, cached
+from app.config import settings
+from app.database import RecentWrites, ReplicaLag
+
+
+class FakeSession:
+    def __init__(self, database: str):
+        self.database = database
+        self.info = {}
+
+    def close(self) -> None:
+        pass
+
+
+def make_request(method: str = "GET", client: str = "client-a") -> Request:
+    request = Request(
+        {
+            "type": "http",
+            "method": method,
+            "path": "/",
+            "query_string": b"",
+            "headers": [],
+        }
+    )
+    # Как после app.auth.verify_api_key
+    request.state.api_key = client
+    return request
+
+
+def served_by(request: Request) -> str:
+    """Какой базе достанется сессия get_db для запроса"""
+    dependency = database.get_db(request)
+    session = next(dependency)
+    dependency.close()
+    return session.database
+
+
+@pytest.fixture(autouse=True)
+def replica(monkeypatch):
+    monkeypatch.setattr(
+        settings, "DATABASE_READ_URL", "postgresql://replica/app"
+    )
+    monkeypatch.setattr(settings, "READ_YOUR_WRITES_WINDOW", 5.0)
+    monkeypatch.setattr(settings, "REPLICA_MAX_LAG", 30.0)
+    monkeypatch.setattr(
+        database, "SessionLocal", lambda: FakeSession("primary")
+    )
+    monkeypatch.setattr(
+        database, "ReadSessionLocal", lambda: FakeSession("replica")
+    )
+    monkeypatch.setattr(database, "recent_writes", RecentWrites())
+    lag = ReplicaLag()
+    lag.update(0.0)
+    monkeypatch.setattr(database, "replica_lag", lag)
+    return lag
+
+
+def test_get_reads_from_replica():
+    assert served_by(make_request("GET")) == "replica"
+
+
+@pytest.mark.parametrize("method", ["POST", "PUT", "PATCH", "DELETE"])
+def test_write_goes_to_primary(method):
+    assert served_by(make_request(method)) == "primary"
+
+
+def test_without_replica_everything_goes_to_primary(monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_READ_URL", None)
+    assert served_by(make_request("GET")) == "primary"
+
+
+def test_recent_writer_is_pinned_to_primary():
+    served_by(make_request("POST", client="client-a"))
+    assert served_by(make_request("GET", client="client-a")) == "primary"
+    # Другой клиент своей записи не ждёт
+    assert served_by(make_request("GET", client="client-b")) == "replica"
+
+
+def test_pin_expires_after_window(monkeypatch):
+    monkeypatch.setattr(settings, "READ_YOUR_WRITES_WINDOW", 0.05)
+    served_by(make_request("POST"))
+    assert served_by(make_request("GET")) == "primary"
+    time.sleep(0.1)
+    assert served_by(make_request("GET")) == "replica"
+
+
+def test_pin_follows_verified_client_not_raw_header():
+    write = make_request("POST", client="client-a")
+    served_by(write)
+    read = Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "query_string": b"",
+            "headers": [(b"x-api-key", b"client-a")],
+        }
+    )
+    # Заголовок без проверки ключа не закрепляет за основной базой
+    assert served_by(read) == "replica"
+
+
+def test_lagging_replica_falls_back_to_primary(replica):
+    replica.update(settings.REPLICA_MAX_LAG + 1)
+    assert served_by(make_request("GET")) == "primary"
+    replica.update(settings.REPLICA_MAX_LAG - 1)
+    assert served_by(make_request("GET")) == "replica"
+
+
+def test_unreachable_replica_falls_back_to_primary(replica):
+    replica.update(None, "connection refused")
+    assert served_by(make_request("GET")) == "primary"
+
+
+def test_standalone_read_database_is_not_lagging(replica):
+    # Не потоковая реплика: replica_status не знает отставания
+    replica.update(None)
+    assert served_by(make_request("GET")) == "replica"
+
+
+def test_lag_check_disabled(monkeypatch, replica):
+    monkeypatch.setattr(settings, "REPLICA_MAX_LAG", 0)
+    replica.update(None, "connection refused")
+    assert served_by(make_request("GET")) == "replica"
+
+
+def test_stale_lag_is_measured_in_background(monkeypatch):
+    measured = threading.Event()
+
+    def replica_status():
+        measured.set()
+        return {"in_recovery": True, "lag_seconds": 120.0, "lag_bytes": 0}
+
+    monkeypatch.setattr(database, "replica_status", replica_status)
+    monkeypatch.setattr(settings, "REPLICA_LAG_CHECK_INTERVAL", 0)
+    lag = ReplicaLag()
+    # Первый запрос не ждёт замера
+    assert not lag.lagging()
+    assert measured.wait(5)
+    deadline = time.monotonic() + 5
+    while lag.lag_seconds is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert lag.lagging()
+
+
+@cached(str, ())
+def read_database(db=None):
+    """Кэшируемый GET-эндпоинт: какая база ответила"""
+    return db.database
+
+
+def cached_read(request: Request) -> bytes:
+    dependency = database.get_db(request)
+    db = next(dependency)
+    try:
+        return read_database(db=db)
+    finally:
+        dependency.close()
+
+
+def test_pinned_client_bypasses_response_cache(monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "FAST_SERIALIZATION_ENABLED", False)
+    monkeypatch.setattr(
+        cache, "response_cache", ResponseCache(10, 1 << 20, 60)
+    )
+    # Ответ реплики, ещё не получившей запись client-a, попадает в кэш
+    assert cached_read(make_request("GET", "client-b")).body == b'"replica"'
+    served_by(make_request("POST", client="client-a"))
+    # Писавший клиент не получает его из кэша и не кэширует свой ответ
+    assert cached_read(make_request("GET", "client-a")) == "primary"
+    assert cached_read(make_request("GET", "client-b")).body == b'"replica"'
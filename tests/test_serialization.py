@@ -0,0 +1,138 @@
+"""
+Быстрая сериализация (FAST_SERIALIZATION_ENABLED) против Pydantic.
+
+База не нужна: ORM-объекты заменены объектами с теми же атрибутами. Для
+каждой схемы со сборщиком байты ответа должны совпадать с
+TypeAdapter(schema).dump_json().
+"""
+
+from typing import List
+
+import pytest
+
+from app import schemas
+from app.config import settings
+from app.serialization import BUILDERS, _fast_serializer, serializer
+
+
+class Row:
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+# Координаты с длинной дробной частью, целые, отрицательные и крайние
+COORDINATES = [
+    (55.75582600000001, 37.617299900000004),
+    (0.1 + 0.2, -179.99999999999997),
+    (-90.0, 180.0),
+    (60.0, 1e-07),
+    (None, None),
+]
+NAMES = ['ООО "Ромашка"', "Сервис\tЦентр", "Кафе \\ бар", "Café ☕  "]
+
+
+def make_activities() -> List[Row]:
+    return [
+        Row(id=1, name="Еда", parent_id=None),
+        Row(id=2, name="Молочная продукция", parent_id=1),
+    ]
+
+
+def make_buildings() -> List[Row]:
+    return [
+        Row(
+            id=i,
+            address=f"{NAMES[i % len(NAMES)]}, {i}",
+            latitude=lat,
+            longitude=lon,
+        )
+        for i, (lat, lon) in enumerate(COORDINATES, start=1)
+    ]
+
+
+def make_organizations() -> List[Row]:
+    activities = make_activities()
+    organizations = []
+    for i, building in enumerate(make_buildings(), start=1):
+        organizations.append(
+            Row(
+                id=i,
+                name=NAMES[i % len(NAMES)],
+                # Без телефона и без видов деятельности - null и []
+                phone_numbers=None if i % 2 else "+7 (343) 311-21-21",
+                building_id=building.id,
+                building=building,
+                activities=activities[: i % 3],
+            )
+        )
+    return organizations
+
+
+def with_relations():
+    """Связи в обе стороны, у части объектов - пустые"""
+    organizations = make_organizations()
+    buildings = [o.building for o in organizations]
+    for building in buildings:
+        building.organizations = [
+            o for o in organizations if o.building is building
+        ]
+    buildings.append(
+        Row(
+            id=99,
+            address="Пустое",
+            latitude=None,
+            longitude=None,
+            organizations=[],
+        )
+    )
+    activities = make_activities()
+    for activity in activities:
+        activity.organizations = [
+            o
+            for o in organizations
+            if any(a.id == activity.id for a in o.activities)
+        ]
+    activities.append(
+        Row(id=3, name="Без организаций", parent_id=None, organizations=[])
+    )
+    return activities, buildings, organizations
+
+
+def rows_for(schema):
+    activities, buildings, organizations = with_relations()
+    if schema is schemas.BuildingWithDistance:
+        return [
+            Row(
+                id=b.id,
+                address=b.address,
+                latitude=b.latitude,
+                longitude=b.longitude,
+                distance=d,
+            )
+            for b, d in zip(buildings, [0.0, 1 / 3, 12345.678901234567])
+            if b.latitude is not None
+        ]
+    if schema in (schemas.Activity, schemas.ActivityWithRelations):
+        return activities
+    if schema in (schemas.Building, schemas.BuildingWithRelations):
+        return buildings
+    return organizations
+
+
+def serialize(model, result, fast: bool, monkeypatch) -> bytes:
+    monkeypatch.setattr(settings, "FAST_SERIALIZATION_ENABLED", fast)
+    return serializer(model)(result)
+
+
+@pytest.mark.parametrize("schema", BUILDERS, ids=lambda s: s.__name__)
+def test_fast_matches_pydantic(schema, monkeypatch):
+    rows = rows_for(schema)
+    assert rows
+    for model, result in [(List[schema], rows)] + [
+        (schema, row) for row in rows
+    ]:
+        # Иначе Pydantic сравнивался бы сам с собой
+        assert _fast_serializer(model) is not None
+        assert serialize(model, result, True, monkeypatch) == serialize(
+            model, result, False, monkeypatch
+        )
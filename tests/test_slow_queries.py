@@ -0,0 +1,102 @@
+"""
+Журнал медленных запросов: EXPLAIN не на пути запроса, отчёт - только
+с ADMIN_API_KEY.
+
+База нужна только для EXPLAIN запроса asyncpg; в остальных тестах
+EXPLAIN подменён, отчёт запрашивается без запуска приложения (lifespan не
+выполняется).
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+from typing import Optional
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import slow_queries
+from app.config import settings
+from app.database import async_explain_engine
+from app.slow_queries import SlowQueryLog
+
+STATEMENT = "SELECT * FROM buildings WHERE id = %(id)s"
+
+
+def wait_plan(log: SlowQueryLog) -> Optional[str]:
+    deadline = time.monotonic() + 10
+    while log.top()[0]["plan"] is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return log.top()[0]["plan"]
+
+
+def test_explain_runs_in_background(monkeypatch):
+    release = threading.Event()
+
+    def explain_analyze(engine, statement, parameters):
+        assert engine == "engine"
+        release.wait(5)
+        return "Index Scan"
+
+    monkeypatch.setattr(slow_queries, "explain_analyze", explain_analyze)
+    monkeypatch.setattr(settings, "SLOW_QUERY_EXPLAIN_INTERVAL", 60.0)
+    log = SlowQueryLog(threshold_ms=0, max_statements=10)
+    # Контекст выполнения SQLAlchemy без stream_results
+    context = SimpleNamespace(execution_options={})
+    started = time.monotonic()
+    log.record(
+        STATEMENT, {"id": 1}, context, False, 0.5, "sync", lambda: "engine"
+    )
+    # Запрос не ждёт EXPLAIN
+    assert time.monotonic() - started < 1
+    assert log.top()[0]["plan"] is None
+    release.set()
+    assert wait_plan(log) == "Index Scan"
+
+
+def test_explain_asyncpg_statement(database, monkeypatch):
+    # Так запрос видит after_cursor_execute движка asyncpg
+    statement = "SELECT count(*) FROM pg_class WHERE relpages > $1::INTEGER"
+    monkeypatch.setattr(settings, "SLOW_QUERY_EXPLAIN_INTERVAL", 60.0)
+    log = SlowQueryLog(threshold_ms=0, max_statements=10)
+    log.record(
+        statement,
+        (0,),
+        SimpleNamespace(execution_options={}),
+        False,
+        0.5,
+        "async",
+        lambda: async_explain_engine(False),
+    )
+    plan = wait_plan(log)
+    assert plan and not plan.startswith("EXPLAIN failed"), plan
+    assert "pg_class" in plan and "actual time" in plan
+
+
+@pytest.fixture
+def client():
+    from app.main import app
+
+    return TestClient(app)
+
+
+def slow_queries_status(client, api_key: str) -> int:
+    return client.get(
+        "/internal/slow-queries", headers={"X-API-Key": api_key}
+    ).status_code
+
+
+def test_report_requires_admin_key(monkeypatch, client):
+    monkeypatch.setattr(settings, "ADMIN_API_KEY", "admin-key")
+    assert slow_queries_status(client, settings.API_KEY) == 403
+
+
+def test_report_closed_without_admin_key(monkeypatch, client):
+    monkeypatch.setattr(settings, "ADMIN_API_KEY", None)
+    assert slow_queries_status(client, settings.API_KEY) == 403
+
+
+def test_report_with_admin_key(monkeypatch, client):
+    # Ключ уже известен limiter: API_KEY из conftest
+    monkeypatch.setattr(settings, "ADMIN_API_KEY", settings.API_KEY)
+    assert slow_queries_status(client, settings.API_KEY) == 200
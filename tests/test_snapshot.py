@@ -0,0 +1,373 @@
+"""
+Снимок справочника: ответы совпадают с app.crud.
+
+Без базы снимок пишется через write_rows из строк в tmp_path и сверяется
+с полным перебором по правилам запросов crud (порядок, фильтры,
+похожесть pg_trgm). С базой (фикстура dataset) тот же поиск сравнивается
+с самим crud на снимке, выгруженном из базы.
+"""
+
+import random
+import threading
+
+import numpy as np
+import pytest
+
+from app import crud, schemas
+from app.config import settings
+from app.database import SessionLocal
+from app.snapshot import (
+    SIMILARITY_THRESHOLD,
+    Snapshot,
+    trigrams,
+    write,
+    write_rows,
+)
+from app.spatial_index import building_index, haversine_km
+
+ACTIVITIES = [
+    (1, "Еда", None),
+    (2, "Мясная продукция", 1),
+    (3, "Молочная продукция", 1),
+    (4, "Сыры", 3),
+    (5, "Автомобили", None),
+    (6, "Грузовые", 5),
+]
+WORDS = ["Молоко", "Мясо", "Сыроварня", "Автосервис", "Рога и копыта"]
+CENTER = (55.75, 37.61)
+
+
+def make_rows(seed: int = 0):
+    rng = random.Random(seed)
+    buildings = [
+        (
+            i,
+            f"Москва, здание {i}",
+            CENTER[0] + rng.uniform(-0.05, 0.05),
+            CENTER[1] + rng.uniform(-0.08, 0.08),
+        )
+        for i in range(1, 61)
+    ]
+    # У 180-го меридиана и без координат
+    buildings += [
+        (61, "Чукотка, 1", 65.0, 179.99),
+        (62, "Чукотка, 2", 65.01, -179.99),
+        (63, "Без координат", None, None),
+    ]
+    organizations = []
+    links = []
+    for i in range(1, 151):
+        building_id = buildings[rng.randrange(len(buildings))][0]
+        phone = None if i % 7 == 0 else f"8-800-{i:03d}"
+        organizations.append(
+            (i, f"{WORDS[i % len(WORDS)]} {i}", phone, building_id)
+        )
+        for activity_id in rng.sample(range(1, 7), rng.randint(0, 2)):
+            links.append((i, activity_id))
+    return ACTIVITIES, buildings, organizations, links
+
+
+ROWS = make_rows()
+
+
+@pytest.fixture(scope="module")
+def snapshot(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("snapshot") / "directory.snapshot")
+    write_rows(path, *ROWS, cell_size=0.05)
+    return Snapshot(path)
+
+
+def similarity(a: str, b: str) -> float:
+    """similarity() из pg_trgm"""
+    x, y = trigrams(a), trigrams(b)
+    return len(x & y) / len(x | y) if x | y else 0.0
+
+
+def descendants(activity_id: int, depth: int = 3):
+    result, level = {activity_id}, [activity_id]
+    for _ in range(depth):
+        level = [i for i, _, parent in ACTIVITIES if parent in level]
+        result.update(level)
+    return result
+
+
+def reference_search(search: schemas.OrganizationSearch):
+    """
+    Поиск перебором по правилам crud.organization_search_statement:
+    (id, rank) по расстоянию в метрах, иначе по убыванию похожести
+    названия, иначе по id
+    """
+    activities, buildings, organizations, links = ROWS
+    location = {row[0]: row[2:] for row in buildings}
+    activity_ids = None
+    if search.activity_name:
+        activity_id = next(
+            i
+            for i, name, _ in activities
+            if search.activity_name.casefold() in name.casefold()
+        )
+        activity_ids = descendants(activity_id, search.activity_depth)
+    rows = []
+    for organization_id, name, _, building_id in organizations:
+        rank, descending = organization_id, False
+        if (
+            search.building_id is not None
+            and building_id != search.building_id
+        ):
+            continue
+        if activity_ids is not None and not any(
+            o == organization_id and a in activity_ids for o, a in links
+        ):
+            continue
+        if search.has_point:
+            lat, lon = location[building_id]
+            if lat is None:
+                continue
+            distance = float(
+                haversine_km(
+                    search.latitude,
+                    search.longitude,
+                    np.array([lat]),
+                    np.array([lon]),
+                )[0]
+            )
+            if distance > search.radius:
+                continue
+            rank = distance * 1000
+        if search.name:
+            score = similarity(name, search.name)
+            if (
+                search.name.lower() not in name.lower()
+                and score < SIMILARITY_THRESHOLD
+            ):
+                continue
+            if not search.has_point:
+                rank, descending = score, True
+        rows.append((organization_id, rank, descending))
+    rows.sort(key=lambda row: (-row[1] if row[2] else row[1], row[0]))
+    return [(i, rank) for i, rank, _ in rows][: search.limit]
+
+
+def found(results):
+    return [(organization.id, rank) for organization, rank in results]
+
+
+def assert_same(results, expected):
+    assert [i for i, _ in results] == [i for i, _ in expected]
+    assert [r for _, r in results] == pytest.approx([r for _, r in expected])
+
+
+def test_trigrams_follow_pg_trgm():
+    # show_trgm('word') и similarity('word', 'two words') из документации
+    assert trigrams("word") == {"  w", " wo", "wor", "ord", "rd "}
+    assert similarity("word", "two words") == pytest.approx(0.363636, 1e-5)
+
+
+SEARCHES = [
+    dict(name="Молоко"),
+    dict(name="молако"),
+    dict(name="Сыр"),
+    dict(latitude=CENTER[0], longitude=CENTER[1], radius=3),
+    dict(latitude=65.0, longitude=179.99, radius=5),
+    dict(building_id=5),
+    dict(activity_name="Еда"),
+    dict(activity_name="Еда", activity_depth=1),
+    dict(activity_name="молочная", name="Мясо"),
+    dict(
+        activity_name="Еда", latitude=CENTER[0], longitude=CENTER[1], radius=4
+    ),
+    dict(name="Автосервис", latitude=CENTER[0], longitude=CENTER[1], radius=6),
+]
+
+
+@pytest.mark.parametrize("params", SEARCHES)
+def test_search(snapshot, params):
+    search = schemas.OrganizationSearch(**params)
+    assert_same(
+        found(snapshot.search_organizations(search)), reference_search(search)
+    )
+
+
+@pytest.mark.parametrize("params", SEARCHES)
+def test_search_pages(snapshot, params):
+    """Страницы по курсору (rank, id) склеиваются в полный ответ"""
+    full = found(
+        snapshot.search_organizations(schemas.OrganizationSearch(**params))
+    )
+    pages, after = [], None
+    while True:
+        page = found(
+            snapshot.search_organizations(
+                schemas.OrganizationSearch(**params, limit=7), after
+            )
+        )
+        pages += page
+        if len(page) < 7:
+            break
+        after = (page[-1][1], page[-1][0])
+    assert pages == full
+
+
+@pytest.mark.parametrize(
+    "bounds",
+    [
+        (55.7, 55.8, 37.55, 37.65),
+        # Через 180-й меридиан
+        (64.9, 65.1, 179.0, -179.0),
+        (0, 1, 0, 1),
+    ],
+)
+def test_buildings_in_bounds(snapshot, bounds):
+    min_lat, max_lat, min_lon, max_lon = bounds
+
+    def inside(lat, lon):
+        if lat is None or not min_lat <= lat <= max_lat:
+            return False
+        if min_lon > max_lon:
+            return lon >= min_lon or lon <= max_lon
+        return min_lon <= lon <= max_lon
+
+    expected = [row[0] for row in ROWS[1] if inside(row[2], row[3])]
+    assert [b.id for b in snapshot.get_buildings_in_bounds(*bounds)] == (
+        expected
+    )
+    limited = snapshot.get_buildings_in_bounds(*bounds, limit=3)
+    assert [b.id for b in limited] == expected[:3]
+
+
+def distances_from(lat: float, lon: float):
+    located = [row for row in ROWS[1] if row[2] is not None]
+    distances = haversine_km(
+        lat,
+        lon,
+        np.array([row[2] for row in located]),
+        np.array([row[3] for row in located]),
+    )
+    return sorted(zip(distances.tolist(), (row[0] for row in located)))
+
+
+def test_buildings_in_radius(snapshot):
+    expected = [i for d, i in distances_from(*CENTER) if d <= 3][:10]
+    buildings = snapshot.get_buildings_in_radius(*CENTER, 3, limit=10)
+    assert [b.id for b in buildings] == expected
+
+
+def test_nearest_buildings(snapshot):
+    expected = distances_from(65.0, 179.99)[:3]
+    nearest = snapshot.get_nearest_buildings(65.0, 179.99, limit=3)
+    assert [b.id for b, _ in nearest] == [i for _, i in expected]
+    assert [d for _, d in nearest] == pytest.approx([d for d, _ in expected])
+
+
+def test_relations(snapshot):
+    _, buildings, organizations, links = ROWS
+    for organization_id, name, phone, building_id in organizations[:20]:
+        organization = snapshot.get_organization(organization_id)
+        assert (organization.name, organization.phone_numbers) == (name, phone)
+        assert organization.building.id == building_id
+        assert sorted(a.id for a in organization.activities) == sorted(
+            a for o, a in links if o == organization_id
+        )
+    building = snapshot.get_building(63)
+    assert building.latitude is None and building.longitude is None
+    assert [o.id for o in building.organizations] == [
+        row[0] for row in organizations if row[3] == 63
+    ]
+    assert snapshot.get_organization(10**6) is None
+
+
+def test_export(snapshot, monkeypatch):
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 5)
+
+    def exported(batches):
+        batches = list(batches)
+        assert all(len(batch) <= 5 for batch in batches)
+        return [row.id for batch in batches for row in batch]
+
+    search = schemas.OrganizationSearch(name="Мясо", limit=None)
+    assert exported(snapshot.export_organizations(search)) == [
+        i for i, _ in reference_search(search)
+    ]
+    bounds = (55.7, 55.8, 37.55, 37.65)
+    assert exported(snapshot.export_buildings(bounds)) == [
+        b.id for b in snapshot.get_buildings_in_bounds(*bounds)
+    ]
+    assert exported(snapshot.export_buildings()) == [row[0] for row in ROWS[1]]
+    assert exported(snapshot.export_activities("молочная")) == [3, 4]
+
+
+def versions(path) -> list:
+    return sorted(p.name for p in path.parent.glob(f"{path.name}.v*"))
+
+
+def test_swap_keeps_current_and_previous(tmp_path):
+    path = tmp_path / "directory.snapshot"
+    write_rows(str(path), *ROWS, cell_size=0.05)
+    first = Snapshot(str(path))
+    for _ in range(3):
+        write_rows(str(path), *ROWS, cell_size=0.05)
+    assert path.is_symlink()
+    assert len(versions(path)) == 2
+    # Каталог первой версии удалён, но отображённые файлы читаются
+    assert first.get_organization(1).name == ROWS[2][0][1]
+
+
+def test_swap_migrates_plain_directory(tmp_path):
+    path = tmp_path / "directory.snapshot"
+    path.mkdir()
+    write_rows(str(path), *ROWS, cell_size=0.05)
+    assert path.is_symlink()
+    assert f"{path.name}.v0" in versions(path)
+
+
+def test_snapshot_path_never_missing(tmp_path):
+    path = tmp_path / "directory.snapshot"
+    write_rows(str(path), *ROWS, cell_size=0.05)
+    done = threading.Event()
+
+    def rewrite():
+        for _ in range(5):
+            write_rows(str(path), *ROWS, cell_size=0.05)
+        done.set()
+
+    writer = threading.Thread(target=rewrite)
+    writer.start()
+    loaded = 0
+    while not done.is_set():
+        # Воркер, запущенный во время выгрузки, открывает целую версию
+        assert Snapshot(str(path)).meta["organizations"] == len(ROWS[2])
+        loaded += 1
+    writer.join()
+    assert loaded
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        dict(latitude=55.75, longitude=37.61, radius=2),
+        dict(name="организация 1"),
+        dict(activity_name="вид 1"),
+        dict(building_id=1),
+    ],
+)
+def test_matches_crud(dataset, monkeypatch, tmp_path, params):
+    # Запросы crud к базе, а не к пространственному индексу в памяти
+    monkeypatch.setattr(building_index, "ready", False)
+    path = str(tmp_path / "directory.snapshot")
+    with SessionLocal() as db:
+        write(db, path, cell_size=0.01)
+        snapshot = Snapshot(path)
+        if "building_id" in params:
+            params = {"building_id": dataset["buildings"][0]}
+        search = schemas.OrganizationSearch(**params)
+        assert_same(
+            found(snapshot.search_organizations(search)),
+            found(crud.search_organizations(db, search)),
+        )
+        bounds = (55.73, 55.77, 37.58, 37.64)
+        assert [b.id for b in snapshot.get_buildings_in_bounds(*bounds)] == [
+            b.id for b in crud.get_buildings_in_bounds(db, *bounds)
+        ]
+        assert [
+            b.id for b, _ in snapshot.get_nearest_buildings(55.75, 37.61)
+        ] == [b.id for b, _ in crud.get_nearest_buildings(db, 55.75, 37.61)]
@@ -0,0 +1,178 @@
+"""
+Индекс зданий в памяти против полного перебора.
+
+База не нужна: индекс собирается из строк через build() и add(), ответы
+сверяются с расстоянием по формуле гаверсинусов для каждого здания.
+"""
+
+import contextlib
+import math
+import random
+import threading
+import time
+
+import pytest
+
+from app import spatial_index
+from app.config import settings
+from app.spatial_index import EARTH_RADIUS_KM, SpatialIndex
+
+# Точки запросов: обычная, у 180-го меридиана и у полюса
+POINTS = [(55.75, 37.61), (65.0, 179.95), (-65.0, -179.95), (89.9, 10.0)]
+
+
+def distance_km(lat1, lon1, lat2, lon2) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1)
+        * math.cos(phi2)
+        * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def make_rows(seed: int = 0, per_point: int = 300):
+    """Здания вокруг каждой точки POINTS, долготы приведены к [-180, 180]"""
+    rng = random.Random(seed)
+    rows = []
+    for lat, lon in POINTS:
+        for _ in range(per_point):
+            building_lat = max(-90.0, min(90.0, lat + rng.uniform(-0.5, 0.5)))
+            building_lon = (lon + rng.uniform(-1, 1) + 180) % 360 - 180
+            building_id = len(rows) + 1
+            rows.append(
+                (
+                    building_id,
+                    f"здание {building_id}",
+                    building_lat,
+                    building_lon,
+                )
+            )
+    return rows
+
+
+ROWS = make_rows()
+
+
+def brute_radius(rows, lat, lon, radius):
+    hits = [(row[0], distance_km(lat, lon, row[2], row[3])) for row in rows]
+    return sorted(
+        ((i, d) for i, d in hits if d <= radius), key=lambda hit: hit[1]
+    )
+
+
+def brute_bounds(rows, min_lat, max_lat, min_lon, max_lon):
+    def in_lon(lon):
+        if min_lon > max_lon:
+            return lon >= min_lon or lon <= max_lon
+        return min_lon <= lon <= max_lon
+
+    return sorted(
+        row[0]
+        for row in rows
+        if min_lat <= row[2] <= max_lat and in_lon(row[3])
+    )
+
+
+def built(rows=ROWS, cell_size: float = 0.05) -> SpatialIndex:
+    index = SpatialIndex(cell_size=cell_size)
+    index.build(rows)
+    return index
+
+
+def by_distance(hits):
+    # Здания на одном расстоянии (например, на полюсе) идут в любом порядке
+    return sorted(hits, key=lambda hit: (round(hit[1], 9), hit[0]))
+
+
+def assert_same_hits(hits, expected):
+    hits, expected = by_distance(hits), by_distance(expected)
+    assert [i for i, _ in hits] == [i for i, _ in expected]
+    assert [d for _, d in hits] == pytest.approx([d for _, d in expected])
+
+
+@pytest.mark.parametrize("lat, lon", POINTS)
+@pytest.mark.parametrize("radius", [1, 10, 40])
+def test_in_radius(lat, lon, radius):
+    assert_same_hits(
+        built().in_radius(lat, lon, radius),
+        brute_radius(ROWS, lat, lon, radius),
+    )
+
+
+@pytest.mark.parametrize("lat, lon", POINTS)
+def test_in_radius_limit(lat, lon):
+    expected = brute_radius(ROWS, lat, lon, 40)[:7]
+    assert_same_hits(built().in_radius(lat, lon, 40, limit=7), expected)
+
+
+@pytest.mark.parametrize("lat, lon", POINTS + [(0.0, 0.0)])
+def test_nearest(lat, lon):
+    # (0, 0) далеко от всех зданий: радиус поиска растёт много раз
+    nearest = built().nearest(lat, lon, limit=5)
+    expected = brute_radius(ROWS, lat, lon, math.inf)[:5]
+    assert_same_hits([(building.id, d) for building, d in nearest], expected)
+    assert nearest[0][0].address == f"здание {expected[0][0]}"
+
+
+@pytest.mark.parametrize(
+    "bounds",
+    [
+        (55.5, 56.0, 37.0, 38.0),
+        # Через 180-й меридиан
+        (64.8, 65.2, 179.5, -179.5),
+        (-65.3, -64.7, 179.0, -179.0),
+        (89.5, 90.0, -180.0, 180.0),
+    ],
+)
+def test_in_bounds(bounds):
+    assert sorted(built().in_bounds(*bounds)) == brute_bounds(ROWS, *bounds)
+
+
+def test_pending_buffer_and_merge(monkeypatch):
+    monkeypatch.setattr(spatial_index, "MERGE_THRESHOLD", 100)
+    index = built(ROWS[:450])
+    # 750 зданий через add(): семь слияний и остаток в буфере
+    for row in ROWS[450:]:
+        index.add(*row)
+    assert index._pending
+    reference = built()
+    for lat, lon in POINTS:
+        assert_same_hits(
+            index.in_radius(lat, lon, 40), reference.in_radius(lat, lon, 40)
+        )
+        bounds = (lat - 0.3, lat + 0.3, lon - 0.5, lon + 0.5)
+        assert sorted(index.in_bounds(*bounds)) == sorted(
+            reference.in_bounds(*bounds)
+        )
+    # add() не двигает отметку догрузки из базы
+    assert index.synced_id == 450
+
+
+def test_add_skips_known_building():
+    index = built(ROWS[:10])
+    index.add(1, "другой адрес", 0.0, 0.0)
+    assert not index._pending
+    assert len(index) == 10
+
+
+def test_periodic_reload_picks_up_changes(monkeypatch):
+    monkeypatch.setattr(settings, "SPATIAL_INDEX_REFRESH_INTERVAL", 0)
+    monkeypatch.setattr(settings, "SPATIAL_INDEX_RELOAD_INTERVAL", 0.01)
+    monkeypatch.setattr(spatial_index, "SessionLocal", contextlib.nullcontext)
+    index = built(ROWS[:10])
+    # Здание 1 перенесено: догрузка по id этого не видит, только полная
+    # перезагрузка
+    moved = [(1, "здание 1", 10.0, 10.0)] + ROWS[1:10]
+    reloaded = threading.Event()
+
+    def load(db):
+        index.build(moved)
+        reloaded.set()
+
+    monkeypatch.setattr(index, "load", load)
+    time.sleep(0.02)
+    index.maybe_sync(None)
+    assert reloaded.wait(5)
+    assert index.in_radius(10.0, 10.0, 1) == [(1, 0.0)]
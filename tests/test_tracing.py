@@ -0,0 +1,43 @@
+"""
+Итоговая строка лога запроса.
+
+База не нужна: TracingMiddleware оборачивает отдельное приложение.
+"""
+
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.tracing import TracingMiddleware
+
+
+@pytest.fixture
+def request_log(caplog, monkeypatch):
+    # Как после configure_logging: записи app не доходят до корневого
+    # логгера, поэтому обработчик caplog подключается к app.request
+    request_logger = logging.getLogger("app.request")
+    monkeypatch.setattr(request_logger, "propagate", False)
+    caplog.set_level(logging.INFO, logger="app.request")
+    request_logger.addHandler(caplog.handler)
+    yield caplog
+    request_logger.removeHandler(caplog.handler)
+
+
+def test_unhandled_error_logged_once(request_log):
+    app = FastAPI()
+    app.add_middleware(TracingMiddleware)
+
+    @app.get("/fail")
+    def fail():
+        raise RuntimeError("boom")
+
+    client = TestClient(app, raise_server_exceptions=False)
+    assert client.get("/fail").status_code == 500
+    assert len(request_log.records) == 1
+    record = request_log.records[0]
+    assert record.levelname == "ERROR"
+    assert record.exc_info[0] is RuntimeError
+    assert record.fields["status"] == 500
+    assert record.fields["path"] == "/fail"